@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark for the note storage behind Cloud Notes.
+Generates synthetic note folders of different sizes and times the NoteStore operations the app runs on every
+user action: listing, opening, saving, navigating, renaming and deleting notes. No display is needed.
+
+Latency percentiles are printed as JSON, so results of two runs can be compared to catch regressions:
+    python3 benchmark.py --sizes 1000,10000 --output bench_output.txt
+With --storage sqlite the generated folder is imported into a SQLite database and that is benchmarked instead.
+
+The 100000 note folder takes roughly 200 MB of disk space while the benchmark runs.
+"""
+import os
+import sys
+import json
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+from time import perf_counter
+
+from notes_core import NoteStore, FolderBackend, SQLiteBackend, MAX_FILE_SIZE, discard_note, copy_notes
+
+DEFAULT_SIZES = "1000,10000,100000"
+DEFAULT_SAMPLES = 200
+LIST_SAMPLES = 10                # Cold listings are slow on big folders, so fewer of them are timed
+WORDS = ("note", "cloud", "backup", "todo", "meeting", "idea", "list", "python", "folder", "draft", "remember",
+         "call", "buy", "fix", "review", "plan", "tomorrow", "weekly", "project", "read")
+
+
+def make_text(rnd, size):
+    """
+    :param rnd: random.Random instance
+    :param size: Approximate length in characters
+    :return: Text of words and line breaks
+    """
+    block = " ".join(rnd.choice(WORDS) for _ in range(200))
+    block = "\n".join(block[i:i + 80] for i in range(0, len(block), 80)) + "\n"
+    return (block * (size // len(block) + 1))[:size]
+
+
+def note_size(rnd, index, count):
+    """
+    Mixed sizes: mostly short notes, some longer ones and a few large enough for large note mode
+    :param rnd: random.Random instance
+    :param index: Number of the note being generated
+    :param count: Number of notes in the folder
+    :return: Size of the note in characters
+    """
+    large_every = max(count // 5, 1)
+    if index % large_every == large_every - 1:
+        return MAX_FILE_SIZE + rnd.randint(0, MAX_FILE_SIZE)
+    if rnd.random() < 0.05:
+        return rnd.randint(8 * 1024, 32 * 1024)
+    return rnd.randint(100, 2 * 1024)
+
+
+def generate_folder(path, count, rnd):
+    """
+    Fills a folder with synthetic notes
+    :param path: Folder to create
+    :param count: Number of notes
+    :param rnd: random.Random instance
+    :return: Sorted list of note names
+    """
+    os.makedirs(path)
+    names = []
+    for index in range(count):
+        name = f"Note_{index:06d}_{rnd.choice(WORDS)}"
+        with open(os.path.join(path, name), 'w') as note:
+            note.write(make_text(rnd, note_size(rnd, index, count)))
+        names.append(name)
+    return sorted(names)
+
+
+def percentiles(samples):
+    """
+    :param samples: Durations in seconds
+    :return: Dictionary of count, mean, p50, p90, p99 and max in milliseconds
+    """
+    ordered = sorted(samples)
+    count = len(ordered)
+    if count == 0:
+        return {"count": 0}
+
+    def rank(percent):
+        return ordered[min(count - 1, max(0, int(round(percent / 100 * count)) - 1))] * 1000
+
+    return {
+        "count": count,
+        "mean": round(sum(ordered) / count * 1000, 4),
+        "p50": round(rank(50), 4),
+        "p90": round(rank(90), 4),
+        "p99": round(rank(99), 4),
+        "max": round(ordered[-1] * 1000, 4)
+    }
+
+
+def timed(function, *args):
+    """
+    :return: Tuple of (seconds the call took, its return value)
+    """
+    start = perf_counter()
+    result = function(*args)
+    return perf_counter() - start, result
+
+
+def bench_storage(make_backend, names, samples, rnd):
+    """
+    Times every store operation on one notes storage
+    :param make_backend: Function returning a new backend for the storage
+    :param names: Note names in the storage
+    :param samples: Number of timed calls per operation
+    :param rnd: random.Random instance
+    :return: Dictionary of operation name -> percentiles()
+    """
+    timings = {}
+
+    cold = []
+    for _ in range(min(samples, LIST_SAMPLES)):
+        store = NoteStore(make_backend(), use_trash=False)
+        cold.append(timed(store.list_notes)[0])
+        store.close()
+    timings["list_cold"] = cold
+
+    store = NoteStore(make_backend(), use_trash=False)
+    store.list_notes()
+    timings["list_warm"] = [timed(store.list_notes)[0] for _ in range(samples)]
+
+    picks = [rnd.choice(names) for _ in range(samples)]
+    timings["open_cold"] = []
+    for name in picks:
+        store.cache.clear()
+        duration, result = timed(store.open, name)
+        discard_note(result)
+        timings["open_cold"].append(duration)
+
+    timings["open_cached"] = []
+    for name in picks:
+        discard_note(store.open(name))
+        duration, result = timed(store.open, name)
+        discard_note(result)
+        timings["open_cached"].append(duration)
+
+    timings["navigate"] = []
+    name = rnd.choice(names)
+    for _ in range(samples):
+        start = perf_counter()
+        name = store.neighbour(name, 1)
+        discard_note(store.open(name))
+        timings["navigate"].append(perf_counter() - start)
+        if name == store.index.names[-1]:
+            name = store.index.names[0]
+
+    small = [name for name in names if store.index.entries[name][0] < MAX_FILE_SIZE]
+    timings["save"] = []
+    for name in rnd.sample(small, min(samples, len(small))):
+        text = make_text(rnd, store.index.entries[name][0]) + "edited\n"
+        timings["save"].append(timed(store.save, name, text)[0])
+
+    timings["rename"] = []
+    for name in rnd.sample(small, min(samples, len(small))):
+        timings["rename"].append(timed(store.rename, name, f"{name}_renamed")[0])
+
+    timings["delete"] = []
+    for name in rnd.sample(store.index.names, min(samples, len(store.index.names))):
+        timings["delete"].append(timed(store.delete, name)[0])
+
+    store.close()
+    return {operation: percentiles(durations) for operation, durations in timings.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Cloud Notes storage on synthetic note folders.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help=f"comma separated note counts of the generated folders (default {DEFAULT_SIZES})")
+    parser.add_argument("--samples", type=int, default=DEFAULT_SAMPLES,
+                        help=f"timed calls per operation (default {DEFAULT_SAMPLES})")
+    parser.add_argument("--storage", choices=("folder", "sqlite"), default="folder",
+                        help="notes storage to benchmark (default folder)")
+    parser.add_argument("--seed", type=int, default=1, help="random seed, for reproducible folders")
+    parser.add_argument("--dir", default=None, help="where to generate the folders (default: a temporary folder)")
+    parser.add_argument("--output", default=None, help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    work_dir = tempfile.mkdtemp(prefix="cloud_notes_bench_", dir=args.dir)
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "storage": args.storage,
+        "samples": args.samples,
+        "seed": args.seed,
+        "folders": {}
+    }
+
+    try:
+        for count in sizes:
+            rnd = random.Random(args.seed)
+            notes_dir = os.path.join(work_dir, f"notes_{count}")
+            print(f"INFO: Generating {count} notes in {notes_dir}", file=sys.stderr)
+            generate_seconds, names = timed(generate_folder, notes_dir, count, rnd)
+
+            import_seconds = None
+            if args.storage == "sqlite":
+                notes_db = os.path.join(work_dir, f"notes_{count}.db")
+                database = SQLiteBackend(notes_db)
+                import_seconds, _ = timed(copy_notes, FolderBackend(notes_dir), database)
+                database.close()
+                shutil.rmtree(notes_dir)
+
+                def make_backend():
+                    return SQLiteBackend(notes_db)
+            else:
+                def make_backend():
+                    return FolderBackend(notes_dir)
+
+            print(f"INFO: Benchmarking {count} notes", file=sys.stderr)
+            result = bench_storage(make_backend, names, args.samples, rnd)
+            result["generate_seconds"] = round(generate_seconds, 3)
+            if import_seconds is not None:
+                result["import_seconds"] = round(import_seconds, 3)
+            report["folders"][str(count)] = result
+            shutil.rmtree(notes_dir, ignore_errors=True)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if args.output is None:
+        print(output)
+    else:
+        with open(args.output, 'w') as report_file:
+            report_file.write(output + "\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -10,38 +10,74 @@ You will need Python3 with TkInter installed.
 Just run the script. The default notes folder is `$HOME/.cloud_notes/notes`.
 To change it just click on "Select Notes Folder" button.
 """
+from time import perf_counter
+STARTUP_TIME = perf_counter()    # Taken before the other imports so --profile-startup can report their cost
+
 from tkinter import Tk, Button, Frame, LEFT, RIGHT, X, Y, TOP, BOTH, BOTTOM, Text, filedialog, YES, \
-    Scrollbar, Listbox, END, PhotoImage, simpledialog, messagebox, Label, StringVar, Toplevel
+    Scrollbar, Listbox, END, PhotoImage, simpledialog, messagebox, Label, StringVar, Toplevel, Entry, DISABLED, NORMAL, \
+    Checkbutton, BooleanVar, TclError, Menu, EXTENDED
+from tkinter.font import Font
 
 import os
+import sys
+import re
 import json
-from time import time, sleep
-import tempfile
-from signal import SIGINT
-
-# Check requirements
-if 'posix' in os.name:
-    interpreter = "python3"
-else:
-    interpreter = "python"
-
+import argparse
+import bisect
+import queue
+import select
+import socket
+import tarfile
+import difflib
+import sqlite3
+import threading
 try:
-    from send2trash import send2trash
-except ModuleNotFoundError as e:
-    print(f"ERROR: {e}. Trying to install...")
-    os.system(f"{interpreter} -m pip install send2trash")
-    from send2trash import send2trash
+    import fcntl
+except ImportError:
+    # Not available on Windows, where the app does not check for a running instance
+    fcntl = None
+from itertools import accumulate
+from time import time, strftime, localtime
+
+from notes_core import MAX_FILE_SIZE, STORAGE_FOLDER, STORAGE_SQLITE, SORT_NAME, SORT_MODIFIED, SORT_SIZE, \
+    SORT_CREATED, cfg_dir, cfg_path, search_index_path, history_path, journal_path, default_backup_dir, \
+    default_notes_dir, default_notes_db, default_trace_path, instance_socket_path, atomic_write, is_valid_note_name, \
+    tracer, NameIndex, IOExecutor, NoteWatcher, LargeNote, SearchIndex, discard_note, FolderBackend, \
+    make_backend, copy_notes, NoteBackup, NoteHistory, EditJournal, NoteStore
 
 # Default variables
 COLOR_BACKGROUND = "#ffebb8"
 COLOR_TEXT = "#21130d"
+COLOR_DIFF_ADDED = "#2e7d32"
+COLOR_DIFF_REMOVED = "#c62828"
+COLOR_DIFF_HUNK = "#8d6e63"
+COLOR_LINK = "#1565c0"
+COLOR_DONE = "#8d6e63"
+COLOR_FIND_MATCH = "#ffcc80"
+COLOR_FIND_CURRENT = "#ff9800"
 APP_TITLE = "Cloud Notes"
-MAX_FILE_SIZE = 1024*1024        # If the file is bigger than 1Mb, it will not be opened to prevent app from freezing
-cfg_name = "settings.cfg"
-user_dir = os.path.expanduser("~")
-cfg_dir = os.path.join(user_dir, ".cloud_notes")
-cfg_path = os.path.join(cfg_dir, cfg_name)
-default_notes_dir = os.path.join(cfg_dir, "notes")
+LARGE_NOTE_WINDOW = 3            # Maximum number of large note chunks loaded into the editor at once
+WATCH_DISPATCH_INTERVAL = 300    # Milliseconds between delivering batched folder changes to the UI
+INSTANCE_POLL_INTERVAL = 100     # Milliseconds between checks for requests from later launches of the app
+INSTANCE_TIMEOUT = 2             # Seconds a later launch waits for the running instance to take its request
+MAX_NOTE_WINDOWS = 10            # Notes opened in windows of their own at once without asking
+AUTOSAVE_DELAY = 1000            # Milliseconds of typing pause after which the open note is saved
+AUTOSAVE_MAX_DELAY = 10000       # Milliseconds of continuous typing after which the open note is saved anyway
+VIRTUAL_LIST_THRESHOLD = 2000    # Note lists longer than this only create Listbox rows for the visible notes
+PREFETCH_COUNT = 3               # Notes before and after the open one that are read ahead into the cache
+SESSION_TEXT_LIMIT = 256*1024    # The open note is kept in the session snapshot only if it is shorter than this
+SEARCH_DELAY = 150               # Milliseconds to wait after the last key press before filtering the note list
+INSERT_CHUNK = 64*1024           # Characters put into the editor per idle callback when pasting or loading long text
+FIND_DELAY = 150                 # Milliseconds to wait after the last key press before searching the open note
+FIND_STEP_TIME = 8               # Milliseconds of match highlighting per idle callback
+FIND_CHUNK_LINES = 500           # Lines of the open note searched at once
+FIND_TAG_BATCH = 500             # Matches highlighted with a single Tk call
+MARKUP_STEP_TIME = 5             # Milliseconds of markup highlighting per idle callback
+MARKUP_CHUNK_LINES = 200         # Lines of the open note highlighted at once
+JOURNAL_COMMIT_INTERVAL = 200    # Milliseconds of edits collected before the edit journal is flushed to disk at once
+TRACE_ENV = "CLOUD_NOTES_TRACE"  # Set to a file path, or to 1 for the default one, to trace hot paths like --trace
+TRACE_OVERLAY_ENV = "CLOUD_NOTES_TRACE_OVERLAY"  # Set to 1 to show the last traced latency like --trace-overlay
+TRACE_OVERLAY_INTERVAL = 500     # Milliseconds between updates of the latency overlay in the status bar
 
 # Base64 encoded button images
 IMG_ICON = (
@@ -174,6 +210,48 @@ IMG_BTN_HIDE = (
 )
 
 
+class StartupProfiler(object):
+    """
+    Records when each startup phase finished and prints the breakdown once startup is complete.
+    Does nothing unless enabled with --profile-startup.
+    """
+    def __init__(self, enabled=False, start=None):
+        """
+        :param enabled: Whether to record and print anything
+        :param start: perf_counter() value startup is measured from. Defaults to now.
+        """
+        self.enabled = enabled
+        self.start = perf_counter() if start is None else start
+        self.last = self.start
+        self.phases = []
+        self.reported = False
+
+    def mark(self, phase):
+        """
+        Records that a startup phase has just finished
+        :param phase: Phase name
+        """
+        if not self.enabled or self.reported:
+            return
+
+        now = perf_counter()
+        self.phases.append((phase, now - self.last, now - self.start))
+        self.last = now
+
+    def report(self):
+        """
+        Prints how long each recorded phase took and when it finished, in milliseconds. Only the first call prints.
+        """
+        if not self.enabled or self.reported:
+            return
+
+        self.reported = True
+        print("INFO: Startup profile (ms)")
+        print(f"    {'phase':<20}{'took':>10}{'total':>10}")
+        for phase, duration, elapsed in self.phases:
+            print(f"    {phase:<20}{duration * 1000:>10.1f}{elapsed * 1000:>10.1f}")
+
+
 class CreateToolTip(object):
     """
     create a tooltip for a given widget
@@ -221,324 +299,3189 @@ class AutoScrollbar(Scrollbar):
         Scrollbar.set(self, lo, hi)
 
 
-class MainWindow(Tk):
+class NoteTree(object):
     """
-    Main TK inter window definition
+    Shows notes in subfolders as a tree of folders that can be expanded and collapsed.
+    A row is either a note name or a folder key, the folder path with a trailing "/" like "project/". The rows of a
+    collapsed folder are never generated: the notes of a folder are a contiguous run of the sorted note names, so
+    they are skipped with a single bisect and only expanded folders cost time.
     """
-    def __init__(self):
-        Tk.__init__(self)
-
-        self.protocol("WM_DELETE_WINDOW", self.dismiss)
-        self.bind("<FocusOut>", self.on_focus_out)
+    INDENT = "    "
 
-        self.title(APP_TITLE)
-        self.minsize(300, 300)
-        self.configure(background=COLOR_BACKGROUND)
-        self.icon_image = PhotoImage(data=IMG_ICON)
-        self.iconphoto(False, self.icon_image)
-
-        self.x = 200
-        self.y = 200
-        self.width = 300
-        self.height = 300
-        self.offset_x = 6
-        self.offset_y = 29
-        self.notes = []
-        self.note_listbox = None
-        self.file_list_width = 177
+    def __init__(self):
+        self.expanded = set()
+        self.cached = None
 
-        self.notes_dir = default_notes_dir
-        self.note_file_name = None
+    def set_expanded(self, folders):
+        """
+        :param folders: Folder keys to show expanded, e.g. from the config file
+        """
+        self.expanded = set(folders)
+        self.cached = None
 
-        self.show_note_list_flag = True
-        self.note_text = ""
+    def rows(self, names, generation=None):
+        """
+        :param names: Sorted note names
+        :param generation: NoteIndex.generation of the names. Rows of the same generation are reused.
+        :return: Rows of the tree in display order
+        """
+        if generation is not None and self.cached is not None and self.cached[0] == generation:
+            return self.cached[1]
 
-        self.frame_note_editor = Frame(self, bg=COLOR_BACKGROUND)
-        self.frame_note_editor.pack(fill=BOTH, side=RIGHT, expand=YES)
+        rows = []
+        self._add_rows(names, "", 0, len(names), rows)
+        self.cached = (generation, rows)
+        return rows
 
-        self.frame_btn = Frame(self.frame_note_editor, bg=COLOR_BACKGROUND)
-        self.frame_btn.pack(fill=X, side=TOP)
+    def _add_rows(self, names, folder, first, last, rows):
+        """
+        Adds the rows of a folder
+        :param names: Sorted note names
+        :param folder: Folder key, "" for the notes folder
+        :param first: Position of the first note in the folder
+        :param last: Position after the last note in the folder
+        :param rows: List the rows are appended to
+        """
+        position = first
+        while position < last:
+            name = names[position]
+            slash = name.find("/", len(folder))
+            if slash < 0:
+                rows.append(name)
+                position += 1
+                continue
+
+            subfolder = name[:slash + 1]
+            end = bisect.bisect_left(names, subfolder + "\U0010ffff", position, last)
+            rows.append(subfolder)
+            if subfolder in self.expanded:
+                self._add_rows(names, subfolder, position, end, rows)
+            position = end
+
+    @staticmethod
+    def is_folder(row):
+        return row.endswith("/")
+
+    def toggle(self, folder):
+        """
+        :param folder: Folder key
+        """
+        if folder in self.expanded:
+            self.expanded.discard(folder)
+        else:
+            self.expanded.add(folder)
+        self.cached = None
 
-        self.scrollbar = AutoScrollbar(self)
-        if self.scrollbar.visible:
-            self.scrollbar.pack(side=LEFT, fill=Y)
+    def reveal(self, name):
+        """
+        Expands all folders a note is in
+        :param name: Note name
+        :return: True if a folder was expanded
+        """
+        changed = False
+        slash = name.find("/")
+        while slash >= 0:
+            folder = name[:slash + 1]
+            if folder not in self.expanded:
+                self.expanded.add(folder)
+                self.cached = None
+                changed = True
+            slash = name.find("/", slash + 1)
+        return changed
+
+    def label(self, row):
+        """
+        :param row: Note name or folder key
+        :return: Text shown in the note list: the last path part, indented by depth, with a marker for folders
+        """
+        if self.is_folder(row):
+            path = row[:-1]
+            marker = "\u25be " if row in self.expanded else "\u25b8 "
+        else:
+            path = row
+            marker = ""
+        depth = path.count("/")
+        return self.INDENT * depth + marker + path[path.rfind("/") + 1:]
 
-        self.note_listbox = Listbox(self, bg=COLOR_BACKGROUND, fg=COLOR_TEXT, bd=0)
-        self.note_listbox.pack(side=LEFT, fill=Y)
-        self.note_listbox.bind("<<ListboxSelect>>", self.file_selected)
-        self.note_listbox.bind("<Double-1>", self.edit_name)
 
-        self.note_listbox.config(yscrollcommand=self.scrollbar.set)
+class NoteList(object):
+    """
+    The list of notes next to the editor.
+    Keeps the Listbox in sync with a list of names by applying only the rows that differ, and maps names to rows so
+    selecting a note does not search the list. Above VIRTUAL_LIST_THRESHOLD names the Listbox only holds the rows
+    that fit on screen and the AutoScrollbar is driven by this class, so the widget cost no longer depends on the
+    number of notes. Rows show label(item) rather than the item itself, e.g. an indented tree label.
+    """
+    def __init__(self, master, scrollbar, **options):
+        self.scrollbar = scrollbar
+        self.listbox = Listbox(master, **options)
+        self.items = []
+        self.marked = set()
+        self.label = str
+        self.rows = {}
+        self.selected = None
+        self.virtual = False
+        self.offset = 0
+        self.row_height = 0
+
+        self.listbox.config(yscrollcommand=self.scrollbar.set)
+        self.scrollbar.config(command=self.listbox.yview)
+        self.listbox.bind("<Configure>", self.on_resize)
+        self.listbox.bind("<MouseWheel>", self.on_mouse_wheel)
+        self.listbox.bind("<Button-4>", self.on_mouse_wheel)
+        self.listbox.bind("<Button-5>", self.on_mouse_wheel)
+        self.listbox.bind("<Up>", lambda event: self.on_arrow_key(-1))
+        self.listbox.bind("<Down>", lambda event: self.on_arrow_key(1))
+
+    def row_of(self, name):
+        """
+        :param name: Note file name
+        :return: Row of the note in the full list or None if not listed
+        """
+        if self.rows is None:
+            self.rows = {item: row for row, item in enumerate(self.items)}
+        return self.rows.get(name)
 
-        self.scrollbar.config(command=self.note_listbox.yview)
+    def item_at(self, listbox_row):
+        """
+        :param listbox_row: Row of the Listbox widget, as returned by curselection()
+        :return: Item shown in that row
+        """
+        return self.items[self.offset + listbox_row] if self.virtual else self.items[listbox_row]
 
-        self.prev_btn_image = PhotoImage(data=IMG_BTN_PREV)
-        self.btn_prev = Button(self.frame_btn, bg=COLOR_BACKGROUND, fg=COLOR_TEXT, image=self.prev_btn_image,
-                               command=self.show_previous, width=26, height=26, pady=0, borderwidth=0)
-        self.btn_prev.pack(side=LEFT, padx=1)
+    @staticmethod
+    def _runs(rows):
+        """
+        Groups ascending row numbers into (first, last) ranges of consecutive rows
+        """
+        runs = []
+        for row in rows:
+            if runs and runs[-1][1] == row - 1:
+                runs[-1][1] = row
+            else:
+                runs.append([row, row])
+        return runs
 
-        CreateToolTip(self.btn_prev, "Previous")
+    def set_items(self, items, label=str):
+        """
+        Shows a new list of items, touching only the rows that were added or removed
+        :param items: Note names or other row keys in display order
+        :param label: Function returning the text shown for an item
+        """
+        if items == self.items and label == self.label:
+            return
+
+        old_items = self.items
+        self.items = list(items)
+        self.rows = None
+        # With another label function the same items may be shown differently, so none of the rows can be kept
+        relabel = label != self.label
+        self.label = label
+
+        virtual = len(self.items) > VIRTUAL_LIST_THRESHOLD
+        if virtual != self.virtual:
+            self._set_virtual(virtual)
+            return
+        if virtual:
+            self.render()
+            return
+
+        new_set = set(self.items)
+        old_set = set(old_items)
+        removed = [row for row, item in enumerate(old_items) if item not in new_set]
+        added = [row for row, item in enumerate(self.items) if item not in old_set]
+        if relabel or len(removed) + len(added) > len(self.items) // 2 or \
+                [item for item in old_items if item in new_set] != [item for item in self.items if item in old_set]:
+            # Mostly different or reordered. Rebuilding is cheaper.
+            self.listbox.delete(0, END)
+            self.listbox.insert(END, *map(self.label, self.items))
+        else:
+            for first, last in reversed(self._runs(removed)):
+                self.listbox.delete(first, last)
+            for first, last in self._runs(added):
+                self.listbox.insert(first, *map(self.label, self.items[first:last + 1]))
+        self.select(self.selected)
 
-        self.next_btn_image = PhotoImage(data=IMG_BTN_NEXT)
-        self.btn_next = Button(self.frame_btn, bg=COLOR_BACKGROUND, fg=COLOR_TEXT, image=self.next_btn_image,
-                               command=self.show_next, width=26, height=26, pady=0, borderwidth=0)
-        self.btn_next.pack(side=LEFT, padx=1)
+    def relabel(self, item):
+        """
+        Redraws the row of an item whose label changed, e.g. a folder that was expanded
+        :param item: Item in the list
+        """
+        row = self.row_of(item)
+        if row is None:
+            return
+
+        if self.virtual:
+            self.render()
+            return
+        self.listbox.delete(row)
+        self.listbox.insert(row, self.label(item))
+        if item == self.selected:
+            self.listbox.select_set(row)
+
+    def select(self, name):
+        """
+        Highlights a note and scrolls it into view
+        :param name: Note file name or None to clear the selection
+        """
+        self.selected = name
+        self.listbox.selection_clear(0, END)
+        row = self.row_of(name)
+        if row is not None and not self.marked:
+            if self.virtual:
+                visible = self.visible_rows()
+                if row < self.offset or row >= self.offset + visible:
+                    self.offset = row - visible // 2
+                    self.render()
+                    return
+            self.listbox.see(row - self.offset)
+        self._highlight()
+
+    def mark(self, items):
+        """
+        Selects several items for a bulk operation. While items are marked, they are highlighted instead of the
+        selected note.
+        :param items: Items to mark, or nothing to go back to highlighting the selected note
+        """
+        self.marked = set(items)
+        self.listbox.selection_clear(0, END)
+        self._highlight()
 
-        CreateToolTip(self.btn_next, "Next")
+    def update_marks(self, listbox_rows):
+        """
+        Marks the items the user selected in the Listbox. In virtual mode the marked items outside the rendered rows
+        are kept.
+        :param listbox_rows: Selected rows of the Listbox widget, as returned by curselection()
+        """
+        if self.virtual:
+            rendered = set(self.items[self.offset:self.offset + self.listbox.size()])
+            self.marked = {item for item in self.marked if item not in rendered}
+        else:
+            self.marked = set()
+        self.marked.update(self.item_at(row) for row in listbox_rows)
 
-        self.show_list_image = PhotoImage(data=IMG_BTN_SHOW)
-        self.hide_list_image = PhotoImage(data=IMG_BTN_HIDE)
-        self.btn_show_list = Button(self.frame_btn, bg=COLOR_BACKGROUND, fg=COLOR_TEXT, image=self.hide_list_image,
-                                    width=26, height=26, borderwidth=0)
-        self.btn_show_list.pack(side=LEFT, padx=1)
-        self.btn_show_list.bind('<Button-1>', self.show_hide_note_list)
-        self.btn_show_list.bind('<ButtonRelease-1>', self.fix_offset)
+    def marked_items(self):
+        """
+        :return: Marked items that are listed, in display order
+        """
+        return [item for item in self.items if item in self.marked]
 
-        CreateToolTip(self.btn_show_list, "Show/Hide Note List")
+    def _highlight(self):
+        """
+        Selects the Listbox rows of the marked items, or of the selected item if none are marked
+        """
+        first = self.offset if self.virtual else 0
+        size = self.listbox.size()
+        rows = (self.row_of(item) for item in (self.marked or (self.selected,)))
+        rows = sorted(row - first for row in rows if row is not None and first <= row < first + size)
+        for first_row, last_row in self._runs(rows):
+            self.listbox.select_set(first_row, last_row)
+
+    def _set_virtual(self, virtual):
+        self.virtual = virtual
+        if virtual:
+            self.listbox.config(yscrollcommand="")
+            self.scrollbar.config(command=self.yview)
+            self.render()
+        else:
+            self.offset = 0
+            self.listbox.config(yscrollcommand=self.scrollbar.set)
+            self.scrollbar.config(command=self.listbox.yview)
+            self.listbox.delete(0, END)
+            self.listbox.insert(END, *map(self.label, self.items))
+            self.select(self.selected)
+
+    def visible_rows(self):
+        if not self.row_height:
+            bbox = self.listbox.bbox(0)
+            if bbox:
+                self.row_height = bbox[3] + 1
+        row_height = self.row_height or 16
+        return max(1, self.listbox.winfo_height() // row_height + 1)
+
+    def render(self):
+        """
+        Fills the Listbox with the rows of the full list that fit on screen. Virtual mode only.
+        """
+        visible = self.visible_rows()
+        self.offset = max(0, min(self.offset, len(self.items) - visible))
+        self.listbox.delete(0, END)
+        self.listbox.insert(END, *map(self.label, self.items[self.offset:self.offset + visible]))
 
-        self.browse_image = PhotoImage(data=IMG_BTN_BROWSE)
-        self.btn_browse = Button(self.frame_btn, bg=COLOR_BACKGROUND, fg=COLOR_TEXT, image=self.browse_image,
-                                 command=self.select_notes_dir, width=26, height=26, borderwidth=0)
-        self.btn_browse.pack(side=LEFT, padx=1)
+        self._highlight()
 
-        CreateToolTip(self.btn_browse, "Select Notes Folder")
+        count = max(len(self.items), 1)
+        self.scrollbar.set(self.offset / count, min(1.0, (self.offset + visible) / count))
 
-        self.new_note_image = PhotoImage(data=IMG_BTN_NEW)
-        self.btn_new = Button(self.frame_btn, bg=COLOR_BACKGROUND, fg=COLOR_TEXT, image=self.new_note_image,
-                              command=self.new_note, width=26, height=26, borderwidth=0)
-        self.btn_new.pack(side=LEFT, padx=1)
+    def yview(self, *args):
+        """
+        Scrollbar command in virtual mode. Accepts the same arguments as Listbox.yview.
+        """
+        if args[0] == "moveto":
+            self.offset = int(float(args[1]) * len(self.items))
+        elif args[0] == "scroll":
+            amount = int(args[1])
+            if args[2] == "pages":
+                amount *= self.visible_rows()
+            self.offset += amount
+        self.render()
+
+    def on_resize(self, event):
+        if self.virtual:
+            self.render()
+
+    def on_mouse_wheel(self, event):
+        if not self.virtual:
+            return None
+        if event.num == 4 or event.delta > 0:
+            self.yview("scroll", -3, "units")
+        else:
+            self.yview("scroll", 3, "units")
+        return "break"
 
-        CreateToolTip(self.btn_new, "New Note")
+    def on_arrow_key(self, step):
+        """
+        Moves the selection past the rendered rows in virtual mode
+        """
+        if not self.virtual or not self.items:
+            return None
+
+        row = self.row_of(self.selected)
+        row = 0 if row is None else min(max(row + step, 0), len(self.items) - 1)
+        self.marked = set()
+        self.select(self.items[row])
+        self.listbox.event_generate("<<ListboxSelect>>")
+        return "break"
 
-        self.del_image = PhotoImage(data=IMG_BTN_DELETE)
-        self.btn_delete = Button(self.frame_btn, bg=COLOR_BACKGROUND, fg=COLOR_TEXT, image=self.del_image,
-                                 command=self.delete_note, width=26, height=26, pady=0, borderwidth=0)
-        self.btn_delete.pack(side=RIGHT, padx=20)
 
-        self.display_text = Text(self.frame_note_editor, bg=COLOR_BACKGROUND, fg=COLOR_TEXT, borderwidth=0, padx=5,
-                                 pady=3, undo=True, autoseparators=True, maxundo=1, spacing1=3, spacing2=0, spacing3=3)
-        self.display_text.pack(padx=0, pady=0, fill=BOTH, expand=True)
-        self.display_text.bind("<<Paste>>", self.custom_paste)
+class TracedText(Text):
+    """
+    Text widget whose insert and get calls are timed by the tracer.
+    Every change of its content, typed, pasted or made by code, can be observed through edit_listener. The widget's
+    Tcl command is wrapped, so the listener also sees the edits Tk's own key bindings make. It gets records like
+    ["insert", "1.0", "text"] and ["delete", "1.0", "1.4"] with indices resolved before the change, or
+    ["text", content] after an undo or redo. The functions in change_listeners get the same records, except that the
+    content of a "text" record is None, as they only need to know where the content changed.
+    """
+    # Tcl procedure taking the place of the widget command. Only edits go through Python: an error raised by a Python
+    # command would be raised again by the next mainloop() iteration, even when the caller catches it, as Tk's
+    # bindings do with "catch {%W edit undo}" when there is nothing to undo.
+    WRAPPER = """
+        if {[lindex $args 0] ni {insert delete replace edit}} {
+            return [%(widget)s {*}$args]
+        }
+        lassign [%(dispatch)s {*}$args] status result
+        return -code $status $result
+    """
 
-        self.status_text = StringVar()
-        self.status_text.set("")
-        self.status_bar = Label(self.frame_note_editor, textvariable=self.status_text, bg=COLOR_BACKGROUND, fg=COLOR_TEXT)
-        self.status_bar.pack(fill=X, side=BOTTOM)
+    def __init__(self, master=None, **kw):
+        Text.__init__(self, master, **kw)
+        self.edit_listener = None
+        self.change_listeners = []
+        self.widget_command = self._w + "_widget"
+        self.dispatch_command = self._w + "_dispatch"
+        self.tk.call("rename", self._w, self.widget_command)
+        self.tk.createcommand(self.dispatch_command, self.dispatch)
+        self.tk.call("proc", self._w, "args",
+                     self.WRAPPER % {"widget": self.widget_command, "dispatch": self.dispatch_command})
+
+    def destroy(self):
+        self.tk.call("rename", self._w, "")
+        self.tk.call("rename", self.widget_command, self._w)
+        self.tk.deletecommand(self.dispatch_command)
+        Text.destroy(self)
+
+    def dispatch(self, operation, *args):
+        """
+        Runs an edit command of the wrapped Tcl widget and reports the edits it makes to edit_listener.
+        :param operation: insert, delete, replace or edit
+        :return: ("ok", result) or ("error", message) for a failing command, which the WRAPPER procedure raises
+            as a Tcl error in the caller, so a failed edit reports nothing and nothing is left for mainloop() to raise
+        """
+        listener = self.edit_listener
+        change_listeners = self.change_listeners
+        command = self.widget_command
+        try:
+            if listener is None and not change_listeners or str(self.tk.call(command, "cget", "-state")) != NORMAL:
+                return "ok", self.tk.call((command, operation) + args)
+
+            records = []
+            if operation == "insert":
+                records.append(["insert", str(self.tk.call(command, "index", args[0])), "".join(args[1::2])])
+            elif operation == "replace":
+                start = str(self.tk.call(command, "index", args[0]))
+                end = str(self.tk.call(command, "index", args[1]))
+                records.append(["delete", start, end])
+                records.append(["insert", start, "".join(args[2::2])])
+            elif operation == "delete" and len(args) <= 2:
+                start = str(self.tk.call(command, "index", args[0]))
+                end = str(self.tk.call(command, "index", args[1] if len(args) == 2 else f"{start}+1c"))
+                records.append(["delete", start, end])
+
+            result = self.tk.call((command, operation) + args)
+        except TclError as e:
+            return "error", str(e)
+
+        if operation == "delete" and len(args) > 2 or operation == "edit" and args and args[0] in ("undo", "redo"):
+            content = None if listener is None else self.tk.call(command, "get", "1.0", "end-1c")
+            records.append(["text", content])
+        for record in records:
+            if listener is not None:
+                listener(record)
+            for change_listener in change_listeners:
+                change_listener(record)
+        return "ok", result
+
+    def insert(self, index, chars, *args):
+        with tracer.span("text.insert", size=len(chars)):
+            return Text.insert(self, index, chars, *args)
+
+    def get(self, index1, index2=None):
+        with tracer.span("text.get"):
+            return Text.get(self, index1, index2)
+
+
+class InstanceServer(object):
+    """
+    Keeps a single instance of the app running.
+    The first instance listens on a Unix domain socket in the config folder. Later launches connect to it, send
+    their request and exit, so the running window, with its warm caches, is reused instead of being restarted.
+    A request is a dictionary with "command" set to "raise", "open" (with "note" set to the note name) or "new".
+    """
+    def __init__(self, path):
+        """
+        :param path: Path of the socket
+        """
+        self.path = path
+        self.server = None
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.requests = queue.Queue()
 
-        self.read_cfg()
-        self.read_note()
+    def claim(self, request):
+        """
+        Hands the request to the running instance, or becomes the running instance if there is none.
+        If a running instance does not answer, or the socket cannot be set up, the app is started without listening
+        for later launches; check listening.
+        :param request: What this launch asked for
+        :return: True if this process should start the app, False if a running instance took the request
+        """
+        if fcntl is None or not hasattr(socket, "AF_UNIX"):
+            print("INFO: Unix domain sockets are not available. Not checking for a running instance.")
+            return True
 
-        self.focus_force()
+        if not os.path.isdir(cfg_dir):
+            os.mkdir(cfg_dir)
 
-        # Check if note list window should be shown
-        if not self.show_note_list_flag:
-            self.note_listbox.pack_forget()
-            self.scrollbar.pack_forget()
-            self.btn_show_list.config(image=self.show_list_image)
+        # Serializes launches started at the same time, so only one of them becomes the running instance
+        with open(self.path + ".lock", 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if self.send(request):
+                    return False
+            except OSError as e:
+                # Alive but busy, or not an instance of this app. Its socket is left alone.
+                print(f"ERROR: The running instance did not take the request. Starting a separate one. {e}")
+                return True
+            try:
+                self.listen()
+            except OSError as e:
+                print(f"ERROR: Could not listen on {self.path}. Starting a separate instance. {e}")
+        return True
 
-    def on_focus_out(self, event):
-        self.save_note()
+    @property
+    def listening(self):
+        return self.server is not None
 
-    def clear_status(self):
-        self.status_text.set("")
+    def send(self, request):
+        """
+        :param request: Request to hand over
+        :return: True if a running instance acknowledged the request, False if no instance is running
+        :raise OSError: If an instance is listening but did not acknowledge the request in time
+        """
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.settimeout(INSTANCE_TIMEOUT)
+        try:
+            try:
+                client.connect(self.path)
+            except (FileNotFoundError, ConnectionRefusedError):
+                return False
+            client.sendall(json.dumps(request).encode() + b"\n")
+            if not client.recv(16).startswith(b"ok"):
+                raise ConnectionError("The request was not acknowledged")
+            return True
+        finally:
+            client.close()
+
+    def listen(self):
+        """
+        Starts accepting requests from later launches on a background thread. Only call it when send() found no
+        running instance.
+        """
+        if os.path.exists(self.path):
+            # Left behind by an instance that did not exit cleanly. Connecting to it was refused.
+            os.unlink(self.path)
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Created accessible to the user only, with no window in which other users could connect. The umask is
+        # process wide, which is safe here as this runs before the app starts any threads.
+        old_umask = os.umask(0o077)
+        try:
+            server.bind(self.path)
+            server.listen(8)
+        except OSError:
+            server.close()
+            raise
+        finally:
+            os.umask(old_umask)
 
-    def set_status(self, message):
-        self.status_text.set(message)
-        self.after(1500, self.clear_status)
+        self.server = server
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
 
-    def edit_name(self, event):
+    def _run(self):
+        server = self.server
+        try:
+            while not self.stop_event.is_set():
+                readable, _, _ = select.select([server], [], [], 0.5)
+                if not readable:
+                    continue
+                try:
+                    connection, _ = server.accept()
+                except OSError:
+                    continue
+                with connection:
+                    connection.settimeout(INSTANCE_TIMEOUT)
+                    try:
+                        self._receive(connection)
+                    except (OSError, ValueError) as e:
+                        print(f"ERROR: Bad request from another instance. {e}")
+        finally:
+            server.close()
+
+    def _receive(self, connection):
+        data = b""
+        while not data.endswith(b"\n") and len(data) < 64 * 1024:
+            received = connection.recv(4096)
+            if not received:
+                break
+            data += received
+
+        request = json.loads(data.decode())
+        if not isinstance(request, dict):
+            raise ValueError(f"Unexpected request {request!r}")
+        self.requests.put(request)
+        connection.sendall(b"ok\n")
+
+    def take_requests(self):
         """
-        Edit note file name
-        :param event: Unused dummy variable
-        :return:
+        :return: List of requests received since the last call
         """
-        if self.note_file_name is not None:
-            file_path = os.path.join(self.notes_dir, self.note_file_name)
-            new_name = simpledialog.askstring(
-                title="Change Note Name",
-                prompt="New note name:",
-                initialvalue=self.note_file_name
-            )
-            if new_name is not None:
-                print("Changing to:", new_name)
-                new_file_path = os.path.join(self.notes_dir, new_name)
-                if os.path.isfile(new_file_path):
-                    messagebox.showerror(
-                        "Error Renaming",
-                        f'Could not rename "{self.note_file_name}" to "{new_name}" '
-                        f'because a file with same name already exists!'
-                    )
-                else:
-                    os.rename(file_path, new_file_path)
-                    self.note_file_name = new_name
-                    self.refresh_note_list()
+        requests = []
+        while True:
+            try:
+                requests.append(self.requests.get_nowait())
+            except queue.Empty:
+                return requests
 
-    def refresh_note_list(self):
-        self.list_notes()
+    def stop(self):
+        """
+        Stops listening and removes the socket, so the next launch starts a new instance
+        """
+        if self.server is None:
+            return
 
-        self.note_listbox.delete(0, END)
-        for note in self.notes:
-            self.note_listbox.insert(END, note)
+        self.stop_event.set()
+        self.server = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
 
-        if self.note_file_name in self.notes:
-            note_index = self.notes.index(self.note_file_name)
-            self.note_listbox.select_set(note_index)
 
-    def file_selected(self, event):
-        selection = event.widget.curselection()
-        if selection:
-            index = selection[0]
-            self.save_note()
-            self.note_file_name = event.widget.get(index)
-            self.read_note()
+class HistoryBrowser(Toplevel):
+    """
+    Window listing the saved versions of a note. Selecting a version shows how restoring it would change the note
+    in the editor, or the saved note once the editor moved on to another one; Restore puts it into the editor as a
+    normal, undoable edit. Versions are rebuilt and diffed on the IO executor, so long histories and big notes do not
+    block the editor.
+    """
+    def __init__(self, main_window, name):
+        """
+        :param main_window: MainWindow the note is open in
+        :param name: Note file name
+        """
+        Toplevel.__init__(self, main_window)
+        self.main_window = main_window
+        self.name = name
+        self.location = main_window.store.location
+        self.backend = main_window.store.backend
+        self.versions = []
+        self.selected_text = None
+        self.closed = False
+
+        self.title(f"{APP_TITLE} - History of {name}")
+        self.configure(background=COLOR_BACKGROUND)
+        self.geometry("700x450")
+
+        self.frame_versions = Frame(self, bg=COLOR_BACKGROUND)
+        self.frame_versions.pack(side=LEFT, fill=Y)
+
+        self.btn_restore = Button(self.frame_versions, text="Restore", bg=COLOR_BACKGROUND, fg=COLOR_TEXT,
+                                  command=self.restore, state=DISABLED, borderwidth=1)
+        self.btn_restore.pack(side=BOTTOM, fill=X, padx=2, pady=2)
+
+        self.version_list = Listbox(self.frame_versions, bg=COLOR_BACKGROUND, fg=COLOR_TEXT, bd=0, width=28,
+                                    exportselection=False)
+        self.version_list.pack(side=LEFT, fill=Y, expand=YES)
+        self.version_list.bind("<<ListboxSelect>>", self.version_selected)
+
+        self.diff_text = Text(self, bg=COLOR_BACKGROUND, fg=COLOR_TEXT, borderwidth=0, padx=5, pady=3, wrap="none")
+        self.diff_text.pack(side=RIGHT, fill=BOTH, expand=True)
+        self.diff_text.tag_config("added", foreground=COLOR_DIFF_ADDED)
+        self.diff_text.tag_config("removed", foreground=COLOR_DIFF_REMOVED)
+        self.diff_text.tag_config("hunk", foreground=COLOR_DIFF_HUNK)
+        self.show_message("Loading...")
+
+        self.bind("<Escape>", lambda event: self.destroy())
+        self.protocol("WM_DELETE_WINDOW", self.destroy)
+
+        # Queued behind a pending save of the note, so its latest content is listed
+        main_window.io.submit(main_window.history.versions, self.location, name, callback=self.show_versions,
+                              keys=(main_window.store.path(name),), channel="history")
+
+    def destroy(self):
+        self.closed = True
+        self.main_window.io.cancel("history")
+        Toplevel.destroy(self)
+
+    def show_message(self, message):
+        self.diff_text.config(state=NORMAL)
+        self.diff_text.delete("1.0", END)
+        self.diff_text.insert("1.0", message)
+        self.diff_text.config(state=DISABLED)
+
+    def show_versions(self, versions):
+        if self.closed:
+            return
+
+        self.versions = versions
+        for version in versions:
+            saved = strftime("%Y-%m-%d %H:%M:%S", localtime(version["time"]))
+            self.version_list.insert(END, f"{saved}  {version['size']} chars")
+
+        if not versions:
+            self.show_message("No saved versions yet.")
+            return
+        self.version_list.selection_set(0)
+        self.version_selected(None)
+
+    def version_selected(self, event):
+        selection = self.version_list.curselection()
+        if not selection:
+            return
+
+        version = self.versions[selection[0]]
+        self.selected_text = None
+        self.btn_restore.config(state=DISABLED)
+        main_window = self.main_window
+        if main_window.store.location != self.location:
+            current = None
+        elif main_window.note_loaded and main_window.note_file_name == self.name:
+            current = main_window.display_text.get("1.0", "end-1c")
+        else:
+            # The editor moved on to another note. Compare with the note as open elsewhere or as saved.
+            current = main_window.editors.text_of(self.name, main_window.display_text)
+            if current is None:
+                cached = main_window.store.cached(self.name)
+                current = None if cached is None else cached[1]
+        main_window.io.submit(self.load_diff, version["id"], current, callback=self.show_diff,
+                              error_callback=self.show_error, keys=(self.backend.path(self.name),),
+                              channel="history")
+
+    def load_diff(self, object_id, current):
+        """
+        Rebuilds a version and diffs the note against it. Runs on an IOExecutor worker.
+        :param object_id: Version to rebuild
+        :param current: Text of the note, or None to read the saved note
+        :return: Tuple of (version text, list of unified diff lines)
+        """
+        text = self.main_window.history.load(object_id)
+        if current is None:
+            try:
+                current = self.backend.read_text(self.name)
+            except FileNotFoundError:
+                current = ""
+        diff = difflib.unified_diff(current.splitlines(True), text.splitlines(True), "note", "version")
+        return text, list(diff)
+
+    def show_diff(self, result):
+        if self.closed:
+            return
+
+        self.selected_text, diff = result
+        self.btn_restore.config(state=NORMAL)
+        if not diff:
+            self.show_message("This version is the same as the note.")
+            return
+
+        self.diff_text.config(state=NORMAL)
+        self.diff_text.delete("1.0", END)
+        for line in diff:
+            if not line.endswith("\n"):
+                line += "\n"
+            tag = ()
+            if line.startswith("@@"):
+                tag = ("hunk",)
+            elif line.startswith("+") and not line.startswith("+++"):
+                tag = ("added",)
+            elif line.startswith("-") and not line.startswith("---"):
+                tag = ("removed",)
+            self.diff_text.insert(END, line, tag)
+        self.diff_text.config(state=DISABLED)
+
+    def show_error(self, error):
+        if not self.closed:
+            self.show_message(f"Could not load this version. {error}")
+
+    def restore(self):
+        if self.selected_text is None:
+            return
+
+        if self.main_window.restore_version(self.name, self.location, self.selected_text):
+            self.destroy()
+
+
+class QuickOpen(Toplevel):
+    """
+    Popup for jumping to a note by typing part of its name. The NameIndex is queried on every key press;
+    Up and Down pick a match, Return opens it and Escape closes the popup.
+    """
+    def __init__(self, main_window):
+        """
+        :param main_window: MainWindow to open the note in
+        """
+        Toplevel.__init__(self, main_window)
+        self.main_window = main_window
+        self.results = []
 
-    def fix_offset(self, event):
-        self.offset_x = self.winfo_x() - self.x
-        self.offset_y = self.winfo_y() - self.y
+        self.title(f"{APP_TITLE} - Open Note")
+        self.configure(background=COLOR_BACKGROUND)
+        self.transient(main_window)
+        self.geometry(f"400x300+{main_window.winfo_rootx() + 40}+{main_window.winfo_rooty() + 40}")
+
+        self.query = StringVar()
+        self.entry = Entry(self, textvariable=self.query, bg=COLOR_BACKGROUND, fg=COLOR_TEXT, bd=1, relief='solid')
+        self.entry.pack(side=TOP, fill=X, padx=2, pady=2)
+        self.result_list = Listbox(self, bg=COLOR_BACKGROUND, fg=COLOR_TEXT, bd=0, exportselection=False)
+        self.result_list.pack(side=TOP, fill=BOTH, expand=YES)
+
+        self.query.trace_add("write", lambda *args: self.update_results())
+        self.entry.bind("<Down>", lambda event: self.move_selection(1))
+        self.entry.bind("<Up>", lambda event: self.move_selection(-1))
+        self.entry.bind("<Return>", self.open_selected)
+        self.result_list.bind("<Double-1>", self.open_selected)
+        self.bind("<Escape>", lambda event: self.destroy())
+
+        self.update_results()
+        self.entry.focus_set()
+
+    def update_results(self):
+        with tracer.span("quick_open.search"):
+            self.results = self.main_window.name_index.search(self.query.get())
+        self.result_list.delete(0, END)
+        for name in self.results:
+            self.result_list.insert(END, name)
+        if self.results:
+            self.result_list.selection_set(0)
+
+    def move_selection(self, step):
+        selection = self.result_list.curselection()
+        if self.results:
+            index = min(max((selection[0] if selection else 0) + step, 0), len(self.results) - 1)
+            self.result_list.selection_clear(0, END)
+            self.result_list.selection_set(index)
+            self.result_list.see(index)
+        return "break"
 
-    def show_hide_note_list(self, event):
-        self.y = self.winfo_y() - self.offset_y
-        self.x = self.winfo_x() - self.offset_x
-        self.width = self.winfo_width()
-        self.height = self.winfo_height()
+    def open_selected(self, event=None):
+        selection = self.result_list.curselection()
+        if not selection:
+            return "break"
 
-        if self.show_note_list_flag:
-            self.show_note_list_flag = False
-            self.file_list_width = self.note_listbox.winfo_width() + self.scrollbar.winfo_width()
-            list_width = -self.file_list_width
-            self.note_listbox.pack_forget()
-            self.scrollbar.pack_forget()
-            self.btn_show_list.config(image=self.show_list_image)
-        else:
-            self.show_note_list_flag = True
-            self.note_listbox.pack(side=LEFT, fill=Y)
-            if self.scrollbar.visible:
-                self.scrollbar.pack(side=LEFT, fill=Y)
-            self.btn_show_list.config(image=self.hide_list_image)
-            list_width = self.file_list_width
+        name = self.results[selection[0]]
+        self.destroy()
+        self.main_window.open_note(name)
+        self.main_window.display_text.focus_set()
+        return "break"
 
-        self.width += list_width
-        self.x -= list_width
-        self.geometry(f"{self.width}x{self.height}+{self.x}+{self.y}")
 
-    def set_title(self, new_title):
+class FindBar(Frame):
+    """
+    Find and replace bar under the editor. Matches are highlighted by a scan that works through the note in chunks of
+    FIND_CHUNK_LINES on idle callbacks, at most FIND_STEP_TIME at a time, starting with the lines on screen, so a long
+    note never blocks typing. The running match count is shown in the status bar. Editing the note restarts the scan
+    once typing pauses. Replace all is a single undo step.
+    """
+    def __init__(self, main_window):
         """
-        Sets the main window title
-        :param new_title: The new string to append to the application main title
+        :param main_window: MainWindow whose editor is searched
         """
-        self.title(f"{APP_TITLE} - {new_title}")
-
-    def custom_paste(self, event):
+        Frame.__init__(self, main_window.frame_note_editor, bg=COLOR_BACKGROUND)
+        self.main_window = main_window
+        self.text = main_window.display_text
+        self.visible = False
+        self.pattern = None
+        self.scan = None
+        self.scan_job = None
+        self.restart_job = None
+        self.count = 0
+
+        self.query = StringVar()
+        self.replacement = StringVar()
+        self.use_regex = BooleanVar(value=False)
+        self.match_case = BooleanVar(value=False)
+
+        options = {"bg": COLOR_BACKGROUND, "fg": COLOR_TEXT}
+        Label(self, text="Find:", **options).pack(side=LEFT, padx=2)
+        self.find_entry = Entry(self, textvariable=self.query, bd=1, relief='solid', **options)
+        self.find_entry.pack(side=LEFT, fill=X, expand=YES, padx=2, pady=2)
+        Label(self, text="Replace:", **options).pack(side=LEFT, padx=2)
+        self.replace_entry = Entry(self, textvariable=self.replacement, bd=1, relief='solid', **options)
+        self.replace_entry.pack(side=LEFT, fill=X, expand=YES, padx=2, pady=2)
+        for label, variable in (("Regex", self.use_regex), ("Case", self.match_case)):
+            Checkbutton(self, text=label, variable=variable, command=self.restart, selectcolor=COLOR_BACKGROUND,
+                        activebackground=COLOR_BACKGROUND, bd=0, **options).pack(side=LEFT)
+        for label, command in (("<", lambda: self.find_next(-1)), (">", self.find_next), ("Replace", self.replace),
+                               ("All", self.replace_all), ("x", self.hide)):
+            Button(self, text=label, command=command, bd=0, padx=4, pady=0, **options).pack(side=LEFT, padx=1)
+
+        self.text.tag_config("find", background=COLOR_FIND_MATCH)
+        self.text.tag_config("find_current", background=COLOR_FIND_CURRENT)
+        self.text.tag_raise("find_current", "find")
+        self.text.tag_raise("sel")
+
+        self.query.trace_add("write", lambda *args: self.schedule_restart(keep_current=False))
+        for entry in (self.find_entry, self.replace_entry):
+            entry.bind("<Return>", lambda event: self.find_next())
+            entry.bind("<Shift-Return>", lambda event: self.find_next(-1))
+            entry.bind("<Escape>", self.hide)
+        self.replace_entry.bind("<Control-Return>", lambda event: self.replace_all())
+
+    def show(self, replace=False):
         """
-        By default, the Text widget will perform an insert, ignoring the selected content.
-        This function deletes the selected content so we can paste over selected.
-        :param event: Detected event
-        :return: "break" message to TK Inter
+        Opens the bar with the selected text, if any, as the query
+        :param replace: Focus the replacement instead of the query
         """
         try:
-            event.widget.delete("sel.first", "sel.last")
-        except:
+            selected = self.text.get("sel.first", "sel.last")
+            if selected and "\n" not in selected:
+                self.query.set(re.escape(selected) if self.use_regex.get() else selected)
+        except TclError:
             pass
-        event.widget.insert("insert", event.widget.clipboard_get())
+
+        if not self.visible:
+            self.visible = True
+            self.pack(side=BOTTOM, fill=X, before=self.text)
+            # Keep the status bar at the very bottom
+            self.main_window.status_bar.pack(fill=X, side=BOTTOM, before=self)
+            self.restart()
+
+        entry = self.replace_entry if replace else self.find_entry
+        entry.focus_set()
+        entry.select_range(0, END)
         return "break"
-        
-    def new_note(self):
+
+    def hide(self, event=None):
+        self.stop()
+        if self.restart_job is not None:
+            self.after_cancel(self.restart_job)
+            self.restart_job = None
+        self.text.tag_remove("find", "1.0", END)
+        self.text.tag_remove("find_current", "1.0", END)
+        self.pattern = None
+        self.visible = False
+        self.pack_forget()
+        self.main_window.clear_status()
+        self.text.focus_set()
+        return "break"
+
+    def compile(self):
         """
-        Prepares the app for writing a new note
+        :return: Compiled query or None if it is empty or not a valid regular expression
         """
-        self.save_note()
+        query = self.query.get()
+        if not query:
+            return None
 
-        self.note_text = ""
-        self.note_file_name = f"Note_{int(time())}"
-        self.display_text.delete(1.0, END)
-        self.set_title("New")
-        self.refresh_note_list()
+        flags = 0 if self.match_case.get() else re.IGNORECASE
+        try:
+            return re.compile(query if self.use_regex.get() else re.escape(query), flags | re.MULTILINE)
+        except re.error as e:
+            self.main_window.status_text.set(f"Invalid pattern: {e}")
+            return None
+
+    def text_changed(self):
+        """
+        Called on every edit of the note. The highlighted matches are refreshed once typing pauses.
+        """
+        if self.visible:
+            self.stop()
+            self.schedule_restart()
+
+    def schedule_restart(self, keep_current=True):
+        if self.restart_job is not None:
+            self.after_cancel(self.restart_job)
+        self.restart_job = self.after(FIND_DELAY, lambda: self.restart(keep_current))
+
+    def stop(self):
+        self.scan = None
+        if self.scan_job is not None:
+            self.after_cancel(self.scan_job)
+            self.scan_job = None
+
+    def restart(self, keep_current=False):
+        """
+        Clears the highlighted matches and starts a new scan
+        :param keep_current: Keep the current match, e.g. after an edit or a replace
+        """
+        self.restart_job = None
+        self.stop()
+        self.text.tag_remove("find", "1.0", END)
+        if not keep_current:
+            self.text.tag_remove("find_current", "1.0", END)
+        self.count = 0
+        self.pattern = self.compile()
+        if self.pattern is None:
+            if not self.query.get():
+                self.main_window.clear_status()
+            return
+
+        self.scan = self.scan_matches()
+        self.run_scan()
+
+    def run_scan(self):
+        """
+        Highlights matches for up to FIND_STEP_TIME and reschedules itself on an idle callback until done
+        """
+        self.scan_job = None
+        if self.scan is None:
+            return
+
+        deadline = perf_counter() + FIND_STEP_TIME / 1000
+        with tracer.span("find.scan"):
+            try:
+                while perf_counter() < deadline:
+                    next(self.scan)
+            except StopIteration:
+                self.scan = None
+
+        matches = "1 match" if self.count == 1 else f"{self.count} matches"
+        if self.scan is None:
+            self.main_window.status_text.set(matches)
+        else:
+            self.main_window.status_text.set(f"{matches} so far...")
+            self.scan_job = self.after_idle(self.run_scan)
+
+    def finish_scan(self):
+        """
+        Highlights the matches not found yet right away
+        """
+        if self.scan is not None:
+            for _ in self.scan:
+                pass
+            self.stop()
+            self.main_window.status_text.set("1 match" if self.count == 1 else f"{self.count} matches")
+
+    def scan_matches(self):
+        """
+        Generator highlighting the matches of the pattern, the lines on screen first. Yields after every chunk of
+        lines and every FIND_TAG_BATCH matches. Matches do not span chunks.
+        """
+        top = int(self.text.index("@0,0").split(".")[0])
+        bottom = int(self.text.index(f"@0,{self.text.winfo_height()}").split(".")[0]) + 1
+        end = int(self.text.index("end-1c").split(".")[0]) + 1
+        chunks = [(top, bottom)]
+        chunks.extend((first, min(first + FIND_CHUNK_LINES, end)) for first in range(bottom, end, FIND_CHUNK_LINES))
+        chunks.extend((first, min(first + FIND_CHUNK_LINES, top)) for first in range(1, top, FIND_CHUNK_LINES))
+
+        for first, last in chunks:
+            text = self.text.get(f"{first}.0", f"{last}.0")
+            line_starts = [0]
+            line_starts.extend(accumulate(len(line) + 1 for line in text.split("\n")))
+
+            def text_index(offset):
+                line = bisect.bisect_right(line_starts, offset) - 1
+                return f"{first + line}.{offset - line_starts[line]}"
+
+            ranges = []
+            for match in self.pattern.finditer(text):
+                start, stop = match.span()
+                if start == stop:
+                    continue
+                ranges.append(text_index(start))
+                ranges.append(text_index(stop))
+                if len(ranges) >= 2 * FIND_TAG_BATCH:
+                    self.text.tag_add("find", *ranges)
+                    self.count += len(ranges) // 2
+                    ranges = []
+                    yield
+            if ranges:
+                self.text.tag_add("find", *ranges)
+                self.count += len(ranges) // 2
+            yield
+
+    def find_next(self, step=1):
+        """
+        Moves to the next or previous match, wrapping around the note
+        :param step: 1 for the next match, -1 for the previous one
+        """
+        if self.pattern is None:
+            return "break"
+
+        current = self.text.tag_ranges("find_current")
+        if step > 0:
+            start = f"{current[0]}+1c" if current else "insert"
+            found = self.text.tag_nextrange("find", start)
+            if not found:
+                self.finish_scan()
+                found = self.text.tag_nextrange("find", start) or self.text.tag_nextrange("find", "1.0")
+        else:
+            start = str(current[0]) if current else "insert"
+            found = self.text.tag_prevrange("find", start)
+            if not found:
+                self.finish_scan()
+                found = self.text.tag_prevrange("find", start) or self.text.tag_prevrange("find", END)
+
+        if found:
+            self.text.tag_remove("find_current", "1.0", END)
+            self.text.tag_add("find_current", *found)
+            self.text.mark_set("insert", found[1])
+            self.text.see(found[0])
+        return "break"
+
+    def replacement_at(self, start, end):
+        """
+        :param start: Text index where the current match starts
+        :param end: Text index where it ends
+        :return: Tuple of (end of the match, its replacement with groups filled in when searching with a regular
+        expression), or None if the pattern no longer matches there
+        """
+        replacement = self.replacement.get()
+        if not self.use_regex.get():
+            return end, replacement
+
+        # Match in the whole note rather than the matched text alone, so anchors and lookarounds see what
+        # surrounds the match
+        before = self.text.get("1.0", start)
+        match = self.pattern.match(before + self.text.get(start, "end-1c"), len(before))
+        if match is None or match.end() == match.start():
+            return None
+        return f"{start}+{match.end() - match.start()}c", match.expand(replacement)
+
+    def editable(self):
+        if self.pattern is None or self.main_window.pending_insert is not None or \
+                str(self.text.cget("state")) != NORMAL:
+            return False
+        if self.main_window.large_note is not None:
+            self.main_window.set_status("Replacing is not available in large note mode")
+            return False
+        return True
+
+    def replace(self):
+        """
+        Replaces the current match and moves to the next one
+        """
+        current = self.text.tag_ranges("find_current")
+        if not current or not self.editable():
+            return self.find_next()
+
+        start, end = str(current[0]), str(current[1])
+        try:
+            found = self.replacement_at(start, end)
+        except re.error as e:
+            self.main_window.set_status(f"Invalid replacement: {e}")
+            return "break"
+        self.text.tag_remove("find_current", "1.0", END)
+        if found is None:
+            # The highlighted matches are out of date
+            self.restart()
+            return self.find_next()
+        end, replacement = found
+        self.text.replace(start, end, replacement)
+        self.text.mark_set("insert", f"{start}+{len(replacement)}c")
+        return self.find_next()
+
+    def replace_all(self):
+        """
+        Replaces every match in the note as a single undo step
+        """
+        if not self.editable():
+            return "break"
+
+        content = self.text.get("1.0", "end-1c")
+        replacement = self.replacement.get()
+        try:
+            if self.use_regex.get():
+                # Groups are filled in from matches in the whole note, like replacement_at() does
+                new_content, count = self.pattern.subn(replacement, content)
+            else:
+                new_content, count = self.pattern.subn(lambda match: replacement, content)
+        except re.error as e:
+            self.main_window.set_status(f"Invalid replacement: {e}")
+            return "break"
+        if count == 0:
+            self.main_window.set_status("No matches")
+            return "break"
+
+        view = self.text.yview()[0]
+        insert = self.text.index("insert")
+        self.text.config(autoseparators=False)
+        self.text.edit_separator()
+        self.text.replace("1.0", "end-1c", new_content)
+        self.text.edit_separator()
+        self.text.config(autoseparators=True)
+        self.text.mark_set("insert", insert)
+        self.text.yview_moveto(view)
+        self.main_window.set_status(f"Replaced {count} matches")
+        return "break"
+
+
+class MarkupHighlighter(object):
+    """
+    Styles lightweight markup in the editor: URLs, which open on Ctrl+click, "[ ]" and "[x]" checklist items, which
+    toggle on click, and "#" headings. Only tags are added, so the text itself, and what gets copied, stays plain.
+    Every edit marks the lines it touched as dirty, adjusting the dirty lines below it for the lines it added or
+    removed. The dirty lines are re-tagged on idle callbacks, at most MARKUP_STEP_TIME at a time and the lines on
+    screen first, so loading a long note is highlighted gradually and typing only re-tags the line being typed in.
+    """
+    TAGS = ("markup_heading", "markup_url", "markup_checkbox", "markup_done")
+    HEADING = re.compile(r"^#{1,6}[ \t].*", re.MULTILINE)
+    URL = re.compile(r"\bhttps?://[^\s<>\"'`]+")
+    URL_TRAILING = ".,;:!?)]}'\""
+    CHECKBOX = re.compile(r"^[ \t]*(?:[-*+][ \t]+)?(\[[ xX]\])(.*)", re.MULTILINE)
+
+    def __init__(self, text):
+        """
+        :param text: TracedText editor to highlight
+        """
+        self.text = text
+        self.dirty = []
+        self.job = None
+
+        heading_font = Font(font=self.text.cget("font"))
+        heading_font.configure(weight="bold")
+        self.text.tag_config("markup_heading", font=heading_font)
+        self.text.tag_config("markup_url", foreground=COLOR_LINK, underline=True)
+        self.text.tag_config("markup_checkbox", foreground=COLOR_LINK)
+        self.text.tag_config("markup_done", foreground=COLOR_DONE, overstrike=True)
+        for tag in self.TAGS:
+            self.text.tag_lower(tag)
+        self.text.tag_bind("markup_url", "<Control-Button-1>", self.open_url)
+        self.text.tag_bind("markup_checkbox", "<Button-1>", self.toggle_checkbox)
+        for tag in ("markup_url", "markup_checkbox"):
+            self.text.tag_bind(tag, "<Enter>", lambda event: self.text.config(cursor="hand2"))
+            self.text.tag_bind(tag, "<Leave>", lambda event: self.text.config(cursor="xterm"))
+        self.text.change_listeners.append(self.text_changed)
+
+    @staticmethod
+    def line_of(index):
+        return int(index.split(".")[0])
+
+    def text_changed(self, record):
+        """
+        Marks the lines touched by an edit as dirty
+        :param record: Edit reported by TracedText
+        """
+        if record[0] == "insert":
+            first = self.line_of(record[1])
+            added = record[2].count("\n")
+            if added:
+                self.shift(first, added)
+            self.dirty.append([first, first + added])
+        elif record[0] == "delete":
+            first = self.line_of(record[1])
+            removed = self.line_of(record[2]) - first
+            if removed:
+                self.shift(first, -removed)
+            self.dirty.append([first, first])
+        else:
+            self.dirty = [[1, self.line_of(self.text.index("end-1c"))]]
+
+        if self.job is None:
+            self.job = self.text.after_idle(self.run)
+
+    def shift(self, line, count):
+        """
+        Moves the dirty lines below an edit
+        :param line: Line the edit starts on
+        :param count: Lines added, or removed if negative
+        """
+        for dirty in self.dirty:
+            if dirty[0] > line:
+                dirty[0] = max(line, dirty[0] + count)
+            if dirty[1] > line:
+                dirty[1] = max(line, dirty[1] + count)
+
+    def run(self):
+        """
+        Re-tags dirty lines for up to MARKUP_STEP_TIME and reschedules itself on an idle callback until all are done
+        """
+        self.job = None
+        last_line = self.line_of(self.text.index("end-1c"))
+        ranges = []
+        for first, last in sorted(self.dirty):
+            last = min(last, last_line)
+            if first > last:
+                continue
+            if ranges and first <= ranges[-1][1] + 1:
+                ranges[-1][1] = max(ranges[-1][1], last)
+            else:
+                ranges.append([first, last])
+        self.dirty = ranges
+
+        top = self.line_of(self.text.index("@0,0"))
+        bottom = self.line_of(self.text.index(f"@0,{self.text.winfo_height()}"))
+        deadline = perf_counter() + MARKUP_STEP_TIME / 1000
+        with tracer.span("markup.highlight"):
+            while self.dirty and perf_counter() < deadline:
+                # Lines on screen first
+                position = next((position for position, (first, last) in enumerate(self.dirty)
+                                 if first <= bottom and last >= top), 0)
+                first, last = self.dirty[position]
+                if first <= bottom and last >= top:
+                    first = max(first, top)
+                last = min(last, first + MARKUP_CHUNK_LINES - 1)
+                self.highlight(first, last)
+
+                before = [self.dirty[position][0], first - 1]
+                after = [last + 1, self.dirty[position][1]]
+                self.dirty[position:position + 1] = [part for part in (before, after) if part[0] <= part[1]]
+
+        if self.dirty:
+            self.job = self.text.after_idle(self.run)
+
+    def highlight(self, first, last):
+        """
+        Re-tags a range of lines
+        :param first: First line
+        :param last: Last line, inclusive
+        """
+        start = f"{first}.0"
+        end = f"{last}.end"
+        for tag in self.TAGS:
+            self.text.tag_remove(tag, start, end)
+
+        text = self.text.get(start, end)
+        line_starts = [0]
+        line_starts.extend(accumulate(len(line) + 1 for line in text.split("\n")))
+
+        def text_index(offset):
+            line = bisect.bisect_right(line_starts, offset) - 1
+            return f"{first + line}.{offset - line_starts[line]}"
+
+        ranges = {tag: [] for tag in self.TAGS}
+        for match in self.HEADING.finditer(text):
+            ranges["markup_heading"] += [text_index(match.start()), text_index(match.end())]
+        for match in self.CHECKBOX.finditer(text):
+            ranges["markup_checkbox"] += [text_index(match.start(1)), text_index(match.end(1))]
+            if match.group(1) != "[ ]":
+                ranges["markup_done"] += [text_index(match.start(2)), text_index(match.end(2))]
+        for match in self.URL.finditer(text):
+            url_end = match.start() + len(match.group().rstrip(self.URL_TRAILING))
+            ranges["markup_url"] += [text_index(match.start()), text_index(url_end)]
+
+        for tag, tag_ranges in ranges.items():
+            if tag_ranges:
+                self.text.tag_add(tag, *tag_ranges)
+
+    def tag_range_at(self, tag, event):
+        """
+        :return: Tuple of (start, end) of the tag range under the mouse pointer
+        """
+        index = self.text.index(f"@{event.x},{event.y}")
+        return self.text.tag_prevrange(tag, f"{index}+1c")
+
+    def open_url(self, event):
+        found = self.tag_range_at("markup_url", event)
+        if found:
+            # Imported on first use, to keep it out of startup
+            import webbrowser
+            webbrowser.open(self.text.get(*found))
+        return "break"
+
+    def toggle_checkbox(self, event):
+        found = self.tag_range_at("markup_checkbox", event)
+        if not found or str(self.text.cget("state")) != NORMAL:
+            return None
+
+        checked = self.text.get(*found) != "[ ]"
+        self.text.replace(found[0], found[1], "[ ]" if checked else "[x]")
+        return "break"
+
+
+class EditorGroup(object):
+    """
+    Keeps every editor showing the same note in sync. An edit made in one editor is replayed into the others showing
+    that note, through their TracedText change_listeners, so they always hold the same text. A replayed edit leaves
+    the modified flag of the peer as it was, so only the editor the edit was made in saves it. An editor takes part
+    only while its note is fully loaded.
+    """
+    def __init__(self):
+        self.editors = {}
+        self.replaying = False
+
+    def add(self, text, shown_note, renamed=None, replayed=None):
+        """
+        :param text: TracedText editor
+        :param shown_note: Function returning the name of the note the editor shows, or None while it is loading
+        :param renamed: Function called with the old and new name when a note is renamed
+        :param replayed: Function called after an edit made elsewhere was replayed into the editor
+        """
+        self.editors[text] = (shown_note, renamed, replayed)
+        text.change_listeners.append(lambda record: self.mirror(text, record))
+
+    def remove(self, text):
+        self.editors.pop(text, None)
+
+    def peers(self, text, name):
+        """
+        :return: The other editors showing a note
+        """
+        if name is None:
+            return []
+        return [other for other, (shown_note, _, _) in self.editors.items()
+                if other is not text and shown_note() == name]
+
+    def text_of(self, name, exclude=None):
+        """
+        :param name: Note name
+        :param exclude: Editor to leave out
+        :return: Text of the note in another editor showing it, or None if there is none
+        """
+        for other in self.peers(exclude, name):
+            return other.get("1.0", "end-1c")
+        return None
+
+    def mirror(self, text, record):
+        """
+        Replays an edit into the other editors showing the same note
+        :param text: Editor the edit was made in
+        :param record: Edit reported by TracedText
+        """
+        if self.replaying or text not in self.editors:
+            return
+        peers = self.peers(text, self.editors[text][0]())
+        if not peers:
+            return
+
+        content = text.get("1.0", "end-1c") if record[0] == "text" else None
+        self.replaying = True
+        try:
+            for other in peers:
+                state = str(other.cget("state"))
+                modified = other.edit_modified()
+                # A peer may be read-only for a moment, e.g. while a paste streams into the main window
+                other.config(state=NORMAL)
+                if record[0] == "insert":
+                    other.insert(record[1], record[2])
+                elif record[0] == "delete":
+                    other.delete(record[1], record[2])
+                else:
+                    other.replace("1.0", "end-1c", content)
+                other.config(state=state)
+                other.edit_modified(modified)
+        finally:
+            self.replaying = False
+
+        for other in peers:
+            replayed = self.editors[other][2]
+            if replayed is not None:
+                replayed()
+
+    def loaded(self, text):
+        """
+        Brings the other editors showing a note in line with an editor that just loaded it
+        :param text: Editor that loaded the note
+        """
+        self.mirror(text, ["text", None])
+
+    def rename(self, old_name, new_name):
+        for _, renamed, _ in list(self.editors.values()):
+            if renamed is not None:
+                renamed(old_name, new_name)
+
+
+class NoteWindow(Toplevel):
+    """
+    Extra editor window for a single note, e.g. to compare two notes side by side. Uses the store, the note cache and
+    the I/O workers of the main window, so it needs no listing of its own and a note already open elsewhere is not
+    even read. EditorGroup keeps it in sync with the other windows showing the same note. Edits are saved once typing
+    pauses and when the window loses focus or closes. Large notes only open in the main window.
+    """
+    def __init__(self, main_window, name):
+        """
+        :param main_window: MainWindow owning the store
+        :param name: Note name
+        """
+        Toplevel.__init__(self, main_window)
+        self.main_window = main_window
+        self.store = main_window.store
+        self.name = name
+        self.loaded = False
+        self.dirty = False
+        self.closed = False
+        self.autosave_job = None
+
+        self.title(f"{APP_TITLE} - {name}")
+        self.configure(background=COLOR_BACKGROUND)
+        offset = 40 * (len(main_window.note_windows) % 8 + 1)
+        self.geometry(f"600x500+{main_window.winfo_rootx() + offset}+{main_window.winfo_rooty() + offset}")
+
+        self.status_text = StringVar()
+        Label(self, textvariable=self.status_text, bg=COLOR_BACKGROUND, fg=COLOR_TEXT).pack(fill=X, side=BOTTOM)
+        self.text = TracedText(self, bg=COLOR_BACKGROUND, fg=COLOR_TEXT, borderwidth=0, padx=5, pady=3, undo=True,
+                               autoseparators=True, spacing1=3, spacing2=0, spacing3=3)
+        self.text.pack(fill=BOTH, expand=True)
+        self.markup = MarkupHighlighter(self.text)
+        self.text.bind("<<Modified>>", self.on_modified)
+        self.bind("<FocusOut>", lambda event: self.save())
+        self.protocol("WM_DELETE_WINDOW", self.close)
+
+        main_window.editors.add(self.text, self.shown_note, self.note_renamed)
+        main_window.note_windows.append(self)
+        self.load()
+
+    def shown_note(self):
+        return self.name if self.loaded else None
+
+    def note_renamed(self, old_name, new_name):
+        if self.name == old_name:
+            self.name = new_name
+            self.title(f"{APP_TITLE} - {new_name}")
+
+    def load(self):
+        """
+        Shows the note, taken from another editor showing it or from the cache if possible
+        """
+        text = self.main_window.editors.text_of(self.name, self.text)
+        if text is None:
+            cached = self.store.cached(self.name)
+            text = None if cached is None else cached[1]
+        if text is not None:
+            self.show(text)
+            return
+
+        self.text.config(state=DISABLED)
+        self.status_text.set("Loading...")
+        self.main_window.io.submit(self.store.read, self.name, self.store.backend, callback=self.note_read,
+                                   error_callback=self.read_failed, discard=discard_note,
+                                   keys=(self.store.path(self.name),))
+
+    def note_read(self, result):
+        mtime, content = result
+        if self.closed or isinstance(content, LargeNote):
+            discard_note(result)
+            if not self.closed:
+                messagebox.showerror("Error Opening", f'"{self.name}" is too large for a separate window.')
+                self.close()
+            return
+
+        self.store.note_read(self.name, result)
+        # Another window may have opened the note meanwhile
+        text = self.main_window.editors.text_of(self.name, self.text)
+        self.show(content if text is None else text)
+
+    def read_failed(self, error):
+        if self.closed:
+            return
+        if isinstance(error, FileNotFoundError):
+            self.show("")
+        else:
+            messagebox.showerror("Error Opening", f'Could not read "{self.name}". {error}')
+            self.close()
+
+    def show(self, text):
+        self.text.config(state=NORMAL)
+        self.text.delete("1.0", END)
+        self.text.insert("1.0", text)
+        self.text.edit_reset()
+        self.text.edit_modified(False)
+        self.text.mark_set("insert", "1.0")
+        self.status_text.set("")
+        self.loaded = True
+
+    def on_modified(self, event):
+        if not self.text.edit_modified():
+            return
+        self.text.edit_modified(False)
+        if not self.loaded:
+            return
+
+        self.dirty = True
+        if self.autosave_job is not None:
+            self.after_cancel(self.autosave_job)
+        self.autosave_job = self.after(AUTOSAVE_DELAY, self.save)
+
+    def save(self):
+        """
+        Writes the note on the shared I/O workers if it was edited since it was loaded or last saved.
+        One write covers every window showing the note, as they all hold the same text. If the main window shows it
+        too, the main window saves it, so the save also covers the edits in its journal.
+        """
+        self.cancel_autosave()
+        if not self.dirty or not self.loaded:
+            return
+
+        main_window = self.main_window
+        main_window.note_windows_saved(self.name)
+        if main_window.note_loaded and main_window.note_file_name == self.name:
+            if not main_window.note_dirty:
+                main_window.note_dirty = True
+                main_window.dirty_since = time()
+            main_window.save_note()
+            return
+
+        name = self.name
+        text = self.text.get("1.0", "end-1c")
+        main_window.io.submit(self.store.write, name, text, self.store.backend,
+                              callback=lambda result: self.note_saved(name, text, result),
+                              error_callback=lambda error: self.save_failed(name, error),
+                              keys=(self.store.path(name),), label="Saving...")
+
+    def cancel_autosave(self):
+        if self.autosave_job is not None:
+            self.after_cancel(self.autosave_job)
+            self.autosave_job = None
+
+    def save_failed(self, name, error):
+        self.main_window.note_save_failed(name, error)
+        if not self.closed and self.name == name:
+            # Make sure the next save tries again
+            self.dirty = True
+
+    def note_saved(self, name, text, result):
+        self.main_window.note_saved(name, text, result)
+        if not self.closed:
+            self.status_text.set(f"Saved {name}")
+            self.after(1500, lambda: self.status_text.set(""))
+
+    def close(self):
+        self.save()
+        self.closed = True
+        self.main_window.editors.remove(self.text)
+        if self in self.main_window.note_windows:
+            self.main_window.note_windows.remove(self)
+        self.destroy()
+
+
+class MainWindow(Tk):
+    """
+    Main TK inter window definition
+    """
+    def __init__(self, profiler=None, instance=None):
+        """
+        :param profiler: StartupProfiler recording the startup phases. Profiling is off if not given.
+        :param instance: InstanceServer receiving requests from later launches, if any
+        """
+        Tk.__init__(self)
+        self.instance = instance
+        self.profiler = profiler or StartupProfiler()
+        self.profiler.mark("tk init")
+        # Startup is complete once the last open note is shown and the note folder is listed
+        self.startup_pending = {"note shown", "note list"}
+
+        self.protocol("WM_DELETE_WINDOW", self.dismiss)
+        self.bind("<FocusOut>", self.on_focus_out)
+        self.bind("<Control-p>", self.show_quick_open)
+        self.bind("<Control-b>", self.back_up_notes)
+
+        self.title(APP_TITLE)
+        self.minsize(300, 300)
+        self.configure(background=COLOR_BACKGROUND)
+
+        # Images are decoded in load_images() after the first paint. Until then buttons show this blank one.
+        self.blank_image = PhotoImage(width=26, height=26)
+        self.icon_image = None
+        self.prev_btn_image = self.blank_image
+        self.next_btn_image = self.blank_image
+        self.show_list_image = self.blank_image
+        self.hide_list_image = self.blank_image
+        self.browse_image = self.blank_image
+        self.new_note_image = self.blank_image
+        self.del_image = self.blank_image
+
+        self.x = 200
+        self.y = 200
+        self.width = 300
+        self.height = 300
+        self.offset_x = 6
+        self.offset_y = 29
+        self.note_listbox = None
+        self.file_list_width = 177
+
+        self.note_file_name = None
+        self.note_watcher = None
+        self.search_index = SearchIndex(search_index_path)
+        self.storage = STORAGE_FOLDER
+        self.notes_dir = default_notes_dir
+        self.notes_db = default_notes_db
+        self.history = NoteHistory(history_path)
+        self.store = NoteStore(FolderBackend(self.notes_dir), self.search_index, history=self.history)
+        self.search_results = None
+        self.search_job = None
+        self.note_tree = NoteTree()
+        self.revealed_note = None
+        self.name_index = NameIndex()
+        self.name_index_generation = None
+        self.io = IOExecutor(self, busy_callback=self.show_io_status)
+        self.io_status = None
+        self.session_note = None
+        self.journal = EditJournal(journal_path)
+        self.backup = NoteBackup(default_backup_dir)
+        self.journal_job = None
+        self.pending_insert = None
+        self.insert_job = None
+
+        self.show_note_list_flag = True
+        self.note_dirty = False
+        self.dirty_since = 0
+        self.autosave_job = None
+        self.note_loaded = False
+        self.large_note = None
+        self.large_window = (0, -1)
+        self.large_check_job = None
+        self.large_saving = False
+        self.large_save_again = False
+
+        self.frame_note_editor = Frame(self, bg=COLOR_BACKGROUND)
+        self.frame_note_editor.pack(fill=BOTH, side=RIGHT, expand=YES)
+
+        self.frame_btn = Frame(self.frame_note_editor, bg=COLOR_BACKGROUND)
+        self.frame_btn.pack(fill=X, side=TOP)
+
+        self.frame_note_list = Frame(self, bg=COLOR_BACKGROUND)
+        self.frame_note_list.pack(side=LEFT, fill=Y)
+
+        self.search_text = StringVar()
+        self.search_entry = Entry(self.frame_note_list, textvariable=self.search_text, bg=COLOR_BACKGROUND,
+                                  fg=COLOR_TEXT, bd=1, relief='solid')
+        self.search_entry.pack(side=TOP, fill=X, padx=1, pady=2)
+        self.search_entry.bind("<KeyRelease>", self.on_search_changed)
+        self.search_entry.bind("<Escape>", self.clear_search)
+
+        self.scrollbar = AutoScrollbar(self.frame_note_list)
+        if self.scrollbar.visible:
+            self.scrollbar.pack(side=LEFT, fill=Y)
+
+        self.note_list = NoteList(self.frame_note_list, self.scrollbar, bg=COLOR_BACKGROUND, fg=COLOR_TEXT, bd=0,
+                                  selectmode=EXTENDED)
+        self.note_listbox = self.note_list.listbox
+        self.note_listbox.pack(side=LEFT, fill=Y, expand=YES)
+        self.note_listbox.bind("<<ListboxSelect>>", self.file_selected)
+        self.note_listbox.bind("<Double-1>", self.edit_name)
+        self.note_listbox.bind("<Control-h>", self.show_history)
+        self.note_listbox.bind("<Control-a>", self.select_all_notes)
+        self.note_listbox.bind("<Delete>", lambda event: self.delete_selected())
+        self.note_listbox.bind("<Control-m>", lambda event: self.move_selected())
+        self.note_listbox.bind("<F2>", lambda event: self.rename_selected())
+        self.note_listbox.bind("<Button-3>", self.show_list_menu)
+        self.note_listbox.bind("<Control-Return>", self.open_note_windows)
+
+        self.list_menu = Menu(self, tearoff=0, bg=COLOR_BACKGROUND, fg=COLOR_TEXT)
+        self.list_menu.add_command(label="Open in new window", accelerator="Ctrl+Enter",
+                                   command=self.open_note_windows)
+        self.list_menu.add_command(label="Delete", accelerator="Delete", command=self.delete_selected)
+        self.list_menu.add_command(label="Move to folder...", accelerator="Ctrl+M", command=self.move_selected)
+        self.list_menu.add_command(label="Rename with pattern...", accelerator="F2", command=self.rename_selected)
+        self.list_menu.add_command(label="Select all", accelerator="Ctrl+A", command=self.select_all_notes)
+        self.list_menu.add_separator()
+        self.sort_mode = StringVar(value=SORT_NAME)
+        for sort_mode, label in ((SORT_NAME, "Sort by name"), (SORT_MODIFIED, "Sort by last edit"),
+                                 (SORT_SIZE, "Sort by size"), (SORT_CREATED, "Sort by creation")):
+            self.list_menu.add_radiobutton(label=label, value=sort_mode, variable=self.sort_mode,
+                                           command=self.sort_mode_changed)
+        self.bulk_progress = None
+
+        self.btn_prev = Button(self.frame_btn, bg=COLOR_BACKGROUND, fg=COLOR_TEXT, image=self.blank_image,
+                               command=self.show_previous, width=26, height=26, pady=0, borderwidth=0)
+        self.btn_prev.pack(side=LEFT, padx=1)
+
+        self.btn_next = Button(self.frame_btn, bg=COLOR_BACKGROUND, fg=COLOR_TEXT, image=self.blank_image,
+                               command=self.show_next, width=26, height=26, pady=0, borderwidth=0)
+        self.btn_next.pack(side=LEFT, padx=1)
+
+        self.btn_show_list = Button(self.frame_btn, bg=COLOR_BACKGROUND, fg=COLOR_TEXT, image=self.blank_image,
+                                    width=26, height=26, borderwidth=0)
+        self.btn_show_list.pack(side=LEFT, padx=1)
+        self.btn_show_list.bind('<Button-1>', self.show_hide_note_list)
+        self.btn_show_list.bind('<ButtonRelease-1>', self.fix_offset)
+
+        self.btn_browse = Button(self.frame_btn, bg=COLOR_BACKGROUND, fg=COLOR_TEXT, image=self.blank_image,
+                                 command=self.select_notes_dir, width=26, height=26, borderwidth=0)
+        self.btn_browse.pack(side=LEFT, padx=1)
+
+        self.btn_new = Button(self.frame_btn, bg=COLOR_BACKGROUND, fg=COLOR_TEXT, image=self.blank_image,
+                              command=self.new_note, width=26, height=26, borderwidth=0)
+        self.btn_new.pack(side=LEFT, padx=1)
+
+        self.btn_delete = Button(self.frame_btn, bg=COLOR_BACKGROUND, fg=COLOR_TEXT, image=self.blank_image,
+                                 command=self.delete_note, width=26, height=26, pady=0, borderwidth=0)
+        self.btn_delete.pack(side=RIGHT, padx=20)
+
+        self.display_text = TracedText(self.frame_note_editor, bg=COLOR_BACKGROUND, fg=COLOR_TEXT, borderwidth=0,
+                                       padx=5, pady=3, undo=True, autoseparators=True, maxundo=-1, spacing1=3,
+                                       spacing2=0, spacing3=3)
+        self.display_text.pack(padx=0, pady=0, fill=BOTH, expand=True)
+        self.display_text.bind("<<Paste>>", self.custom_paste)
+        self.display_text.bind("<Escape>", self.cancel_insert)
+        self.display_text.bind("<<Modified>>", self.on_text_modified)
+        self.display_text.bind("<Control-h>", self.show_history)
+        self.display_text.bind("<Control-p>", self.show_quick_open)
+        self.display_text.bind("<Control-b>", self.back_up_notes)
+        self.display_text.bind("<Control-f>", lambda event: self.find_bar.show())
+        self.display_text.bind("<Control-r>", lambda event: self.find_bar.show(replace=True))
+        self.display_text.bind("<F3>", lambda event: self.find_bar.find_next())
+        self.display_text.bind("<Shift-F3>", lambda event: self.find_bar.find_next(-1))
+        self.display_text.config(yscrollcommand=self.on_text_scroll)
+
+        self.status_text = StringVar()
+        self.status_text.set("")
+        self.status_bar = Label(self.frame_note_editor, textvariable=self.status_text, bg=COLOR_BACKGROUND, fg=COLOR_TEXT)
+        self.status_bar.pack(fill=X, side=BOTTOM)
+        self.markup = MarkupHighlighter(self.display_text)
+        self.find_bar = FindBar(self)
+        self.editors = EditorGroup()
+        self.editors.add(self.display_text, lambda: self.note_file_name if self.note_loaded else None,
+                         self.editor_renamed, self.find_bar.text_changed)
+        self.note_windows = []
+
+        self.trace_text = StringVar()
+        self.trace_label = Label(self.status_bar, textvariable=self.trace_text, bg=COLOR_BACKGROUND, fg=COLOR_TEXT)
+        if tracer.overlay:
+            self.trace_label.place(relx=1.0, rely=0.5, anchor="e")
+            self.update_trace_overlay()
+        self.profiler.mark("widgets")
+
+        self.read_cfg()
+        self.recover_journal()
+        self.profiler.mark("config")
+        if self.note_file_name is not None or self.store.index.names:
+            # Show the last open note right away, from the session snapshot if possible.
+            # The note folder is listed after the first paint.
+            self.read_note()
+        self.process_watch_events()
+        if self.instance is not None:
+            self.process_instance_requests()
+
+        self.focus_force()
+
+        # Check if note list window should be shown
+        if not self.show_note_list_flag:
+            self.frame_note_list.pack_forget()
+
+        self.after_idle(self.finish_startup)
+
+    def finish_startup(self):
+        """
+        Second stage of startup, run once the window has been painted: decodes images, attaches tooltips,
+        starts the folder watcher and lists the note folder in the background
+        """
+        self.profiler.mark("first paint")
+        self.load_images()
+        self.profiler.mark("images")
+        self.io.submit(self.store.scan, callback=self.startup_listed, channel="scan")
+        self.start_watcher()
+        self.profiler.mark("watcher")
+
+    def startup_listed(self, result):
+        self.store.apply_scan(result)
+        self.search_index.sync_in_background(self.store.backend, self.store.index.entries)
+        self.sync_name_index(background=True)
+        self.startup_step("note list")
+        name = self.note_file_name
+        if name is None:
+            # No note was open last time, or it is gone. Show the first one.
+            self.read_note()
+            return
+
+        self.update_title()
+        self.refresh_note_list()
+        self.prefetch_neighbours(name)
+
+        if name == self.session_note and not self.note_dirty:
+            # The open note was shown from the session snapshot. Check it against the folder.
+            entry = self.store.index.entries.get(name)
+            if entry is None:
+                # Gone since the last session. Reading it reports that.
+                self.read_note()
+            elif not self.store.cache.contains(name, entry[1]):
+                self.reload_note()
+        self.session_note = None
+
+    def startup_step(self, phase):
+        """
+        Marks one of the phases in startup_pending as done and prints the startup profile after the last one
+        :param phase: Phase name
+        """
+        if phase not in self.startup_pending:
+            return
+
+        self.startup_pending.remove(phase)
+        self.profiler.mark(phase)
+        if not self.startup_pending:
+            self.profiler.report()
+
+    def load_images(self):
+        """
+        Decodes the window icon and button images and attaches the tooltips
+        """
+        self.icon_image = PhotoImage(data=IMG_ICON)
+        self.iconphoto(False, self.icon_image)
+
+        self.prev_btn_image = PhotoImage(data=IMG_BTN_PREV)
+        self.next_btn_image = PhotoImage(data=IMG_BTN_NEXT)
+        self.show_list_image = PhotoImage(data=IMG_BTN_SHOW)
+        self.hide_list_image = PhotoImage(data=IMG_BTN_HIDE)
+        self.browse_image = PhotoImage(data=IMG_BTN_BROWSE)
+        self.new_note_image = PhotoImage(data=IMG_BTN_NEW)
+        self.del_image = PhotoImage(data=IMG_BTN_DELETE)
+
+        self.btn_prev.config(image=self.prev_btn_image)
+        self.btn_next.config(image=self.next_btn_image)
+        if self.show_note_list_flag:
+            self.btn_show_list.config(image=self.hide_list_image)
+        else:
+            self.btn_show_list.config(image=self.show_list_image)
+        self.btn_browse.config(image=self.browse_image)
+        self.btn_new.config(image=self.new_note_image)
+        self.btn_delete.config(image=self.del_image)
+
+        CreateToolTip(self.search_entry, "Search Notes")
+        CreateToolTip(self.btn_prev, "Previous")
+        CreateToolTip(self.btn_next, "Next")
+        CreateToolTip(self.btn_show_list, "Show/Hide Note List")
+        CreateToolTip(self.btn_browse, "Select Notes Folder")
+        CreateToolTip(self.btn_new, "New Note")
+
+    def process_instance_requests(self):
+        """
+        Carries out the requests forwarded by later launches of the app. Reschedules itself on the Tk main loop.
+        """
+        self.after(INSTANCE_POLL_INTERVAL, self.process_instance_requests)
+        for request in self.instance.take_requests():
+            self.handle_request(request)
+
+    def handle_request(self, request):
+        """
+        Carries out a launch request, see InstanceServer
+        :param request: Dictionary with the command and its arguments
+        """
+        command = request.get("command")
+        if command == "open" and request.get("note"):
+            name = request["note"]
+            if not is_valid_note_name(name):
+                print(f"ERROR: Invalid note name {name}")
+                messagebox.showerror("Error Opening", f'"{name}" is not a valid note name.')
+                return
+            self.open_note(name)
+        elif command == "new":
+            self.new_note()
+        elif command != "raise":
+            print(f"ERROR: Unknown request {request}")
+            return
+
+        self.deiconify()
+        self.lift()
+        self.focus_force()
+
+    def start_watcher(self):
+        """
+        (Re)starts watching the current notes folder for changes made by other programs
+        """
+        if self.note_watcher is not None:
+            self.note_watcher.stop()
+            self.note_watcher = None
+
+        if self.store.backend.watchable and os.path.isdir(self.store.location):
+            self.note_watcher = NoteWatcher(self.store.location)
+            self.note_watcher.start()
+
+    def process_watch_events(self):
+        """
+        Picks up the batch of folder changes collected by the watcher and stats the changed notes in the
+        background. Reschedules itself on the Tk main loop.
+        """
+        self.after(WATCH_DISPATCH_INTERVAL, self.process_watch_events)
+        if self.note_watcher is None:
+            return
+
+        changed, overflow = self.note_watcher.take_changes()
+        if overflow:
+            self.store.index.invalidate()
+            self.list_notes()
+        elif changed:
+            self.io.submit(self.store.index.stat_notes, changed, callback=self.apply_note_changes)
+
+    def apply_note_changes(self, result):
+        """
+        Applies changed note stats to the note index, the note list and the open note
+        :param result: Value returned by NoteIndex.stat_notes()
+        """
+        changes = self.store.index.apply_stats(result)
+        if not changes:
+            return
+
+        for name, old_entry, new_entry, old_position in changes:
+            self.store.cache.discard(name)
+            if name == self.note_file_name and old_entry is not None and new_entry is not None:
+                self.reload_note()
+
+        self.search_index.sync_in_background(self.store.backend, self.store.index.entries)
+        if self.search_results is not None:
+            self.run_search()
+        else:
+            self.refresh_note_list()
+
+    def reload_note(self):
+        """
+        Re-reads the open note in the background after it was changed on disk
+        """
+        name = self.note_file_name
+        path = self.store.path(name)
+        if path in self.io.lanes:
+            # The app itself is writing this note
+            return
+
+        self.io.submit(self.store.read, name, self.store.backend,
+                       callback=lambda result: self.show_reloaded_note(name, result),
+                       discard=discard_note, keys=(path,), channel="read")
+
+    def show_reloaded_note(self, name, result):
+        """
+        Replaces the open note with the content found on disk, unless it has unsaved edits
+        :param name: Note file name that was read
+        :param result: Value returned by NoteStore.read()
+        """
+        if name != self.note_file_name:
+            discard_note(result)
+            return
+
+        if self.large_note is not None:
+            self.sync_large_chunks()
+            if self.note_dirty or self.large_note.modified:
+                discard_note(result)
+                self.set_status(f"{name} changed on disk. Keeping your edits.")
+                return
+            self.show_note(name, result)
+            self.set_status(f"Reloaded {name}")
+            return
+
+        if isinstance(result[1], LargeNote):
+            self.show_note(name, result)
+            return
+
+        if self.note_dirty:
+            self.set_status(f"{name} changed on disk. Keeping your edits.")
+            return
+
+        if result[1] == self.display_text.get("1.0", END)[:-1]:
+            self.store.note_read(name, result)
+            return
+
+        cursor = self.display_text.index("insert")
+        view = self.display_text.yview()[0]
+
+        def restore_view():
+            self.display_text.mark_set("insert", cursor)
+            self.display_text.yview_moveto(view)
+            self.set_status(f"Reloaded {name}")
+
+        self.show_note(name, result, on_shown=restore_view)
+
+    def show_large_note(self, large_note):
+        """
+        Shows a note of MAX_FILE_SIZE or more by loading only the chunks around the viewport
+        :param large_note: Opened LargeNote
+        """
+        self.close_large_note()
+        self.note_loaded = False
+        self.display_text.delete(1.0, END)
+        self.large_note = large_note
+        self.large_window = (0, -1)
+        for index in range(min(2, self.large_note.chunk_count)):
+            self.load_large_chunk(index, at_end=True)
+        self.display_text.mark_set("insert", "1.0")
+        self.display_text.edit_reset()
+        self.reset_modified()
+        self.set_status(f"Large note: {self.large_note.chunk_count} chunks, loaded while scrolling")
+
+    def close_large_note(self):
+        """
+        Releases the open large note. Closing is queued behind any pending save of the same file.
+        """
+        if self.large_note is not None:
+            self.io.submit(self.large_note.close, keys=(self.large_note.path,))
+            self.large_note = None
+            self.large_window = (0, -1)
+            self.large_save_again = False
+
+    def load_large_chunk(self, index, at_end):
+        """
+        Inserts one chunk of the large note at the top or bottom of the editor.
+        Each loaded chunk starts at a mark named chunk<index>, so it can be cut out again later.
+        :param index: Chunk number
+        :param at_end: True to append the chunk, False to insert it before the first loaded one
+        """
+        first, last = self.large_window
+        text = self.large_note.chunk_text(index)
+        if at_end:
+            position = self.display_text.index("end-1c")
+            self.display_text.insert(position, text)
+            self.large_window = (index if last < first else first, index)
+        else:
+            position = "1.0"
+            self.display_text.mark_gravity(f"chunk{first}", "right")
+            self.display_text.insert(position, text)
+            self.display_text.mark_gravity(f"chunk{first}", "left")
+            self.large_window = (index, last)
+        self.display_text.mark_set(f"chunk{index}", position)
+        self.display_text.mark_gravity(f"chunk{index}", "left")
+        if not self.large_note.editable(index):
+            self.warn_invalid_chunk(index)
+
+    def large_chunk_range(self, index):
+        first, last = self.large_window
+        end = f"chunk{index + 1}" if index < last else "end-1c"
+        return f"chunk{index}", end
+
+    def unload_large_chunk(self, at_end):
+        """
+        Removes the first or the last loaded chunk from the editor, keeping its edits in the LargeNote
+        :param at_end: True to remove the last chunk, False to remove the first one
+        """
+        first, last = self.large_window
+        index = last if at_end else first
+        start, end = self.large_chunk_range(index)
+        self.keep_large_chunk(index, start, end)
+        self.display_text.delete(start if at_end else "1.0", end)
+        self.display_text.mark_unset(f"chunk{index}")
+        self.large_window = (first, last - 1) if at_end else (first + 1, last)
+
+    def sync_large_chunks(self):
+        """
+        Copies the text of all loaded chunks from the editor into the LargeNote
+        """
+        first, last = self.large_window
+        for index in range(first, last + 1):
+            start, end = self.large_chunk_range(index)
+            self.keep_large_chunk(index, start, end)
+
+    def keep_large_chunk(self, index, start, end):
+        """
+        Copies the text of a loaded chunk from the editor into the LargeNote
+        :param index: Chunk number
+        :param start: Editor index where the chunk starts
+        :param end: Editor index where the chunk ends
+        """
+        if not self.large_note.set_chunk_text(index, self.display_text.get(start, end)):
+            self.warn_invalid_chunk(index)
+
+    def warn_invalid_chunk(self, index):
+        self.set_status(f"Part {index + 1} of this note is not valid UTF-8. Edits to it are not saved.")
+
+    def on_text_scroll(self, lo, hi):
+        if self.large_note is not None and self.large_check_job is None:
+            self.large_check_job = self.after_idle(self.check_large_window)
+
+    def check_large_window(self):
+        """
+        Loads the next chunk when the view gets close to either end of the loaded part of a large note and drops
+        the chunk furthest away, so no more than LARGE_NOTE_WINDOW chunks are held in the editor.
+        """
+        self.large_check_job = None
+        if self.large_note is None:
+            return
+        if self.large_saving:
+            # The file is being rewritten. Try again once that is done.
+            self.large_check_job = self.after(100, self.check_large_window)
+            return
+
+        lo, hi = self.display_text.yview()
+        first, last = self.large_window
+        self.display_text.mark_set("large_view", "@0,0")
+
+        if hi >= 0.85 and last < self.large_note.chunk_count - 1:
+            self.load_large_chunk(last + 1, at_end=True)
+            if last + 2 - first > LARGE_NOTE_WINDOW:
+                self.unload_large_chunk(at_end=False)
+        elif lo <= 0.15 and first > 0:
+            self.load_large_chunk(first - 1, at_end=False)
+            if last + 2 - first > LARGE_NOTE_WINDOW:
+                self.unload_large_chunk(at_end=True)
+        else:
+            return
+
+        self.display_text.yview("large_view")
+        self.display_text.edit_reset()
+        # Loading chunks is not an edit. Pending user edits already set note_dirty.
+        self.display_text.edit_modified(False)
+
+    def save_large_note(self):
+        """
+        Saves the edited chunks of the open large note in the background
+        """
+        if self.large_saving:
+            self.large_save_again = True
+            return
+
+        self.sync_large_chunks()
+        if not self.large_note.modified:
+            return
+
+        name = self.note_file_name
+        large_note = self.large_note
+        self.large_saving = True
+        self.io.submit(self.store.write_large, large_note, name, self.store.backend,
+                       callback=lambda result: self.large_note_saved(large_note, name, result),
+                       error_callback=lambda error: self.large_note_saved(large_note, name, None, error),
+                       keys=(large_note.path,), label="Saving...")
+
+    def large_note_saved(self, large_note, name, result, error=None):
+        self.large_saving = False
+        if error is not None:
+            print(f"ERROR: Could not save {name}. {error}")
+            self.set_status(f"Could not save {name}")
+            if large_note is self.large_note:
+                self.note_dirty = True
+        else:
+            self.store.note_written(name, None, result)
+            self.set_status(f"Saved {name}")
+
+        if self.large_save_again and large_note is self.large_note:
+            self.large_save_again = False
+            self.save_large_note()
+
+    def update_trace_overlay(self):
+        """
+        Shows the latency of the last traced operation in the corner of the status bar. Reschedules itself.
+        """
+        self.after(TRACE_OVERLAY_INTERVAL, self.update_trace_overlay)
+        if tracer.last is not None:
+            name, duration = tracer.last
+            self.trace_text.set(f"{name} {duration * 1000:.1f} ms")
+
+    def show_io_status(self, label):
+        """
+        Shows the label of the pending background I/O in the status bar and clears it once all I/O is done
+        :param label: Status text like "Saving..." or None when idle
+        """
+        if label is not None:
+            self.status_text.set(label)
+        elif self.io_status is not None and self.status_text.get() == self.io_status:
+            self.clear_status()
+        self.io_status = label
+
+    def begin_journal(self, name, text):
+        """
+        Starts journaling the edits of the note just put into the editor
+        :param name: Note file name
+        :param text: Note text in the editor
+        """
+        self.journal.begin(self.store.location, name, text)
+        self.display_text.edit_listener = self.journal_edit
+
+    def end_journal(self):
+        self.display_text.edit_listener = None
+        self.journal.end()
+
+    def journal_edit(self, record):
+        """
+        Buffers an edit of the open note in the journal. Edits are flushed to disk together every
+        JOURNAL_COMMIT_INTERVAL.
+        :param record: Edit reported by the editor
+        """
+        if self.journal.record(record) and self.journal_job is None:
+            self.journal_job = self.after(JOURNAL_COMMIT_INTERVAL, self.commit_journal)
+
+    def commit_journal(self):
+        self.journal_job = None
+        self.io.submit(self.journal.commit)
+
+    def recover_journal(self):
+        """
+        Saves the edits journaled by a session that ended before saving them, e.g. after a crash, and opens the
+        note they belong to
+        """
+        try:
+            recovered, other_storage = self.journal.recover(self.store.backend)
+        except (OSError, sqlite3.Error) as e:
+            print(f"ERROR: Could not recover unsaved edits. {e}")
+            recovered, other_storage = {}, True
+
+        failed = other_storage
+        for name, text in recovered.items():
+            try:
+                self.store.save(name, text)
+            except (OSError, sqlite3.Error) as e:
+                print(f"ERROR: Could not save the recovered edits of {name}. {e}")
+                failed = True
+                continue
+            print(f"INFO: Recovered unsaved edits of {name}")
+            self.note_file_name = name
+            self.set_status(f"Recovered unsaved edits of {name}")
+
+        try:
+            if failed:
+                aside_path = self.journal.set_aside()
+                print(f"ERROR: Some unsaved edits could not be recovered. They are kept in {aside_path}")
+            else:
+                self.journal.compact()
+        except OSError as e:
+            print(f"ERROR: Could not reset the edit journal. {e}")
+
+    def on_text_modified(self, event):
+        """
+        Marks the open note dirty and restarts the autosave timer.
+        The modified flag is reset right away, so every edit produces a new <<Modified>> event and the save
+        waits for a pause in typing. Continuous typing is still saved every AUTOSAVE_MAX_DELAY.
+        :param event: Unused dummy variable
+        """
+        if not self.display_text.edit_modified():
+            return
+        self.display_text.edit_modified(False)
+        self.find_bar.text_changed()
+        if self.pending_insert is not None and not self.pending_insert["undoable"]:
+            # Loading a note is not an edit
+            return
+
+        if not self.note_dirty:
+            self.note_dirty = True
+            self.dirty_since = time()
+
+        if self.autosave_job is not None:
+            self.after_cancel(self.autosave_job)
+        waited = int((time() - self.dirty_since) * 1000)
+        delay = max(0, min(AUTOSAVE_DELAY, AUTOSAVE_MAX_DELAY - waited))
+        self.autosave_job = self.after(delay, self.autosave)
+
+    def autosave(self):
+        self.autosave_job = None
+        if self.pending_insert is None:
+            # A paste still streaming in is saved once it is complete
+            self.save_note()
+
+    def reset_modified(self):
+        """
+        Marks the editor content as matching the file, after the app itself replaced it. Clears the undo history, so
+        undoing cannot bring back the text of the note shown before.
+        """
+        self.display_text.edit_reset()
+        self.display_text.edit_modified(False)
+        self.note_dirty = False
+        if self.autosave_job is not None:
+            self.after_cancel(self.autosave_job)
+            self.autosave_job = None
+
+    def on_focus_out(self, event):
+        if self.pending_insert is None:
+            self.save_note()
+
+    def clear_status(self):
+        self.status_text.set("")
+
+    def set_status(self, message):
+        self.status_text.set(message)
+        self.after(1500, self.clear_status)
+
+    def edit_name(self, event):
+        """
+        Edit note file name
+        :param event: Unused dummy variable
+        :return:
+        """
+        selection = self.note_listbox.curselection()
+        if selection and self.note_tree.is_folder(self.note_list.item_at(selection[0])):
+            return
+
+        if self.note_file_name is not None:
+            new_name = simpledialog.askstring(
+                title="Change Note Name",
+                prompt="New note name (use / to move it into a folder):",
+                initialvalue=self.note_file_name
+            )
+            if new_name is not None:
+                self.list_notes()
+                old_name = self.note_file_name
+                if not is_valid_note_name(new_name):
+                    messagebox.showerror("Error Renaming", f'"{new_name}" is not a valid note name.')
+                elif new_name in self.store.index.entries:
+                    self.show_rename_error(old_name, new_name)
+                else:
+                    self.save_note_windows()
+                    self.io.submit(self.store.rename_file, old_name, new_name, self.store.backend,
+                                   callback=self.store.note_renamed,
+                                   error_callback=lambda error: self.note_rename_failed(old_name, new_name, error),
+                                   keys=(self.store.path(old_name), self.store.path(new_name)), label="Renaming...")
+                    self.store.begin_rename(old_name, new_name)
+                    self.journal.rename(self.store.location, old_name, new_name)
+                    self.io.submit(self.journal.compact)
+                    self.editors.rename(old_name, new_name)
+                    self.refresh_note_list()
+
+    def note_rename_failed(self, old_name, new_name, error):
+        self.editors.rename(new_name, old_name)
+        self.store.rename_failed(old_name, new_name)
+        self.journal.rename(self.store.location, new_name, old_name)
+        self.io.submit(self.journal.compact)
+        self.refresh_note_list()
+        if isinstance(error, FileExistsError):
+            self.show_rename_error(old_name, new_name)
+        else:
+            messagebox.showerror("Error Renaming", f'Could not rename "{old_name}" to "{new_name}". {error}')
+
+    def show_rename_error(self, old_name, new_name):
+        messagebox.showerror(
+            "Error Renaming",
+            f'Could not rename "{old_name}" to "{new_name}" '
+            f'because a file with same name already exists!'
+        )
+
+    def show_history(self, event=None):
+        """
+        Opens the version history of the current note
+        """
+        if self.large_note is not None:
+            self.set_status("No history is kept for large notes")
+        elif self.note_file_name is not None:
+            self.save_note()
+            HistoryBrowser(self, self.note_file_name)
+        return "break"
+
+    def restore_version(self, name, location, text):
+        """
+        Replaces the editor content with a version from the history. The change is saved like any other edit
+        and can be undone.
+        :param name: Note file name the version belongs to
+        :param location: Notes folder or database the note is in
+        :param text: Text of the version
+        :return: True if the version was restored
+        """
+        if name != self.note_file_name or location != self.store.location or self.large_note is not None:
+            messagebox.showerror("Error Restoring", f'"{name}" is no longer the open note.')
+            return False
+
+        self.display_text.edit_separator()
+        self.display_text.delete("1.0", END)
+        self.display_text.insert("1.0", text)
+        self.display_text.edit_separator()
+        self.set_status(f"Restored an earlier version of {name}")
+        return True
+
+    def refresh_note_list(self):
+        """
+        Updates the note list from the cached note index, or from the search results while a search is active.
+        Does not touch the file system.
+        """
+        with tracer.span("list.refresh"):
+            index = self.store.index
+            if self.search_results is None and index.sort_mode == SORT_NAME:
+                if self.note_file_name != self.revealed_note:
+                    # Show a note opened from elsewhere, but let the user collapse its folder afterwards
+                    self.revealed_note = self.note_file_name
+                    if self.note_file_name is not None:
+                        self.note_tree.reveal(self.note_file_name)
+                self.note_list.set_items(self.note_tree.rows(index.names, index.generation), self.note_tree.label)
+            elif self.search_results is None:
+                # Sorted by stats the notes of all folders are mixed, so they are shown as a flat list
+                self.note_list.set_items(index.order)
+            else:
+                # Search results are a flat list of full note names
+                self.note_list.set_items(self.search_results)
+            self.note_list.select(self.note_file_name)
+
+    def on_search_changed(self, event):
+        """
+        Filters the note list as the user types, once typing pauses for SEARCH_DELAY
+        :param event: Unused dummy variable
+        """
+        if self.search_job is not None:
+            self.after_cancel(self.search_job)
+        self.search_job = self.after(SEARCH_DELAY, self.run_search)
+
+    def run_search(self):
+        self.search_job = None
+        query = self.search_text.get()
+        if query.strip():
+            self.search_results = self.search_index.search(query)
+        else:
+            self.search_results = None
+        self.refresh_note_list()
+
+    def sync_name_index(self, background=False):
+        """
+        Brings the quick-open name index up to date with the note list, if the list changed since the last sync
+        :param background: Sync on an IO worker, for the first and possibly slow sync of a notes storage
+        """
+        generation = self.store.index.generation
+        if generation == self.name_index_generation:
+            return
+
+        self.name_index_generation = generation
+        entries = dict(self.store.index.entries)
+        if background:
+            self.io.submit(self.name_index.sync, entries)
+        else:
+            self.name_index.sync(entries)
+
+    def show_quick_open(self, event=None):
+        self.list_notes()
+        self.sync_name_index()
+        QuickOpen(self)
+        return "break"
+
+    def clear_search(self, event=None):
+        self.search_text.set("")
+        self.run_search()
+
+    def file_selected(self, event):
+        selection = event.widget.curselection()
+        if len(selection) > 1:
+            # Picking notes for a bulk operation
+            self.note_list.update_marks(selection)
+            self.set_status(f"{len(self.note_list.marked)} selected. Right-click for bulk actions.")
+            return
+
+        if selection:
+            self.note_list.mark(())
+            item = self.note_list.item_at(selection[0])
+            if self.note_tree.is_folder(item):
+                # Only an expanded folder has its notes listed
+                self.note_tree.toggle(item)
+                self.refresh_note_list()
+                self.note_list.relabel(item)
+                return
+
+            self.save_note()
+            self.note_file_name = item
+            self.list_notes()
+            self.read_note()
+
+    def fix_offset(self, event):
+        self.offset_x = self.winfo_x() - self.x
+        self.offset_y = self.winfo_y() - self.y
+
+    def show_hide_note_list(self, event):
+        self.y = self.winfo_y() - self.offset_y
+        self.x = self.winfo_x() - self.offset_x
+        self.width = self.winfo_width()
+        self.height = self.winfo_height()
+
+        if self.show_note_list_flag:
+            self.show_note_list_flag = False
+            self.file_list_width = self.frame_note_list.winfo_width()
+            list_width = -self.file_list_width
+            self.frame_note_list.pack_forget()
+            self.btn_show_list.config(image=self.show_list_image)
+        else:
+            self.show_note_list_flag = True
+            self.frame_note_list.pack(side=LEFT, fill=Y)
+            self.btn_show_list.config(image=self.hide_list_image)
+            list_width = self.file_list_width
+
+        self.width += list_width
+        self.x -= list_width
+        self.geometry(f"{self.width}x{self.height}+{self.x}+{self.y}")
+
+    def set_title(self, new_title):
+        """
+        Sets the main window title
+        :param new_title: The new string to append to the application main title
+        """
+        self.title(f"{APP_TITLE} - {new_title}")
+
+    def update_title(self):
+        """
+        Shows the position of the current note in the window title, or "New" if it is not in the note folder
+        """
+        note_index = "New"
+        position = self.store.index.position(self.note_file_name)
+        if position is not None:
+            note_index = f"{position + 1}/{len(self.store.index.names)}"
+        self.set_title(note_index)
+
+    def custom_paste(self, event):
+        """
+        By default, the Text widget will perform an insert, ignoring the selected content.
+        This function deletes the selected content so we can paste over selected.
+        :param event: Detected event
+        :return: "break" message to TK Inter
+        """
+        try:
+            event.widget.delete("sel.first", "sel.last")
+        except:
+            pass
+        self.insert_chunked("insert", event.widget.clipboard_get())
+        return "break"
+
+    def insert_chunked(self, index, text, undoable=True, on_done=None):
+        """
+        Inserts text into the editor. Text longer than INSERT_CHUNK is streamed in over idle callbacks, so the
+        window stays responsive: meanwhile the editor is read-only, the status bar shows the progress and Esc
+        cancels a paste. A streamed paste is undone in a single step.
+        :param index: Text widget index to insert at
+        :param text: Text to insert
+        :param undoable: False when the editor is loaded with a note rather than edited. Loading cannot be cancelled.
+        :param on_done: Called without arguments once all of the text is inserted
+        """
+        self.stop_insert()
+        if len(text) <= INSERT_CHUNK:
+            self.display_text.insert(index, text)
+            if on_done is not None:
+                on_done()
+            return
+
+        self.display_text.mark_set("stream_start", index)
+        self.display_text.mark_gravity("stream_start", "left")
+        self.display_text.mark_set("stream_end", index)
+        self.display_text.mark_gravity("stream_end", "right")
+        if undoable:
+            self.display_text.edit_separator()
+        # Chunks inserted without separators in between are undone together
+        self.display_text.config(autoseparators=False, state=DISABLED)
+        self.pending_insert = {"text": text, "position": 0, "undoable": undoable, "on_done": on_done}
+        self.insert_job = self.after_idle(self.insert_next_chunk)
+
+    def insert_next_chunk(self):
+        """
+        Inserts the next INSERT_CHUNK characters of the pending text, ending on a line break where possible
+        """
+        self.insert_job = None
+        text = self.pending_insert["text"]
+        position = self.pending_insert["position"]
+        end = text.rfind("\n", position, position + INSERT_CHUNK) + 1
+        if end <= position:
+            end = min(position + INSERT_CHUNK, len(text))
+
+        self.display_text.config(state=NORMAL)
+        self.display_text.insert("stream_end", text[position:end])
+        self.pending_insert["position"] = end
+        if end < len(text):
+            self.display_text.config(state=DISABLED)
+            action = "Pasting" if self.pending_insert["undoable"] else "Loading"
+            hint = " Press Esc to cancel." if self.pending_insert["undoable"] else ""
+            self.status_text.set(f"{action} {end * 100 // len(text)}%...{hint}")
+            self.insert_job = self.after_idle(self.insert_next_chunk)
+        else:
+            self.finish_insert()
+
+    def finish_insert(self):
+        pending_insert = self.pending_insert
+        self.stop_insert()
+        if pending_insert["undoable"]:
+            self.display_text.edit_separator()
+        self.clear_status()
+        if pending_insert["on_done"] is not None:
+            pending_insert["on_done"]()
+
+    def complete_insert(self):
+        """
+        Inserts the rest of a pending paste at once, e.g. before the note is saved
+        """
+        if self.pending_insert is None:
+            return
+
+        text = self.pending_insert["text"]
+        self.display_text.config(state=NORMAL)
+        self.display_text.insert("stream_end", text[self.pending_insert["position"]:])
+        self.finish_insert()
+
+    def stop_insert(self):
+        """
+        Drops whatever is left of a pending insertion, before the app replaces the editor content
+        """
+        if self.insert_job is not None:
+            self.after_cancel(self.insert_job)
+            self.insert_job = None
+        if self.pending_insert is not None:
+            self.pending_insert = None
+            self.display_text.config(state=NORMAL, autoseparators=True)
+
+    def cancel_insert(self, event=None):
+        """
+        Removes the part of a pending paste inserted so far
+        """
+        if self.pending_insert is None or not self.pending_insert["undoable"]:
+            return None
+
+        self.display_text.config(state=NORMAL)
+        self.display_text.delete("stream_start", "stream_end")
+        self.stop_insert()
+        self.display_text.edit_separator()
+        self.set_status("Paste cancelled")
+        return "break"
+        
+    def new_note(self, name=None):
+        """
+        Prepares the app for writing a new note
+        :param name: Note file name. Defaults to a time stamped one.
+        """
+        self.save_note()
+        self.end_journal()
+        self.stop_insert()
+        self.close_large_note()
+        self.io.cancel("read")
+
+        if name is None:
+            # Start the new note next to the open one
+            folder = (self.note_file_name or "").rpartition("/")[0]
+            name = f"{folder}/Note_{int(time())}" if folder else f"Note_{int(time())}"
+        self.note_file_name = name
+        self.note_loaded = False
+        self.display_text.config(state=NORMAL)
+        self.display_text.delete(1.0, END)
+        self.reset_modified()
+        self.begin_journal(self.note_file_name, "")
+        self.note_loaded = True
+        self.set_title("New")
+        self.refresh_note_list()
+
+    def open_note(self, name):
+        """
+        Shows the note with the given name, or starts a new note with that name if there is none
+        :param name: Note file name
+        """
+        if name == self.note_file_name:
+            return
+
+        if self.store.backend.exists(name):
+            self.save_note()
+            self.note_file_name = name
+            self.read_note()
+        else:
+            self.new_note(name)
 
     def delete_note(self):
         """
         Removes the current note from the file system and the Text widget.
         After this it moves on to the previous one.
         """
+        self.end_journal()
+        self.stop_insert()
+        self.close_large_note()
+        self.io.cancel("read")
+        self.note_loaded = False
+        self.display_text.config(state=NORMAL)
         self.display_text.delete(1.0, END)
-        self.note_text = ""
+        self.reset_modified()
 
-        full_path = os.path.join(self.notes_dir, self.note_file_name)
+        name = self.note_file_name
+        full_path = self.store.path(name)
+        self.close_note_windows([name])
+        self.journal.forget(self.store.location, name)
+        self.io.submit(self.journal.compact)
         self.list_notes()
 
-        note_index = len(self.notes) - 1
-        if len(self.notes) > 0:
-            try:
-                note_index = self.notes.index(self.note_file_name)
-            except ValueError:
-                note_index = len(self.notes) - 1
+        notes = self.store.index.order
+        note_index = self.store.index.position(name)
+        if note_index is None:
+            note_index = len(notes) - 1
 
-        try:
-            if os.path.exists(full_path):
-                send2trash(full_path)
-                self.set_status(f"{self.note_file_name} moved to trash.")
-        except Exception as e:
-            print(f"ERROR: Could not remove file {full_path}. {e}")
+        self.io.submit(self.store.remove_file, name, self.store.backend,
+                       callback=lambda result: self.note_trashed(name, result),
+                       error_callback=lambda error: self.note_trash_failed(full_path, error),
+                       keys=(full_path,), label="Deleting...")
 
-        self.list_notes()
+        self.store.forget(name)
+        notes = self.store.index.order
 
-        if note_index < len(self.notes):
-            self.note_file_name = self.notes[note_index]
-        elif len(self.notes) == 0:
+        if note_index < len(notes):
+            self.note_file_name = notes[note_index]
+        elif len(notes) == 0:
             self.note_file_name = f"Note_{int(time())}"
         else:
-            note_index = len(self.notes) - 1
-            self.note_file_name = self.notes[note_index]
+            note_index = len(notes) - 1
+            self.note_file_name = notes[note_index]
 
         self.read_note()
 
-    def list_notes(self):
+    def show_list_menu(self, event):
+        self.list_menu.tk_popup(event.x_root, event.y_root)
+        return "break"
+
+    def sort_mode_changed(self):
+        """
+        Reorders the note list from the cached note index, without listing the notes again
+        """
+        self.store.index.set_sort_mode(self.sort_mode.get())
+        self.note_list.mark(())
+        self.refresh_note_list()
+        self.update_title()
+
+    def open_note_windows(self, event=None):
+        """
+        Opens the notes picked in the note list in windows of their own
+        :param event: Unused dummy variable
+        :return: "break" message to TK Inter
+        """
+        names = self.selected_notes()
+        if len(names) > MAX_NOTE_WINDOWS:
+            if not messagebox.askyesno("Open Notes", f"Open only the first {MAX_NOTE_WINDOWS} of "
+                                                     f"{len(names)} notes?"):
+                return "break"
+            names = names[:MAX_NOTE_WINDOWS]
+
+        for name in names:
+            entry = self.store.index.entries.get(name)
+            if entry is not None and entry[0] >= MAX_FILE_SIZE:
+                messagebox.showerror("Error Opening", f'"{name}" is too large for a separate window.')
+            else:
+                NoteWindow(self, name)
+        return "break"
+
+    def save_note_windows(self):
+        for window in self.note_windows:
+            window.save()
+
+    def note_windows_saved(self, name):
+        """
+        Marks the windows showing a note as saved, as the note is about to be written with the same text
+        :param name: Note file name
         """
-        Lists all notes in the selected note folder
-        :return: List of files detected, smaller than MAX_FILE_SIZE
+        for window in self.note_windows:
+            if window.name == name:
+                window.dirty = False
+                window.cancel_autosave()
+
+    def close_note_windows(self, names):
+        """
+        Closes the windows showing the given notes without saving them, e.g. because the notes are being deleted
+        :param names: Note file names
+        """
+        for window in [window for window in self.note_windows if window.name in names]:
+            window.dirty = False
+            window.close()
+
+    def editor_renamed(self, old_name, new_name):
+        if self.note_file_name == old_name:
+            self.note_file_name = new_name
+
+    def select_all_notes(self, event=None):
+        self.note_list.mark(self.note_list.items)
+        self.set_status(f"{len(self.note_list.marked)} selected. Right-click for bulk actions.")
+        return "break"
+
+    def selected_notes(self):
+        """
+        :return: Sorted names of the notes picked in the note list, including all notes in picked folders, or the
+        open note if nothing is picked
+        """
+        items = self.note_list.marked_items()
+        if not items:
+            items = [self.note_file_name]
+
+        entries = self.store.index.entries
+        names = self.store.index.names
+        selected = set()
+        for item in items:
+            if item is None:
+                continue
+            if self.note_tree.is_folder(item):
+                first = bisect.bisect_left(names, item)
+                selected.update(names[first:bisect.bisect_left(names, item + "\U0010ffff", first)])
+            elif item in entries:
+                selected.add(item)
+        return sorted(selected)
+
+    def start_bulk(self, action, count):
+        """
+        Shows the progress of a bulk job in the status bar until it is done
+        :param action: Status text like "Deleting"
+        :param count: Number of notes the job works on
+        :return: Progress function to pass to the job, safe to call from the worker thread
+        """
+        progress = [action, 0, count]
+        self.bulk_progress = progress
+
+        def report(done):
+            progress[1] = done
+
+        self.after(100, self.show_bulk_progress)
+        return report
+
+    def show_bulk_progress(self):
+        if self.bulk_progress is None:
+            return
+        action, done, count = self.bulk_progress
+        self.status_text.set(f"{action} {done}/{count}...")
+        self.after(100, self.show_bulk_progress)
+
+    def delete_selected(self):
+        """
+        Moves the notes picked in the note list to the trash, as one background job
+        """
+        names = self.selected_notes()
+        if not names or self.bulk_progress is not None:
+            return
+        if not messagebox.askyesno("Delete Notes", f"Delete {len(names)} notes?" if len(names) > 1 else
+                                   f'Delete "{names[0]}"?'):
+            return
+
+        self.save_note()
+        removed = set(names)
+        self.close_note_windows(removed)
+        open_position = self.store.index.position(self.note_file_name)
+        if self.note_file_name in removed:
+            self.end_journal()
+            self.stop_insert()
+            self.close_large_note()
+            self.io.cancel("read")
+            self.note_loaded = False
+            self.display_text.config(state=NORMAL)
+            self.display_text.delete(1.0, END)
+            self.reset_modified()
+        for name in names:
+            self.journal.forget(self.store.location, name)
+        self.io.submit(self.journal.compact)
+
+        progress = self.start_bulk("Deleting", len(names))
+        self.io.submit(self.store.remove_files, names, self.store.backend, progress,
+                       callback=self.notes_deleted,
+                       error_callback=self.bulk_failed, keys=[self.store.path(name) for name in names],
+                       label=f"Deleting {len(names)} notes...")
+        self.store.forget_many(names)
+        self.note_list.mark(())
+
+        if self.note_file_name in removed:
+            notes = self.store.index.order
+            if notes:
+                self.note_file_name = notes[min(open_position, len(notes) - 1)]
+            else:
+                self.note_file_name = f"Note_{int(time())}"
+            self.read_note()
+        else:
+            self.refresh_note_list()
+
+    def notes_deleted(self, result):
+        self.bulk_progress = None
+        removed, failed = self.store.notes_removed(result)
+        self.refresh_note_list()
+        self.set_status(f"{removed} notes moved to trash." if self.store.use_trash else f"{removed} notes deleted.")
+        self.show_bulk_errors("Error Deleting", "Could not delete", failed)
+
+    def move_selected(self):
+        """
+        Moves the notes picked in the note list into a folder, as one background job
+        """
+        names = self.selected_notes()
+        if not names or self.bulk_progress is not None:
+            return
+        folder = simpledialog.askstring(
+            title="Move Notes",
+            prompt=f"Move {len(names)} notes to folder (leave empty for the notes folder itself):",
+            initialvalue=names[0].rpartition("/")[0]
+        )
+        if folder is None:
+            return
+
+        folder = folder.strip("/")
+        if folder and not is_valid_note_name(folder):
+            messagebox.showerror("Error Moving", f'"{folder}" is not a valid folder name.')
+            return
+        prefix = folder + "/" if folder else ""
+        self.rename_notes([(name, prefix + name.rpartition("/")[2]) for name in names], "Moving")
+
+    def rename_selected(self):
+        """
+        Renames the notes picked in the note list by replacing a regular expression in their names, as one
+        background job
+        """
+        names = self.selected_notes()
+        if not names or self.bulk_progress is not None:
+            return
+        pattern = simpledialog.askstring(title="Rename Notes",
+                                         prompt=f"Regular expression to replace in {len(names)} note names:")
+        if not pattern:
+            return
+        replacement = simpledialog.askstring(title="Rename Notes", prompt="Replace with (\\1 for the first group):")
+        if replacement is None:
+            return
+
+        try:
+            pattern = re.compile(pattern)
+            renames = [(name, pattern.sub(replacement, name)) for name in names]
+        except re.error as e:
+            messagebox.showerror("Error Renaming", f"Invalid pattern. {e}")
+            return
+
+        renames = [(old_name, new_name) for old_name, new_name in renames if old_name != new_name]
+        if not renames:
+            self.set_status("No note names match")
+            return
+        samples = "\n".join(f"{old_name} \u2192 {new_name}" for old_name, new_name in renames[:5])
+        more = f"\n... and {len(renames) - 5} more" if len(renames) > 5 else ""
+        if messagebox.askyesno("Rename Notes", f"Rename {len(renames)} notes?\n\n{samples}{more}"):
+            self.rename_notes(renames, "Renaming")
+
+    def rename_notes(self, renames, action):
         """
-        self.notes = []
+        Renames many notes as one background job, after checking that no new name is taken
+        :param renames: List of (old name, new name)
+        :param action: Status text like "Moving"
+        """
+        renames = [(old_name, new_name) for old_name, new_name in renames if old_name != new_name]
+        if not renames:
+            return
+
+        entries = self.store.index.entries
+        new_names = [new_name for _, new_name in renames]
+        invalid = [new_name for new_name in new_names if not is_valid_note_name(new_name)]
+        taken = [new_name for new_name in new_names if new_name in entries]
+        if len(set(new_names)) != len(new_names):
+            taken.append("several notes would get the same name")
+        if invalid or taken:
+            problems = (invalid + taken)[:10]
+            messagebox.showerror("Error Renaming", "Nothing was renamed. Invalid or taken names:\n" +
+                                 "\n".join(problems))
+            return
+
+        self.save_note()
+        self.save_note_windows()
+        for old_name, new_name in renames:
+            self.journal.rename(self.store.location, old_name, new_name)
+            self.editors.rename(old_name, new_name)
+        self.io.submit(self.journal.compact)
+
+        progress = self.start_bulk(action, len(renames))
+        self.io.submit(self.store.rename_files, renames, self.store.backend, progress,
+                       callback=lambda result: self.notes_renamed(renames, result),
+                       error_callback=self.bulk_failed,
+                       keys=[self.store.path(name) for renamed in renames for name in renamed],
+                       label=f"{action} {len(renames)} notes...")
+        self.store.begin_renames(renames)
+        self.note_list.mark(())
+        self.refresh_note_list()
 
-        if os.path.isdir(self.notes_dir):
-            files = os.listdir(self.notes_dir)
+    def notes_renamed(self, renames, result):
+        self.bulk_progress = None
+        renamed, failed = self.store.notes_renamed(result)
+        failed_names = {name for name, _ in failed}
+        for old_name, new_name in renames:
+            if old_name in failed_names:
+                self.journal.rename(self.store.location, new_name, old_name)
+                self.editors.rename(new_name, old_name)
+        self.refresh_note_list()
+        self.set_status(f"{renamed} notes renamed.")
+        self.show_bulk_errors("Error Renaming", "Could not rename", failed)
+
+    def bulk_failed(self, error):
+        self.bulk_progress = None
+        print(f"ERROR: Bulk operation failed. {error}")
+        messagebox.showerror("Error", f"The operation failed. {error}")
+        self.store.index.invalidate()
+        self.list_notes()
 
-            for file in files:
-                full_path = os.path.join(self.notes_dir, file)
-                if os.path.isfile(full_path):
-                    file_stats = os.stat(full_path)
-                    if file_stats.st_size < MAX_FILE_SIZE:
-                        self.notes.append(file)
+    @staticmethod
+    def show_bulk_errors(title, action, failed):
+        """
+        :param failed: List of (name, error) of the notes a bulk job could not handle
+        """
+        if not failed:
+            return
+        for name, error in failed:
+            print(f"ERROR: {action} {name}. {error}")
+        details = "\n".join(f"{name}: {error}" for name, error in failed[:10])
+        more = f"\n... and {len(failed) - 10} more" if len(failed) > 10 else ""
+        messagebox.showerror(title, f"{action} {len(failed)} notes.\n\n{details}{more}")
+
+    def note_trashed(self, name, result):
+        if self.store.note_removed(result):
+            self.set_status(f"{name} moved to trash.")
+
+    def note_trash_failed(self, full_path, error):
+        print(f"ERROR: Could not remove file {full_path}. {error}")
+        self.store.index.invalidate()
+        self.list_notes()
 
-        self.notes.sort()
+    def list_notes(self):
+        """
+        Revalidates the note index against the selected note folder on a background thread.
+        Called once per user action; everything else reads the cached index.
+        :return: The cached list of notes
+        """
+        self.io.submit(self.store.scan, callback=self.notes_listed, channel="scan")
+        return self.store.index.names
+
+    def notes_listed(self, result):
+        if self.store.apply_scan(result):
+            self.search_index.sync_in_background(self.store.backend, self.store.index.entries)
+            if self.search_results is not None:
+                self.run_search()
+            else:
+                self.refresh_note_list()
 
     def read_note(self):
+        """
+        Shows the current note. The file is read in the background; the editor stays disabled until it arrives.
+        """
+        self.end_journal()
+        self.stop_insert()
+        self.close_large_note()
+        self.note_loaded = False
+        self.display_text.config(state=NORMAL)
         self.display_text.delete(1.0, END)
-        self.list_notes()
+        self.reset_modified()
+        notes = self.store.index.order
 
         if self.note_file_name is None:
             # No Note set. Set first one if exists
-            if len(self.notes) > 0:
-                self.note_file_name = self.notes[0]
+            if len(notes) > 0:
+                self.note_file_name = notes[0]
             else:
                 # No notes available
                 self.note_file_name = f"Note_{int(time())}"
 
-        note_index = "New"
-        try:
-            if self.note_file_name is not None:
-                with open(os.path.join(self.notes_dir, self.note_file_name), 'r') as note:
-                    self.note_text = note.read()
-                    self.display_text.insert(1.0, self.note_text)
-                    note_index = f"{self.notes.index(self.note_file_name) + 1}/{len(self.notes)}"
-        except FileNotFoundError:
+        self.update_title()
+        self.refresh_note_list()
+
+        name = self.note_file_name
+        # A note open in another window may hold edits that are not saved yet
+        text = self.editors.text_of(name, self.display_text)
+        cached = self.store.cached(name) if text is None else (None, text)
+        if cached is not None:
+            self.io.cancel("read")
+            self.show_note(name, cached)
+            return
+
+        full_path = self.store.path(name)
+        self.display_text.config(state=DISABLED)
+        self.io.submit(self.store.read, name, self.store.backend, callback=lambda result: self.show_note(name, result),
+                       error_callback=lambda error: self.show_note_error(name, error), discard=discard_note,
+                       keys=(full_path,), channel="read", label="Loading...")
+
+    def show_note(self, name, result, on_shown=None):
+        """
+        Puts a note read by NoteStore.read() into the editor and starts reading its neighbours ahead
+        :param name: Note file name that was read
+        :param result: Value returned by NoteStore.read()
+        :param on_shown: Called without arguments once the whole note is in the editor
+        """
+        if name != self.note_file_name:
+            discard_note(result)
+            return
+
+        mtime, content = result
+        self.end_journal()
+        self.stop_insert()
+        self.note_loaded = False
+        self.display_text.config(state=NORMAL)
+        if isinstance(content, LargeNote):
+            self.show_large_note(content)
+            self.note_shown(name, on_shown)
+            return
+
+        self.close_large_note()
+        self.display_text.delete(1.0, END)
+        if mtime is not None:
+            self.store.note_read(name, result)
+
+        def loaded():
+            self.reset_modified()
+            self.begin_journal(name, content)
+            self.note_loaded = True
+            # Edits made in another window while the note was loading
+            self.editors.loaded(self.display_text)
+            self.note_shown(name, on_shown)
+
+        self.insert_chunked("1.0", content, undoable=False, on_done=loaded)
+
+    def note_shown(self, name, on_shown):
+        self.prefetch_neighbours(name)
+        self.startup_step("note shown")
+        if on_shown is not None:
+            on_shown()
+
+    def prefetch_neighbours(self, name):
+        """
+        Reads the PREFETCH_COUNT notes before and after the given one into the note cache in the background,
+        nearest first, so previous/next and nearby list clicks are served from memory
+        :param name: Note file name
+        """
+        position = self.store.index.position(name)
+        if position is None:
+            return
+
+        names = self.store.index.order
+        for distance in range(1, PREFETCH_COUNT + 1):
+            for step in (distance, -distance):
+                channel = f"prefetch{step:+d}"
+                neighbour_position = position + step
+                if not 0 <= neighbour_position < len(names):
+                    self.io.cancel(channel)
+                    continue
+
+                neighbour = names[neighbour_position]
+                size, mtime = self.store.index.entries[neighbour]
+                if size >= MAX_FILE_SIZE or self.store.cache.contains(neighbour, mtime):
+                    self.io.cancel(channel)
+                    continue
+
+                self.io.submit(self.store.read, neighbour, self.store.backend,
+                               callback=lambda result, note=neighbour: self.note_prefetched(note, result),
+                               error_callback=lambda error: None, discard=discard_note, channel=channel)
+
+    def note_prefetched(self, name, result):
+        if isinstance(result[1], LargeNote):
+            discard_note(result)
+        else:
+            self.store.note_read(name, result)
+
+    def show_note_error(self, name, error):
+        if name != self.note_file_name:
+            return
+
+        self.startup_step("note shown")
+        self.display_text.config(state=NORMAL)
+        if isinstance(error, FileNotFoundError):
             # This note no longer exists. Remove from config.
+            self.store.index.remove(self.note_file_name)
             self.note_file_name = None
             self.save_cfg()
+            if "note list" in self.startup_pending:
+                # Still listing the folder at startup. The first note is shown once that is done.
+                return
             self.note_file_name = f"Note_{int(time())}"
-
-        self.set_title(note_index)
-        self.refresh_note_list()
+            self.set_title("New")
+            self.refresh_note_list()
+        else:
+            print(f"ERROR: Could not read {name}. {error}")
+            self.set_status(f"Could not read {name}")
 
     def save_note(self):
+        """
+        Writes the open note in the background if it was edited since it was read or last saved.
+        Cheap when nothing changed, so it can run on every focus change and navigation.
+        """
+        if self.autosave_job is not None:
+            self.after_cancel(self.autosave_job)
+            self.autosave_job = None
+
+        if self.pending_insert is not None:
+            if not self.pending_insert["undoable"]:
+                # Still loading the note
+                return
+            self.complete_insert()
+
+        if not self.note_dirty:
+            return
+        self.note_dirty = False
+
+        if self.large_note is not None:
+            self.save_large_note()
+            return
+        if self.note_loaded:
+            self.note_windows_saved(self.note_file_name)
+
         text = self.display_text.get("1.0", END)
         text = text[:-1]
         file_name = self.note_file_name
@@ -546,78 +3489,140 @@ class MainWindow(Tk):
         if file_name is None:
             file_name = f"Note_{int(time())}"
 
-        if self.note_text != text:
-            if not os.path.isdir(self.notes_dir):
-                os.mkdir(self.notes_dir)
-
-            with open(os.path.join(self.notes_dir, file_name), 'w') as note:
-                note.write(text)
+        full_path = self.store.path(file_name)
+        checkpoint = self.journal.checkpoint(self.store.location, file_name)
+        self.io.submit(self.write_note, file_name, text, self.store.backend, checkpoint,
+                       callback=lambda result: self.note_saved(file_name, text, result),
+                       error_callback=lambda error: self.note_save_failed(file_name, error),
+                       keys=(full_path,), label="Saving...")
 
-            self.note_text = text
-            self.set_status(f"Saved {file_name}")
+    def write_note(self, name, text, backend, checkpoint):
+        """
+        Worker method. Saves a note and drops the journaled edits the save covers.
+        :param checkpoint: Value of EditJournal.checkpoint() when the text was taken from the editor
+        :return: Value returned by NoteStore.write()
+        """
+        result = self.store.write(name, text, backend)
+        self.journal.saved(checkpoint, text)
+        return result
 
-    def show_previous(self):
+    def back_up_notes(self, event=None):
+        """
+        Backs up the notes that changed since the last backup in the background, after saving the open note
+        :param event: Unused dummy variable
+        :return: "break" message to TK Inter
+        """
         self.save_note()
-        self.list_notes()
-
-        self.list_notes()
-
-        if len(self.notes) > 0:
-            try:
-                note_index = self.notes.index(self.note_file_name) - 1
-                if note_index < 0:
-                    note_index = 0
-            except ValueError:
-                note_index = 0
+        # Sharing the key of the open note makes the backup wait for its save
+        keys = () if self.note_file_name is None else (self.store.path(self.note_file_name),)
+        self.io.submit(self.backup.create, self.store.backend, callback=self.notes_backed_up,
+                       error_callback=self.backup_failed, keys=keys, label="Backing up...")
+        return "break"
 
-            self.note_file_name = self.notes[note_index]
+    def notes_backed_up(self, result):
+        number, changed, removed = result
+        if number is None:
+            self.set_status("Nothing changed since the last backup")
         else:
-            self.note_file_name = None
+            self.set_status(f"Backup {number}: {changed} changed, {removed} removed")
+
+    def backup_failed(self, error):
+        print(f"ERROR: Backup failed. {error}")
+        messagebox.showerror("Error Backing Up", f"Could not back up the notes to {self.backup.path}. {error}")
+
+    def note_saved(self, name, text, result):
+        changes = self.store.note_written(name, text, result)
+        if any(old_entry is None for _, old_entry, _, _ in changes):
+            self.refresh_note_list()
+        if self.note_watcher is None:
+            self.start_watcher()
+        self.set_status(f"Saved {name}")
+
+    def note_save_failed(self, name, error):
+        print(f"ERROR: Could not save {name}. {error}")
+        self.set_status(f"Could not save {name}")
+        if name == self.note_file_name:
+            # Make sure the next save tries again
+            self.note_dirty = True
 
+    def show_previous(self):
+        self.save_note()
+        self.list_notes()
+        self.note_file_name = self.store.neighbour(self.note_file_name, -1)
         self.read_note()
 
     def show_next(self):
         self.save_note()
         self.list_notes()
-
-        if len(self.notes) > 0:
-            try:
-                note_index = self.notes.index(self.note_file_name) + 1
-                if note_index >= len(self.notes):
-                    note_index = len(self.notes) - 1
-            except ValueError:
-                note_index = len(self.notes) - 1
-
-            self.note_file_name = self.notes[note_index]
-        else:
-            self.note_file_name = None
-
+        self.note_file_name = self.store.neighbour(self.note_file_name, 1)
         self.read_note()
 
     def dismiss(self):
+        if self.note_watcher is not None:
+            self.note_watcher.stop()
+        self.save_note_windows()
         self.save_note()
+        self.io.shutdown()
+        if self.journal_job is not None:
+            self.after_cancel(self.journal_job)
+        self.journal.commit()
+        self.journal.close()
+        if self.large_note is not None:
+            # Edits made while the last background save was running
+            self.sync_large_chunks()
+            self.large_note.save(self.store.fsync)
+            self.large_note.close()
+        self.search_index.save()
         self.save_cfg()
+        self.store.close()
+        tracer.report()
+        tracer.dump()
+        if self.instance is not None:
+            self.instance.stop()
         self.wm_withdraw()
         self.destroy()
 
     def select_notes_dir(self):
-        filename = filedialog.askdirectory()
-        if len(filename) > 0 and os.path.isdir(filename):
+        if self.storage == STORAGE_SQLITE:
+            filename = filedialog.asksaveasfilename(title="Select Notes Database", initialfile=self.notes_db,
+                                                    defaultextension=".db", confirmoverwrite=False)
+            if not filename:
+                return
+            self.notes_db = filename
+        else:
+            filename = filedialog.askdirectory()
+            if len(filename) == 0 or not os.path.isdir(filename):
+                return
             self.notes_dir = filename
-            self.list_notes()
-            self.note_file_name = None
-            if len(self.notes) > 0:
-                self.note_file_name = self.notes[0]
 
-            self.read_note()
+        self.save_note()
+        self.close_note_windows([window.name for window in self.note_windows])
+        self.store.set_backend(make_backend(self.storage, self.notes_dir, self.notes_db))
+        self.start_watcher()
+        self.clear_search()
+        self.io.submit(self.store.scan, callback=self.notes_dir_listed, channel="scan", label="Loading...")
+
+    def notes_dir_listed(self, result):
+        self.store.apply_scan(result)
+        self.search_index.sync_in_background(self.store.backend, self.store.index.entries)
+        self.sync_name_index(background=True)
+        notes = self.store.index.order
+        self.note_file_name = None
+        if len(notes) > 0:
+            self.note_file_name = notes[0]
+
+        self.read_note()
 
     def save_cfg(self):
-        if not os.path.isdir(cfg_dir):
-            os.mkdir(cfg_dir)
+        with tracer.span("config.save"):
+            if not os.path.isdir(cfg_dir):
+                os.mkdir(cfg_dir)
 
-        with open(cfg_path, 'w') as config:
             data = {
+                "storage": self.storage,
                 "notes_dir": self.notes_dir,
+                "notes_db": self.notes_db,
+                "backup_dir": self.backup.path,
                 "x": self.winfo_x(),
                 "y": self.winfo_y(),
                 "width": self.winfo_width(),
@@ -627,9 +3632,68 @@ class MainWindow(Tk):
                 "current_note": self.note_file_name,
                 "show_note_list": self.show_note_list_flag,
                 "file_list_width": self.file_list_width,
-                "scrollbar_visible": self.scrollbar.visible
+                "scrollbar_visible": self.scrollbar.visible,
+                "fsync_on_save": self.store.fsync,
+                "expanded_folders": sorted(self.note_tree.expanded),
+                "sort_mode": self.store.index.sort_mode,
+                "session": self.session_snapshot()
             }
-            config.write(json.dumps(data))
+            atomic_write(cfg_path, json.dumps(data))
+
+    def session_snapshot(self):
+        """
+        Captures the note list and the open note, so the next start can show them before touching the note folder
+        :return: Dictionary saved under "session" in the config file
+        """
+        snapshot = {
+            "notes_dir": self.store.location,
+            "notes": self.store.index.snapshot(),
+            "note": None
+        }
+
+        name = self.note_file_name
+        if name is None or self.note_dirty or self.large_note is not None:
+            return snapshot
+
+        text = self.display_text.get("1.0", END)[:-1]
+        if len(text) >= SESSION_TEXT_LIMIT:
+            return snapshot
+
+        entry = self.store.backend.stat(name)
+        if entry is None or entry[0] != len(text.encode()):
+            # The editor does not match the stored note, e.g. a save failed
+            return snapshot
+
+        snapshot["note"] = {
+            "name": name,
+            "mtime": entry[1],
+            "text": text
+        }
+        return snapshot
+
+    def restore_session(self, snapshot):
+        """
+        Fills the note index and cache from a snapshot saved by session_snapshot(). Startup checks them against
+        the note folder in the background.
+        :param snapshot: Value saved under "session" in the config file
+        """
+        if not snapshot or snapshot.get("notes_dir") != self.store.location:
+            return
+
+        try:
+            self.store.index.restore(snapshot["notes"])
+            note = snapshot["note"]
+            if note is not None and note["name"] == self.note_file_name:
+                entry = self.store.index.entries.get(note["name"])
+                if entry is not None:
+                    self.store.index.apply_stats((self.store.backend, None, {note["name"]: (entry[0], note["mtime"])}))
+                    self.store.cache.put(note["name"], note["mtime"], note["text"])
+                    self.session_note = note["name"]
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"ERROR: Could not restore the last session. {e}")
+            self.store.index.set_backend(self.store.backend)
+            self.store.cache.clear()
+            self.session_note = None
 
     def read_cfg(self):
         if not os.path.isfile(cfg_path):
@@ -637,7 +3701,13 @@ class MainWindow(Tk):
 
         with open(cfg_path, 'r') as config:
             data = json.loads(config.read())
+            self.storage = data.get("storage", self.storage)
             self.notes_dir = data.get("notes_dir", self.notes_dir)
+            self.notes_db = data.get("notes_db", self.notes_db)
+            self.backup = NoteBackup(data.get("backup_dir", self.backup.path))
+            self.store.set_backend(make_backend(self.storage, self.notes_dir, self.notes_db))
+            self.store.index.set_sort_mode(data.get("sort_mode", SORT_NAME))
+            self.sort_mode.set(self.store.index.sort_mode)
             self.width = data.get("width", self.winfo_width())
             self.height = data.get("height", self.winfo_height())
             self.offset_x = data.get("offset_x", self.offset_x)
@@ -648,6 +3718,9 @@ class MainWindow(Tk):
             self.show_note_list_flag = data.get("show_note_list",  self.show_note_list_flag)
             self.file_list_width = data.get("file_list_width",  self.file_list_width)
             self.scrollbar.visible = data.get("scrollbar_visible",  True)
+            self.store.fsync = data.get("fsync_on_save", self.store.fsync)
+            self.note_tree.set_expanded(data.get("expanded_folders", ()))
+            self.revealed_note = self.note_file_name
 
             max_x = self.winfo_screenwidth() - 300
             max_y = self.winfo_screenheight() - 300
@@ -664,39 +3737,165 @@ class MainWindow(Tk):
             # Set window position
             self.geometry(f"{self.width}x{self.height}+{self.x}+{self.y}")
 
-        self.refresh_note_list()
+        self.restore_session(data.get("session"))
 
 
-def ensure_single_instance():
-    tmp_dir = tempfile.gettempdir()
-    lock_file = os.path.join(tmp_dir, f"{APP_TITLE.replace(' ', '')}.lock")
+def read_settings():
+    """
+    :return: Dictionary saved in settings.cfg, empty if there is none yet
+    """
+    if not os.path.isfile(cfg_path):
+        return {}
+    with open(cfg_path, 'r') as config:
+        return json.loads(config.read())
 
-    # Check if lock file exists and contains app PID
-    old_pid = 0
-    if os.path.isfile(lock_file):
-        try:
-            with open(lock_file, 'r') as file:
-                old_pid = int(file.read())
-        except:
-            pass
 
-    if old_pid != 0:
-        # Check if app is running
+def transfer_notes(import_folder=None, export_folder=None):
+    """
+    Copies the notes of a folder into the notes storage selected in settings.cfg, or all notes of that storage into
+    a folder. Runs without a window.
+    :param import_folder: Folder to import notes from
+    :param export_folder: Folder to export notes to
+    :return: Exit code for the process
+    """
+    settings = read_settings()
+    storage = make_backend(settings.get("storage", STORAGE_FOLDER), settings.get("notes_dir", default_notes_dir),
+                           settings.get("notes_db", default_notes_db))
+
+    try:
+        if import_folder:
+            count = copy_notes(FolderBackend(import_folder), storage)
+            print(f"INFO: Imported {count} notes from {import_folder} into {storage.location}")
+        if export_folder:
+            count = copy_notes(storage, FolderBackend(export_folder))
+            print(f"INFO: Exported {count} notes from {storage.location} to {export_folder}")
+    except (OSError, sqlite3.Error) as e:
+        print(f"ERROR: Could not copy notes. {e}")
+        return 1
+    finally:
+        storage.close()
+    return 0
+
+
+def backup_notes(backup_dir=None, restore_folder=None, segment=None, list_backups=False):
+    """
+    Backs up the notes storage selected in settings.cfg, lists the backups or restores one into a folder. Runs
+    without a window.
+    :param backup_dir: Backup folder. Defaults to "backup_dir" in settings.cfg.
+    :param restore_folder: Folder to restore the notes into instead of backing up
+    :param segment: Backup to restore, None for the latest one
+    :param list_backups: Only list the backups
+    :return: Exit code for the process
+    """
+    settings = read_settings()
+    backup = NoteBackup(backup_dir or settings.get("backup_dir", default_backup_dir))
+
+    try:
+        if list_backups:
+            for number in backup.segments():
+                manifest = backup.manifest(number)
+                print(f"{number}\t{strftime('%Y-%m-%d %H:%M:%S', localtime(manifest['time']))}\t"
+                      f"{len(manifest['changed'])} changed\t{len(manifest['removed'])} removed\t"
+                      f"{manifest['location']}")
+            return 0
+
+        if restore_folder:
+            segments = backup.segments()
+            if not segments or (segment is not None and segment not in segments):
+                print(f"ERROR: There is no such backup in {backup.path}")
+                return 1
+            count = backup.restore(FolderBackend(restore_folder), segment)
+            print(f"INFO: Restored {count} notes from {backup.path} to {restore_folder}")
+            return 0
+
+        storage = make_backend(settings.get("storage", STORAGE_FOLDER),
+                               settings.get("notes_dir", default_notes_dir),
+                               settings.get("notes_db", default_notes_db))
         try:
-            os.kill(old_pid, 0)
-            print("ERROR: App is already running. Sending the kill signal.")
-            os.kill(old_pid, SIGINT)
-        except OSError:
-            pass
+            number, changed, removed = backup.create(storage)
+        finally:
+            storage.close()
+    except (OSError, ValueError, KeyError, tarfile.TarError, sqlite3.Error) as e:
+        print(f"ERROR: Backup failed. {e}")
+        return 1
 
-    # Write a new PID.
-    with open(lock_file, 'w') as file:
-        file.write(f"{os.getpid()}")
+    if number is None:
+        print(f"INFO: Nothing changed since the last backup in {backup.path}")
+    else:
+        print(f"INFO: Backup {number} in {backup.path}: {changed} changed and {removed} removed notes")
+    return 0
+
+
+def ensure_single_instance(request):
+    """
+    Makes sure only one instance of the app runs. If one is running already, the request is handed over to it.
+    :param request: What this launch asked for, see InstanceServer
+    :return: Tuple of (True if this process should start the app, InstanceServer to pass to MainWindow or None if
+    this process does not listen for later launches)
+    """
+    instance = InstanceServer(instance_socket_path)
+    if not instance.claim(request):
+        return False, None
+    return True, instance if instance.listening else None
 
 
 if __name__ == '__main__':
-    ensure_single_instance()
-    main_app = MainWindow()
+    parser = argparse.ArgumentParser(description="Simple note-taking app easy to back up via cloud.")
+    parser.add_argument("--open", metavar="NOTE",
+                        help="open the note with this name, e.g. project/todo, creating it if needed")
+    parser.add_argument("--new", action="store_true", help="start a new note")
+    parser.add_argument("--import-folder", metavar="FOLDER",
+                        help="copy the notes of a folder into the notes storage selected in settings.cfg and exit")
+    parser.add_argument("--export-folder", metavar="FOLDER",
+                        help="copy all notes of the notes storage selected in settings.cfg into a folder and exit")
+    parser.add_argument("--backup", action="store_true",
+                        help="back up the notes that changed since the last backup and exit")
+    parser.add_argument("--list-backups", action="store_true", help="list the backups and exit")
+    parser.add_argument("--restore-backup", metavar="FOLDER",
+                        help="restore the notes of a backup into a folder and exit")
+    parser.add_argument("--backup-number", type=int, metavar="N",
+                        help="backup to restore with --restore-backup (default the latest)")
+    parser.add_argument("--backup-dir", metavar="FOLDER",
+                        help=f"backup folder (default \"backup_dir\" in settings.cfg or {default_backup_dir})")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="print how long each startup phase took")
+    parser.add_argument("--trace", nargs="?", const=default_trace_path, default=os.environ.get(TRACE_ENV),
+                        metavar="PATH", help="time hot paths and write a Chrome trace event file on exit "
+                                             f"(default {default_trace_path}). Same as setting {TRACE_ENV}.")
+    parser.add_argument("--trace-overlay", action="store_true", default=os.environ.get(TRACE_OVERLAY_ENV) == "1",
+                        help="show the latency of the last traced operation in the status bar. "
+                             f"Same as setting {TRACE_OVERLAY_ENV}=1.")
+    args = parser.parse_args()
+
+    if args.import_folder or args.export_folder:
+        sys.exit(transfer_notes(args.import_folder, args.export_folder))
+    if args.backup or args.list_backups or args.restore_backup:
+        sys.exit(backup_notes(args.backup_dir, args.restore_backup, args.backup_number, args.list_backups))
+
+    if args.trace in ("", "0"):
+        args.trace = None
+    if args.trace is not None or args.trace_overlay:
+        trace_path = default_trace_path if args.trace == "1" else args.trace
+        tracer.configure(trace_path, args.trace_overlay)
+
+    startup_profiler = StartupProfiler(args.profile_startup, STARTUP_TIME)
+    startup_profiler.mark("imports")
+    if args.open:
+        launch_request = {"command": "open", "note": args.open}
+    elif args.new:
+        launch_request = {"command": "new"}
+    else:
+        launch_request = {"command": "raise"}
+
+    start_app, instance_server = ensure_single_instance(launch_request)
+    if not start_app:
+        print("INFO: App is already running. Handed the request over to it.")
+        sys.exit(0)
+
+    startup_profiler.mark("single instance")
+    main_app = MainWindow(startup_profiler, instance_server)
+    if launch_request["command"] != "raise":
+        main_app.handle_request(launch_request)
 
     try:
         main_app.mainloop()
@@ -704,3 +3903,9 @@ if __name__ == '__main__':
         print("INFO: Received a keyboard interrupt event. Exiting.")
         main_app.save_cfg()
         main_app.save_note()
+        main_app.io.shutdown()
+        main_app.store.close()
+        tracer.report()
+        tracer.dump()
+        if instance_server is not None:
+            instance_server.stop()
@@ -0,0 +1,3027 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Note storage behind Cloud Notes: the notes folder or database, its listing, search index, history, backups and
+edit journal, and the thread pool running their I/O. Nothing in here needs tkinter, so scripts, benchmarks and
+tests can use it without a display.
+"""
+import os
+import re
+import json
+import bisect
+import stat
+import mmap
+import queue
+import select
+import struct
+import zlib
+import tarfile
+import hashlib
+import difflib
+import sqlite3
+import threading
+import ctypes
+import ctypes.util
+from io import BytesIO
+from collections import deque, OrderedDict
+from itertools import accumulate, islice
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from time import time, perf_counter
+
+# Check requirements
+if 'posix' in os.name:
+    interpreter = "python3"
+else:
+    interpreter = "python"
+
+_send2trash = None
+_send2trash_lock = threading.Lock()
+
+
+def send2trash(path):
+    """
+    Moves a file to the trash. The send2trash package is imported, and installed if missing, on first use only,
+    so it costs nothing at startup.
+    :param path: Path of the file to move to the trash
+    """
+    global _send2trash
+    with _send2trash_lock:
+        if _send2trash is None:
+            try:
+                from send2trash import send2trash as trash
+            except ModuleNotFoundError as e:
+                print(f"ERROR: {e}. Trying to install...")
+                os.system(f"{interpreter} -m pip install send2trash")
+                from send2trash import send2trash as trash
+            _send2trash = trash
+    _send2trash(path)
+
+
+# Default variables
+MAX_FILE_SIZE = 1024*1024        # Files of this size or bigger are opened in large note mode, loaded chunk by chunk
+LARGE_NOTE_CHUNK = 256*1024      # Approximate size of one chunk of a large note, split on line boundaries
+SCAN_WORKERS = 8                 # Threads listing the subfolders of the notes folder in parallel
+WATCH_POLL_INTERVAL = 2          # Seconds between folder scans when inotify is not available
+IO_WORKERS = 4                   # Threads doing note file I/O in the background
+IO_POLL_INTERVAL = 20            # Milliseconds between checks for finished background I/O
+TMP_SUFFIX = ".cloud_notes.tmp"  # Suffix of temporary files used for atomic saves. Never listed as notes.
+WAL_SUFFIX = ".cloud_notes.wal"  # Suffix of the write-ahead logs of in-place large note saves. Never listed as notes.
+CACHE_MAX_BYTES = 32*1024*1024   # Upper bound for note contents kept in memory
+QUICK_OPEN_LIMIT = 50            # Notes listed by the quick-open switcher
+HISTORY_MAX_DEPTH = 50           # Deltas after which a note version is stored as a full copy again
+HISTORY_TEXT_CACHE = 16          # Rebuilt note versions kept in memory to speed up writing and browsing history
+STORAGE_FOLDER = "folder"        # "storage" setting for notes kept as plain text files in a folder
+STORAGE_SQLITE = "sqlite"        # "storage" setting for notes kept in one SQLite database file
+SORT_NAME = "name"               # "sort_mode" setting listing notes alphabetically, as a folder tree
+SORT_MODIFIED = "modified"       # "sort_mode" setting listing the most recently edited notes first
+SORT_SIZE = "size"               # "sort_mode" setting listing the largest notes first
+SORT_CREATED = "created"         # "sort_mode" setting listing the newest notes first
+SORT_MODES = (SORT_NAME, SORT_MODIFIED, SORT_SIZE, SORT_CREATED)
+BACKUP_WORKERS = os.cpu_count() or 4  # Threads reading and hashing notes while backing up
+TRACE_HISTORY = 1000             # Latest durations kept per traced operation for the latency percentiles
+TRACE_MAX_EVENTS = 200000        # Trace events kept for the trace file. Older ones are dropped.
+cfg_name = "settings.cfg"
+search_index_name = "search_index.json"
+user_dir = os.path.expanduser("~")
+cfg_dir = os.path.join(user_dir, ".cloud_notes")
+cfg_path = os.path.join(cfg_dir, cfg_name)
+search_index_path = os.path.join(cfg_dir, search_index_name)
+history_path = os.path.join(cfg_dir, "history")
+journal_path = os.path.join(cfg_dir, "journal")
+default_backup_dir = os.path.join(cfg_dir, "backups")
+default_notes_dir = os.path.join(cfg_dir, "notes")
+default_notes_db = os.path.join(cfg_dir, "notes.db")
+default_trace_path = os.path.join(cfg_dir, "trace.json")
+instance_socket_path = os.path.join(cfg_dir, "instance.sock")
+
+
+def atomic_write(path, text, fsync=False):
+    """
+    Writes a file so that it is either completely old or completely new, even if the app dies mid-write.
+    The text goes to a temporary file next to the target which then replaces it.
+    :param path: Full path of the file
+    :param text: New content
+    :param fsync: Flush the data and the folder entry to disk before returning
+    """
+    with tracer.span("write", size=len(text), fsync=fsync):
+        tmp_path = path + TMP_SUFFIX
+        with open(tmp_path, 'w') as file:
+            file.write(text)
+            if fsync:
+                file.flush()
+                os.fsync(file.fileno())
+
+        try:
+            os.chmod(tmp_path, stat.S_IMODE(os.stat(path).st_mode))
+        except OSError:
+            pass
+        os.replace(tmp_path, path)
+        if fsync:
+            fsync_folder(path)
+
+
+def fsync_folder(path):
+    """
+    Flushes the folder entry of a file replaced by os.replace() to disk, where the platform supports it
+    :param path: Full path of the file
+    """
+    if hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def is_temp_file(name):
+    return name.endswith((TMP_SUFFIX, WAL_SUFFIX))
+
+
+def is_valid_note_name(name):
+    """
+    :param name: Note name, with "/" between the folders of a note in a subfolder
+    :return: True if the name stays inside the notes folder and would be listed
+    """
+    return all(part and not part.startswith(".") and "\\" not in part for part in name.split("/"))
+
+
+class Tracer(object):
+    """
+    Times the hot paths of the app: folder listing, note reads and writes, editor inserts and reads, note list
+    refreshes and config saves. Keeps the latest TRACE_HISTORY durations of every operation for latency
+    percentiles and every span as a Chrome trace event, which can be opened in chrome://tracing or Perfetto.
+    Spans can be recorded from any thread. When disabled a span costs a single flag check.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.trace_path = None
+        self.overlay = False
+        self.start = perf_counter()
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.events = deque(maxlen=TRACE_MAX_EVENTS)
+        self.threads = {}
+        self.last = None
+
+    def configure(self, trace_path=None, overlay=False):
+        """
+        Turns tracing on
+        :param trace_path: File to write the trace events to on exit, or None to only keep the histograms
+        :param overlay: Show the latency of the last traced operation in the status bar
+        """
+        self.enabled = True
+        self.trace_path = trace_path
+        self.overlay = overlay
+
+    @contextmanager
+    def span(self, name, **args):
+        """
+        Times the code in a with block
+        :param name: Operation name
+        :param args: Details stored with the trace event, e.g. a file size
+        """
+        if not self.enabled:
+            yield
+            return
+
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, perf_counter(), args)
+
+    def record(self, name, start, end, args=None):
+        """
+        Stores one timed operation
+        :param name: Operation name
+        :param start: perf_counter() value when the operation started
+        :param end: perf_counter() value when it ended
+        :param args: Details stored with the trace event
+        """
+        duration = end - start
+        thread = threading.current_thread()
+        event = {
+            "name": name,
+            "ph": "X",
+            "ts": round((start - self.start) * 1000000, 1),
+            "dur": round(duration * 1000000, 1),
+            "pid": os.getpid(),
+            "tid": thread.ident,
+            "args": args or {}
+        }
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = deque(maxlen=TRACE_HISTORY)
+            histogram.append(duration)
+            self.events.append(event)
+            self.threads[thread.ident] = thread.name
+            self.last = (name, duration)
+
+    def stats(self):
+        """
+        :return: Dictionary of operation name -> dictionary of count, p50, p90, p99 and max in milliseconds,
+        over the latest TRACE_HISTORY calls
+        """
+        with self.lock:
+            histograms = {name: sorted(durations) for name, durations in self.histograms.items()}
+
+        stats = {}
+        for name, durations in histograms.items():
+            count = len(durations)
+            stats[name] = {"count": count, "max": durations[-1] * 1000}
+            for percent in (50, 90, 99):
+                stats[name][f"p{percent}"] = durations[min(count - 1, count * percent // 100)] * 1000
+        return stats
+
+    def report(self):
+        """
+        Prints the latency percentiles of every traced operation
+        """
+        if not self.enabled:
+            return
+
+        print("INFO: Hot path latencies (ms)")
+        print(f"    {'operation':<16}{'count':>8}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}")
+        for name, values in sorted(self.stats().items()):
+            print(f"    {name:<16}{values['count']:>8}{values['p50']:>10.2f}{values['p90']:>10.2f}"
+                  f"{values['p99']:>10.2f}{values['max']:>10.2f}")
+
+    def dump(self):
+        """
+        Writes the recorded spans to trace_path in the Chrome trace event format
+        """
+        if not self.enabled or self.trace_path is None:
+            return
+
+        with self.lock:
+            events = list(self.events)
+            threads = dict(self.threads)
+
+        pid = os.getpid()
+        events += [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread_name}}
+                   for tid, thread_name in threads.items()]
+        try:
+            trace_dir = os.path.dirname(self.trace_path)
+            if trace_dir and not os.path.isdir(trace_dir):
+                os.makedirs(trace_dir)
+            atomic_write(self.trace_path, json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}))
+            print(f"INFO: Trace written to {self.trace_path}")
+        except OSError as e:
+            print(f"ERROR: Could not write trace to {self.trace_path}. {e}")
+
+
+tracer = Tracer()
+
+
+class NoteIndex(object):
+    """
+    Cached listing of the notes storage.
+    Keeps name, size and mtime of every note together with its position in the sorted list, so navigation
+    does not need to touch the storage. The notes are only listed again when the storage version changes,
+    which for a notes folder is its own mtime. Every change of the entries bumps generation, so derived indexes
+    can tell when they are out of date.
+    names is always sorted alphabetically. order lists the notes as sort_mode wants them shown and is what positions
+    and navigation follow. For the other sort modes it is kept sorted by a key made of the cached stats, updated with
+    bisect when a single note changes, so neither a save nor switching the sort mode lists the storage again.
+    Saves replace note files, so their creation time is not the note's. The index takes the mtime a note had when it
+    was first listed as its creation time instead.
+    """
+    def __init__(self, backend):
+        self.backend = backend
+        self.entries = {}
+        self.created = {}
+        self.names = []
+        self.sort_mode = SORT_NAME
+        self.order = self.names
+        self.order_keys = []
+        self.positions = {}
+        self.version = None
+        self.generation = 0
+
+    def set_backend(self, backend):
+        """
+        Points the index to a different notes storage and drops the cached listing
+        :param backend: FolderBackend or SQLiteBackend
+        """
+        self.backend = backend
+        self.entries = {}
+        self.created = {}
+        self.names = []
+        self.order = self.names
+        self.order_keys = []
+        self.positions = {}
+        self.version = None
+        self.generation += 1
+
+    def invalidate(self):
+        """
+        Forces a full rescan on the next revalidation
+        """
+        self.version = None
+
+    def _sort(self):
+        self.names = sorted(self.entries)
+        self._sort_order()
+
+    def _sort_order(self):
+        if self.sort_mode == SORT_NAME:
+            self.order = self.names
+            self.order_keys = []
+        else:
+            self.order_keys = sorted(self._order_key(name, entry) for name, entry in self.entries.items())
+            self.order = [name for _, name in self.order_keys]
+        self.positions = None
+
+    def _order_key(self, name, entry):
+        """
+        :param name: Note file name
+        :param entry: Tuple of (size, mtime) of the note
+        :return: Key sorting the note into order for the current sort mode, largest or newest first
+        """
+        if self.sort_mode == SORT_MODIFIED:
+            return -entry[1], name
+        if self.sort_mode == SORT_SIZE:
+            return -entry[0], name
+        return -self.created.get(name, entry[1]), name
+
+    def _list(self, name, entry):
+        """
+        Adds a note to names and order
+        """
+        bisect.insort(self.names, name)
+        if self.sort_mode != SORT_NAME:
+            key = self._order_key(name, entry)
+            position = bisect.bisect_left(self.order_keys, key)
+            self.order_keys.insert(position, key)
+            self.order.insert(position, name)
+        self.positions = None
+
+    def _unlist(self, name, entry):
+        """
+        Removes a note from names and order. Call before the note's entry or creation time changes.
+        """
+        del self.names[bisect.bisect_left(self.names, name)]
+        if self.sort_mode != SORT_NAME:
+            position = bisect.bisect_left(self.order_keys, self._order_key(name, entry))
+            del self.order_keys[position]
+            del self.order[position]
+        self.positions = None
+
+    def set_sort_mode(self, sort_mode):
+        """
+        Orders the cached listing differently. Does not touch the storage.
+        :param sort_mode: One of SORT_MODES
+        """
+        if sort_mode not in SORT_MODES or sort_mode == self.sort_mode:
+            return
+        self.sort_mode = sort_mode
+        self._sort_order()
+
+    def scan(self):
+        """
+        Lists the notes unless the storage is unchanged since the last scan.
+        Does not modify the index, so it can run on a background thread.
+        :return: Tuple of (backend, storage version, entries) to pass to apply_scan(), or None if nothing changed
+        """
+        backend = self.backend
+        version = backend.version()
+        if version is not None and version == self.version:
+            return None
+
+        entries = {}
+        if version is not None:
+            with tracer.span("list", location=backend.location):
+                try:
+                    version, entries = backend.list()
+                except (OSError, sqlite3.Error) as e:
+                    print(f"ERROR: Could not list {backend.location}. {e}")
+
+        return backend, version, entries
+
+    def apply_scan(self, result):
+        """
+        Replaces the cached listing with the result of scan()
+        :param result: Value returned by scan()
+        :return: True if the list of notes changed
+        """
+        if result is None:
+            return False
+
+        backend, version, entries = result
+        if backend is not self.backend:
+            return False
+
+        self.version = version
+        changed = entries.keys() != self.entries.keys()
+        reorder = self.sort_mode != SORT_NAME and entries != self.entries
+        created = self.created
+        self.created = {name: created.get(name, entry[1]) for name, entry in entries.items()}
+        self.entries = entries
+        self.generation += 1
+        if changed:
+            self._sort()
+        elif reorder:
+            self._sort_order()
+        return changed or reorder
+
+    def snapshot(self):
+        """
+        :return: The cached listing as a sorted list of [name, size, mtime, creation time], compact enough for the
+        config file
+        """
+        created = self.created
+        return [[name, *self.entries[name], created[name]] for name in self.names]
+
+    def restore(self, snapshot):
+        """
+        Fills the index from a listing saved by snapshot(). The storage version stays unknown, so the next scan
+        lists the notes in full and replaces whatever was restored, except for the creation times.
+        :param snapshot: Value returned by snapshot(). Listings saved before creation times were kept work too.
+        """
+        self.entries = {name: (size, mtime) for name, size, mtime, *_ in snapshot}
+        self.created = {row[0]: row[3] if len(row) > 3 else row[2] for row in snapshot}
+        self.version = None
+        self.generation += 1
+        self._sort()
+
+    def revalidate(self):
+        """
+        Lists the notes again if the storage changed since the last scan
+        :return: True if the list of notes changed
+        """
+        return self.apply_scan(self.scan())
+
+    def position(self, name):
+        """
+        :param name: Note file name
+        :return: Index of the note in order or None if not listed
+        """
+        if self.sort_mode != SORT_NAME:
+            # Moving a note to the top shifts all others, so a dictionary of positions would not last long
+            entry = self.entries.get(name)
+            return None if entry is None else bisect.bisect_left(self.order_keys, self._order_key(name, entry))
+        if self.positions is None:
+            self.positions = {note: index for index, note in enumerate(self.order)}
+        return self.positions.get(name)
+
+    def neighbour(self, name, step):
+        """
+        Finds the note next to the given one in order
+        :param name: Note file name
+        :param step: -1 for previous, 1 for next note
+        :return: Name of the neighbouring note, clamped to the ends of the list, or None if there are no notes
+        """
+        if len(self.order) == 0:
+            return None
+
+        position = self.position(name)
+        if position is None:
+            position = 0 if step < 0 else len(self.order) - 1
+        else:
+            position = min(max(position + step, 0), len(self.order) - 1)
+        return self.order[position]
+
+    def stat_notes(self, names, backend=None):
+        """
+        Fetches fresh sizes and mtimes of the given notes. Does not modify the index, so it can run on a background
+        thread.
+        :param names: Note file names
+        :param backend: Storage the notes are in. Defaults to the indexed one.
+        :return: Tuple of (backend, storage version, dictionary of name -> (size, mtime) or None if missing)
+        """
+        if backend is None:
+            backend = self.backend
+
+        file_stats = {name: backend.stat(name) for name in names}
+        return backend, backend.version(), file_stats
+
+    def apply_stats(self, result):
+        """
+        Updates single entries with the result of stat_notes()
+        :param result: Value returned by stat_notes()
+        :return: List of (name, old entry, new entry, old position) for every note whose entry changed. The old
+        position is None when many notes changed at once, e.g. after a bulk delete.
+        """
+        backend, version, file_stats = result
+        if backend is not self.backend:
+            return []
+
+        # Many changes are applied to the entries only and the sorted lists are rebuilt once
+        bulk = len(file_stats) > 64
+        changes = []
+        for name, new_entry in file_stats.items():
+            old_entry = self.entries.get(name)
+            if old_entry == new_entry:
+                continue
+
+            old_position = None if bulk else self.position(name)
+            if old_entry is not None and not bulk and (new_entry is None or self.sort_mode != SORT_NAME):
+                self._unlist(name, old_entry)
+            if new_entry is None:
+                del self.entries[name]
+                self.created.pop(name, None)
+            else:
+                self.entries[name] = new_entry
+                self.created.setdefault(name, new_entry[1])
+                if not bulk and (old_entry is None or self.sort_mode != SORT_NAME):
+                    self._list(name, new_entry)
+            changes.append((name, old_entry, new_entry, old_position))
+
+        if changes:
+            if bulk:
+                self._sort()
+            self.generation += 1
+        self.version = version
+        return changes
+
+    def update(self, name):
+        """
+        Adds, refreshes or drops a single note after the app itself changed it
+        :param name: Note file name
+        """
+        self.apply_stats(self.stat_notes([name]))
+
+    def remove(self, name):
+        """
+        Drops a note from the index after the app itself removed it
+        :param name: Note file name
+        """
+        entry = self.entries.get(name)
+        if entry is not None:
+            self._unlist(name, entry)
+            del self.entries[name]
+            self.created.pop(name, None)
+            self.generation += 1
+
+    def rename(self, old_name, new_name):
+        """
+        Moves the cached entry to a new name when the app itself renames the note. Does not touch the file system.
+        :param old_name: Previous note file name
+        :param new_name: New note file name
+        """
+        entry = self.entries.get(old_name)
+        created = self.created.get(old_name)
+        self.remove(old_name)
+        if entry is not None and new_name not in self.entries:
+            self.entries[new_name] = entry
+            self.created[new_name] = created
+            self._list(new_name, entry)
+            self.generation += 1
+
+    def remove_many(self, names):
+        """
+        Drops many notes at once, rebuilding the sorted list only once
+        :param names: Note file names
+        """
+        removed = [name for name in names if self.entries.pop(name, None) is not None]
+        for name in removed:
+            self.created.pop(name, None)
+        if removed:
+            self._sort()
+            self.generation += 1
+
+    def rename_many(self, renames):
+        """
+        Moves many cached entries to new names at once, rebuilding the sorted list only once
+        :param renames: List of (old name, new name)
+        """
+        entries = [(new_name, self.entries.pop(old_name, None), self.created.pop(old_name, None))
+                   for old_name, new_name in renames]
+        for new_name, entry, created in entries:
+            if entry is not None and new_name not in self.entries:
+                self.entries[new_name] = entry
+                self.created[new_name] = created
+        self._sort()
+        self.generation += 1
+
+
+class NameIndex(object):
+    """
+    Index of the note names behind the quick-open switcher, kept in sync with the note listing by sync().
+    Built to answer a query within a frame also for 100k notes: word starts are kept in a sorted list for prefix
+    lookups, substrings are narrowed down with a trigram index and fuzzy matches with an index of the characters
+    of every name. Results are ranked by match quality first and by recency second. When the index shows a query
+    has too many candidates to rank one by one, a pattern is run over all names joined newest first instead, which
+    stops as soon as enough matches are found.
+    Safe to use from several threads.
+    """
+    WORD_PATTERN = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+|[^\W\d_]+")
+    BULK_CHANGES = 1000     # Changes after which the sorted lists are rebuilt instead of updated one by one
+    SPARSE = 16             # Candidate sets this many times smaller than the notes are sorted instead of walked
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.keys = {}
+        self.lower = {}
+        self.trigrams = {}
+        self.chars = {}
+        self.words = []
+        self.recent = []
+        self.recent_lower = []
+        self.joined = None
+        self.line_starts = None
+
+    @staticmethod
+    def _trigrams(lower):
+        return {lower[i:i + 3] for i in range(len(lower) - 2)}
+
+    def _words(self, name, lower):
+        return [(lower[match.start():], name, match.start() == 0) for match in self.WORD_PATTERN.finditer(name)]
+
+    def sync(self, entries):
+        """
+        Brings the index up to date with the note listing. Only names that were added, removed or modified since
+        the last sync are processed, but a first sync of a big folder is best run on a background thread.
+        :param entries: Dictionary of note name -> (size, mtime), like NoteIndex.entries. Not modified.
+        """
+        with self.lock:
+            removed = [name for name in self.keys if name not in entries]
+            changed = [(name, entry[1]) for name, entry in entries.items()
+                       if name not in self.keys or self.keys[name][0] != -entry[1]]
+            bulk = len(removed) + len(changed) > self.BULK_CHANGES
+
+            for name in removed:
+                self._remove(name, bulk)
+            for name, mtime in changed:
+                key = (-mtime, name)
+                if name in self.keys:
+                    if not bulk:
+                        self._unlist(self.keys[name])
+                        self._list(key, self.lower[name])
+                    self.keys[name] = key
+                else:
+                    self._add(name, key, bulk)
+
+            if bulk:
+                self.words = sorted(word for name, lower in self.lower.items() for word in self._words(name, lower))
+                self.recent = sorted(self.keys.values())
+                self.recent_lower = [self.lower[name] for _, name in self.recent]
+                self.joined = None
+            if removed or changed:
+                self._joined()
+
+    def _list(self, key, lower):
+        position = bisect.bisect_left(self.recent, key)
+        self.recent.insert(position, key)
+        self.recent_lower.insert(position, lower)
+        self.joined = None
+
+    def _unlist(self, key):
+        position = bisect.bisect_left(self.recent, key)
+        del self.recent[position]
+        del self.recent_lower[position]
+        self.joined = None
+
+    def _joined(self):
+        """
+        :return: All lowercase names joined by line breaks, newest first
+        """
+        if self.joined is None:
+            self.joined = "\n".join(self.recent_lower)
+            self.line_starts = list(accumulate(map((1).__add__, map(len, self.recent_lower)), initial=0))
+        return self.joined
+
+    def _add(self, name, key, bulk):
+        lower = name.lower()
+        self.keys[name] = key
+        self.lower[name] = lower
+        for trigram in self._trigrams(lower):
+            self.trigrams.setdefault(trigram, set()).add(name)
+        for char in set(lower):
+            self.chars.setdefault(char, set()).add(name)
+        if not bulk:
+            for word in self._words(name, lower):
+                bisect.insort(self.words, word)
+            self._list(key, lower)
+
+    def _remove(self, name, bulk):
+        lower = self.lower.pop(name)
+        key = self.keys.pop(name)
+        for trigram in self._trigrams(lower):
+            names = self.trigrams[trigram]
+            names.discard(name)
+            if not names:
+                del self.trigrams[trigram]
+        for char in set(lower):
+            names = self.chars[char]
+            names.discard(name)
+            if not names:
+                del self.chars[char]
+        if not bulk:
+            for word in self._words(name, lower):
+                del self.words[bisect.bisect_left(self.words, word)]
+            self._unlist(key)
+
+    def search(self, query, limit=QUICK_OPEN_LIMIT):
+        """
+        Finds the notes whose name matches the query, best matches first:
+        names starting with the query, names with a word starting with it, names containing it and last names
+        containing its characters in the same order. Matches of equal quality are ordered newest first.
+        :param query: Text typed by the user
+        :param limit: Maximum number of results
+        :return: List of note names
+        """
+        query = query.lower().strip()
+        with self.lock:
+            if not query:
+                return [name for _, name in self.recent[:limit]]
+
+            results = []
+            found = set()
+            start = bisect.bisect_left(self.words, (query,))
+            end = bisect.bisect_left(self.words, (query + "\U0010ffff",))
+            prefix_matches = set()
+            word_matches = set()
+            for _, name, first in self.words[start:end]:
+                (prefix_matches if first else word_matches).add(name)
+            self._collect(results, found, limit, prefix_matches)
+            self._collect(results, found, limit, word_matches)
+
+            if len(query) >= 3:
+                keys = (self.trigrams, self._trigrams(query))
+            else:
+                keys = (self.chars, set(query))
+            self._collect(results, found, limit, keys, re.escape(query))
+
+            # Each character is followed by anything but the next one, so a name is rejected without backtracking
+            letters = query.replace(" ", "")
+            pattern = re.escape(letters[0]) + "".join(f"[^{re.escape(char)}\n]*{re.escape(char)}" for char in letters[1:])
+            self._collect(results, found, limit, (self.chars, set(letters)), pattern)
+            return results
+
+    def _collect(self, results, found, limit, candidates, pattern=None):
+        """
+        Adds matching names to the results, newest first, until there are limit results
+        :param candidates: Set of names, or a tuple of a trigram or character index and the keys a name needs
+        :param pattern: Regular expression a matching lowercase name contains, or None to take every candidate
+        """
+        if len(results) >= limit:
+            return
+
+        if isinstance(candidates, tuple):
+            index, keys = candidates
+            sets = sorted((index.get(key, ()) for key in keys), key=len)
+            if not sets or not sets[0]:
+                return
+            if len(sets[0]) * self.SPARSE < len(self.recent):
+                candidates = set(sets[0]).intersection(*sets[1:])
+            else:
+                candidates = None
+
+        sparse = candidates is not None and len(candidates) * self.SPARSE < len(self.recent)
+        if sparse:
+            search = None if pattern is None else re.compile(pattern).search
+            ordered = (name for name in sorted(candidates, key=self.keys.__getitem__)
+                       if search is None or search(self.lower[name]))
+        elif pattern is not None:
+            # Too many candidates to rank one by one. Match all names at once, newest first.
+            joined = self._joined()
+            ordered = (self.recent[bisect.bisect_right(self.line_starts, match.start()) - 1][1]
+                       for match in re.finditer(pattern, joined))
+        else:
+            ordered = (name for _, name in self.recent if name in candidates)
+
+        for name in ordered:
+            if name not in found:
+                found.add(name)
+                results.append(name)
+                if len(results) >= limit:
+                    return
+
+
+class IOJob(object):
+    """
+    A single operation queued on the IOExecutor
+    """
+    def __init__(self, function, args, callback, error_callback, discard, keys, label):
+        self.function = function
+        self.args = args
+        self.callback = callback
+        self.error_callback = error_callback
+        self.discard = discard
+        self.keys = keys
+        self.label = label
+        self.cancelled = False
+        self.started = False
+
+
+class IOExecutor(object):
+    """
+    Runs blocking file operations on a thread pool and hands the results back to the Tk main loop.
+    Jobs sharing a key (a file path) run one after another in submission order, so writes to one file never
+    overtake each other and a read sees every write queued before it. Submitting a job on a channel cancels the
+    previous job on the same channel, which drops stale reads when the user navigates quickly.
+    All methods must be called from the Tk main loop.
+    """
+    def __init__(self, root, workers=IO_WORKERS, busy_callback=None):
+        self.root = root
+        self.busy_callback = busy_callback
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="NoteIO")
+        self.results = queue.Queue()
+        self.lanes = {}
+        self.channels = {}
+        self.pending = []
+        self.poll_job = None
+        self.closed = False
+
+    def submit(self, function, *args, callback=None, error_callback=None, discard=None, keys=(), channel=None,
+               label=None):
+        """
+        Queues a function call for a worker thread
+        :param function: Blocking function to run
+        :param args: Arguments for the function
+        :param callback: Called on the Tk main loop with the function's return value
+        :param error_callback: Called on the Tk main loop with the exception if the function raised one
+        :param discard: Called on the Tk main loop with the return value if the job was cancelled after it ran
+        :param keys: File paths the job touches. Jobs sharing a key run in submission order.
+        :param channel: Name of a channel. A new job on the channel cancels the previous one.
+        :param label: Status text shown while the job is pending, like "Saving..."
+        :return: The queued IOJob
+        """
+        job = IOJob(function, args, callback, error_callback, discard, tuple(keys), label)
+        if channel is not None:
+            previous = self.channels.get(channel)
+            if previous is not None:
+                previous.cancelled = True
+            self.channels[channel] = job
+
+        self.pending.append(job)
+        for key in job.keys:
+            self.lanes.setdefault(key, deque()).append(job)
+        self._start_if_ready(job)
+        self._update_busy()
+
+        if self.poll_job is None:
+            self.poll_job = self.root.after(IO_POLL_INTERVAL, self.poll)
+        return job
+
+    def cancel(self, channel):
+        """
+        Cancels the last job submitted on a channel, if it is still pending
+        :param channel: Name of the channel
+        """
+        job = self.channels.pop(channel, None)
+        if job is not None:
+            job.cancelled = True
+            self._update_busy()
+
+    def _start_if_ready(self, job):
+        if job.started or any(self.lanes[key][0] is not job for key in job.keys):
+            return
+        job.started = True
+        self.pool.submit(self._run, job)
+
+    def _run(self, job):
+        if job.cancelled:
+            self.results.put((job, None, None))
+            return
+        try:
+            self.results.put((job, job.function(*job.args), None))
+        except Exception as e:
+            self.results.put((job, None, e))
+
+    def _finish(self, job):
+        self.pending.remove(job)
+        for key in job.keys:
+            lane = self.lanes[key]
+            lane.popleft()
+            if lane:
+                self._start_if_ready(lane[0])
+            else:
+                del self.lanes[key]
+
+    def _update_busy(self):
+        if self.busy_callback is None:
+            return
+        labels = [job.label for job in self.pending if job.label and not job.cancelled]
+        self.busy_callback(labels[-1] if labels else None)
+
+    def poll(self):
+        """
+        Delivers results of finished jobs. Reschedules itself while jobs are pending.
+        """
+        self.poll_job = None
+        while True:
+            try:
+                job, result, error = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self._finish(job)
+            try:
+                self._deliver(job, result, error)
+            except Exception as e:
+                print(f"ERROR: Handling the result of {job.function.__name__} failed. {e}")
+
+        self._update_busy()
+        if self.pending and not self.closed:
+            self.poll_job = self.root.after(IO_POLL_INTERVAL, self.poll)
+
+    def _deliver(self, job, result, error):
+        if error is not None:
+            if job.error_callback is not None and not job.cancelled:
+                job.error_callback(error)
+            else:
+                print(f"ERROR: Background {job.function.__name__} failed. {error}")
+        elif job.cancelled:
+            if job.discard is not None and result is not None:
+                job.discard(result)
+        elif job.callback is not None:
+            job.callback(result)
+
+    def shutdown(self):
+        """
+        Waits for all queued jobs, e.g. the last save before the app closes. No more callbacks are made.
+        """
+        while self.pending:
+            job, result, error = self.results.get()
+            self._finish(job)
+            if error is not None:
+                print(f"ERROR: Background {job.function.__name__} failed. {error}")
+        self.closed = True
+        if self.poll_job is not None:
+            self.root.after_cancel(self.poll_job)
+            self.poll_job = None
+        self.pool.shutdown(wait=True)
+
+
+class NoteWatcher(object):
+    """
+    Watches the notes folder and its subfolders in a background thread and collects the names of notes that were
+    added, removed or modified by other programs. Uses inotify on Linux, with a watch per folder, and falls back to
+    polling file mtimes everywhere else. The UI thread picks up the collected changes in batches with take_changes().
+    """
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0x00000800
+    IN_CLOEXEC = 0x00080000
+    WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self, notes_dir, poll_interval=WATCH_POLL_INTERVAL):
+        self.notes_dir = notes_dir
+        self.poll_interval = poll_interval
+        self.changed = set()
+        self.overflow = False
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.mode = None
+        self.libc = None
+        self.watches = {}
+
+    def start(self):
+        if self.thread is not None:
+            return
+
+        inotify_fd = self._init_inotify()
+        if inotify_fd is not None:
+            self.mode = "inotify"
+            target = self._run_inotify
+            args = (inotify_fd,)
+        else:
+            self.mode = "poll"
+            target = self._run_poll
+            args = ()
+
+        self.thread = threading.Thread(target=target, args=args, name="NoteWatcher", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread = None
+
+    def take_changes(self):
+        """
+        Returns the changes collected since the last call
+        :return: Tuple of (set of changed note names, True if the watcher lost track and a rescan is needed)
+        """
+        with self.lock:
+            changed, self.changed = self.changed, set()
+            overflow, self.overflow = self.overflow, False
+        return changed, overflow
+
+    def _report(self, names, overflow=False):
+        names = [name for name in names if not is_temp_file(name)]
+        with self.lock:
+            self.changed.update(names)
+            self.overflow = self.overflow or overflow
+
+    def _init_inotify(self):
+        if not hasattr(os, "uname") or os.uname().sysname != "Linux":
+            return None
+
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            inotify_fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+            if inotify_fd < 0:
+                return None
+            wd = libc.inotify_add_watch(inotify_fd, os.fsencode(self.notes_dir), self.WATCH_MASK)
+            if wd < 0:
+                os.close(inotify_fd)
+                return None
+        except (OSError, AttributeError) as e:
+            print(f"INFO: inotify is not available ({e}). Polling the notes folder instead.")
+            return None
+
+        self.libc = libc
+        self.watches = {wd: ""}
+        return inotify_fd
+
+    def _watch_folders(self, inotify_fd, folder):
+        """
+        Adds a watch to a folder and all its subfolders. Hidden folders are skipped, like FolderBackend.list() does.
+        :param inotify_fd: inotify file descriptor
+        :param folder: Folder relative to the notes folder, "" for the notes folder itself
+        """
+        for parent, subfolders, _ in os.walk(os.path.join(self.notes_dir, folder)):
+            subfolders[:] = [subfolder for subfolder in subfolders if not subfolder.startswith(".")]
+            relative = os.path.relpath(parent, self.notes_dir).replace(os.sep, "/")
+            if relative == ".":
+                continue
+            wd = self.libc.inotify_add_watch(inotify_fd, os.fsencode(parent), self.WATCH_MASK)
+            if wd >= 0:
+                # A failed watch only means changes in that folder are picked up on the next rescan
+                self.watches[wd] = relative + "/"
+
+    def _run_inotify(self, inotify_fd):
+        header_size = struct.calcsize("iIII")
+        try:
+            self._watch_folders(inotify_fd, "")
+            while not self.stop_event.is_set():
+                readable, _, _ = select.select([inotify_fd], [], [], 0.5)
+                if not readable:
+                    continue
+                try:
+                    buffer = os.read(inotify_fd, 64 * 1024)
+                except BlockingIOError:
+                    continue
+
+                names = set()
+                overflow = False
+                offset = 0
+                while offset + header_size <= len(buffer):
+                    wd, mask, _, name_len = struct.unpack_from("iIII", buffer, offset)
+                    offset += header_size
+                    name = buffer[offset:offset + name_len].rstrip(b"\0")
+                    offset += name_len
+                    if mask & self.IN_Q_OVERFLOW:
+                        overflow = True
+                    elif mask & self.IN_IGNORED:
+                        self.watches.pop(wd, None)
+                    elif name and wd in self.watches:
+                        name = self.watches[wd] + os.fsdecode(name)
+                        if not mask & self.IN_ISDIR:
+                            names.add(name)
+                        elif not name.rsplit("/", 1)[-1].startswith("."):
+                            # A folder appeared, left or was renamed: the notes inside it are not reported one by
+                            # one, so ask for a rescan and watch whatever is there now
+                            overflow = True
+                            if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                                self._watch_folders(inotify_fd, name)
+                self._report(names, overflow)
+        finally:
+            os.close(inotify_fd)
+
+    def _scan(self):
+        try:
+            return FolderBackend(self.notes_dir).list()[1]
+        except OSError:
+            return {}
+
+    def _run_poll(self):
+        previous = self._scan()
+        while not self.stop_event.wait(self.poll_interval):
+            current = self._scan()
+            names = {name for name in previous.keys() | current.keys() if previous.get(name) != current.get(name)}
+            if names:
+                self._report(names)
+            previous = current
+
+
+class LargeNote(object):
+    """
+    A note too big to be loaded into the Text widget at once.
+    The file is memory-mapped and split into chunks on line boundaries, so the editor only ever holds the few
+    chunks around the viewport. Edited chunks are kept in memory until saved; everything else stays on disk.
+    Chunks that are not valid UTF-8 are shown with replacement characters and cannot be edited, as saving them would
+    overwrite the original bytes.
+    """
+    WAL_MAGIC = b"CNWAL1\n"
+
+    def __init__(self, path, chunk_size=LARGE_NOTE_CHUNK):
+        self.path = path
+        self.wal_path = path + WAL_SUFFIX
+        self.chunk_size = chunk_size
+        self.file = None
+        self.map = None
+        self.bounds = []
+        self.edits = {}
+        self._open()
+
+    def _open(self):
+        self._replay()
+        self.file = open(self.path, 'rb')
+        if os.fstat(self.file.fileno()).st_size == 0:
+            # Emptied since its size was checked. An empty file cannot be mapped.
+            self.close()
+            raise ValueError(f"{self.path} is empty")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.bounds = self._split()
+
+    def _replay(self):
+        """
+        Finishes an in-place save that was cut short, e.g. by a crash or power loss, by writing the regions from its
+        write-ahead log again. A log that is incomplete was cut short before the note was touched and is dropped.
+        """
+        try:
+            with open(self.wal_path, 'rb') as wal:
+                log = wal.read()
+        except FileNotFoundError:
+            return
+
+        header = len(self.WAL_MAGIC) + 8
+        complete = len(log) >= header + 4 and log.startswith(self.WAL_MAGIC) and \
+            zlib.crc32(log[:-4]) == struct.unpack("<I", log[-4:])[0]
+        if complete and struct.unpack_from("<Q", log, len(self.WAL_MAGIC))[0] == os.path.getsize(self.path):
+            print(f"INFO: Finishing an interrupted save of {self.path}")
+            with open(self.path, 'r+b') as note:
+                position = header
+                while position < len(log) - 4:
+                    offset, length = struct.unpack_from("<QQ", log, position)
+                    position += 16
+                    note.seek(offset)
+                    note.write(log[position:position + length])
+                    position += length
+                note.flush()
+                os.fsync(note.fileno())
+        os.remove(self.wal_path)
+
+    def _split(self):
+        """
+        :return: List of chunk start offsets, ending with the file size
+        """
+        size = len(self.map)
+        bounds = [0]
+        position = 0
+        while position + self.chunk_size < size:
+            target = position + self.chunk_size
+            new_line = self.map.find(b"\n", target, target + self.chunk_size)
+            if new_line >= 0:
+                position = new_line + 1
+            else:
+                # No line break nearby. Cut anyway, but not inside a UTF-8 sequence.
+                position = target
+                while position < size and self.map[position] & 0xC0 == 0x80:
+                    position += 1
+            if position >= size:
+                break
+            bounds.append(position)
+        bounds.append(size)
+        return bounds
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    @property
+    def chunk_count(self):
+        return len(self.bounds) - 1
+
+    def _original(self, index):
+        return self.map[self.bounds[index]:self.bounds[index + 1]]
+
+    def chunk_text(self, index):
+        """
+        :param index: Chunk number
+        :return: Current text of the chunk, including unsaved edits
+        """
+        if index in self.edits:
+            return self.edits[index]
+        return self._original(index).decode("utf-8", errors="replace")
+
+    def editable(self, index):
+        """
+        :param index: Chunk number
+        :return: True if the chunk is valid UTF-8, so its text can be saved without losing any bytes
+        """
+        try:
+            self._original(index).decode("utf-8")
+            return True
+        except UnicodeDecodeError:
+            return False
+
+    def set_chunk_text(self, index, text):
+        """
+        Records the text of a chunk as currently shown in the editor
+        :param index: Chunk number
+        :param text: Chunk text
+        :return: False if the text was edited but the chunk is not valid UTF-8, so the edit is not kept
+        """
+        if text == self._original(index).decode("utf-8", errors="replace"):
+            self.edits.pop(index, None)
+        elif not self.editable(index):
+            return False
+        else:
+            self.edits[index] = text
+        return True
+
+    @property
+    def modified(self):
+        return len(self.edits) > 0
+
+    def save(self, fsync=False):
+        """
+        Writes the edited chunks back to the file.
+        When no edit changed the byte length of its chunk, only the edited regions are overwritten in place, so an
+        autosave costs as much as the edit rather than the note. The regions are first written to a write-ahead log,
+        which _replay() applies again if the save is cut short, so the note is never left half written.
+        Otherwise the file is streamed chunk by chunk into a temporary file which then replaces the original, like
+        atomic_write() does for small notes, so memory use stays bounded by the chunk size.
+        :param fsync: Flush the data to disk before returning. In-place saves are always flushed, as the log
+        can only be dropped once the note is on disk.
+        """
+        if not self.edits:
+            return
+
+        encoded = {index: text.encode("utf-8") for index, text in self.edits.items()}
+        same_size = all(len(data) == self.bounds[index + 1] - self.bounds[index] for index, data in encoded.items())
+        if same_size:
+            self._save_in_place(encoded)
+            return
+
+        tmp_path = self.path + TMP_SUFFIX
+        bounds = [0]
+        with open(tmp_path, 'wb') as note:
+            for index in range(self.chunk_count):
+                data = encoded[index] if index in encoded else self._original(index)
+                note.write(data)
+                bounds.append(bounds[-1] + len(data))
+            if fsync:
+                note.flush()
+                os.fsync(note.fileno())
+
+        try:
+            os.chmod(tmp_path, stat.S_IMODE(os.stat(self.path).st_mode))
+        except OSError:
+            pass
+        self.close()
+        os.replace(tmp_path, self.path)
+        if fsync:
+            fsync_folder(self.path)
+        self.file = open(self.path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        # Keep the chunk layout so the chunks loaded in the editor still line up
+        self.bounds = bounds
+        self.edits = {}
+
+    def _save_in_place(self, encoded):
+        """
+        :param encoded: Dictionary of chunk number -> new content of the same byte length
+        """
+        regions = sorted((self.bounds[index], data) for index, data in encoded.items())
+        log = [self.WAL_MAGIC, struct.pack("<Q", self.bounds[-1])]
+        for offset, data in regions:
+            log.append(struct.pack("<QQ", offset, len(data)))
+            log.append(data)
+        log = b"".join(log)
+        with open(self.wal_path, 'wb') as wal:
+            wal.write(log + struct.pack("<I", zlib.crc32(log)))
+            wal.flush()
+            os.fsync(wal.fileno())
+
+        with open(self.path, 'r+b') as note:
+            for offset, data in regions:
+                note.seek(offset)
+                note.write(data)
+            note.flush()
+            os.fsync(note.fileno())
+        os.remove(self.wal_path)
+        self.edits = {}
+
+
+class SearchIndex(object):
+    """
+    Persistent full-text index of the notes.
+    Maps every word to the set of notes containing it, so a query is a few set intersections instead of a scan of
+    all files. The index is saved next to settings.cfg and kept up to date from note mtimes, which lets the
+    background sync re-read only the notes that changed since the last run.
+    """
+    TOKEN_PATTERN = re.compile(r"\w+")
+    MIN_PREFIX = 2
+
+    def __init__(self, path):
+        self.path = path
+        self.notes_dir = None
+        self.lock = threading.RLock()
+        self.postings = {}
+        self.documents = {}
+        self.vocabulary = []
+        self.dirty = False
+        self.sync_thread = None
+        self.sync_pending = None
+
+    @classmethod
+    def tokenize(cls, text):
+        return set(cls.TOKEN_PATTERN.findall(text.lower()))
+
+    def load(self, notes_dir):
+        """
+        Loads the saved index. An index saved for a different notes storage is discarded.
+        :param notes_dir: Notes folder or database file the index should describe
+        """
+        documents = {}
+        try:
+            with open(self.path, 'r') as index_file:
+                data = json.load(index_file)
+            if data.get("notes_dir") == notes_dir:
+                documents = {name: (mtime, set(tokens)) for name, (mtime, tokens) in data.get("documents", {}).items()}
+        except (OSError, ValueError, TypeError) as e:
+            if os.path.isfile(self.path):
+                print(f"ERROR: Could not load search index. {e}")
+
+        postings = {}
+        for name, (_, tokens) in documents.items():
+            for token in tokens:
+                postings.setdefault(token, set()).add(name)
+
+        with self.lock:
+            self.notes_dir = notes_dir
+            self.documents = documents
+            self.postings = postings
+            self.vocabulary = sorted(postings)
+            self.dirty = False
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            data = {
+                "notes_dir": self.notes_dir,
+                "documents": {name: [mtime, sorted(tokens)] for name, (mtime, tokens) in self.documents.items()}
+            }
+            self.dirty = False
+
+        if not os.path.isdir(cfg_dir):
+            os.mkdir(cfg_dir)
+        atomic_write(self.path, json.dumps(data, separators=(",", ":")))
+
+    def add_document(self, name, mtime, text, bulk=False):
+        """
+        Indexes a note, replacing whatever was indexed for it before
+        :param name: Note file name
+        :param mtime: Modification time of the indexed content
+        :param text: Note content
+        :param bulk: True while syncing many notes. The word list is then sorted once at the end.
+        """
+        tokens = self.tokenize(text) | self.tokenize(name)
+        with self.lock:
+            self.remove_document(name, bulk)
+            self.documents[name] = (mtime, tokens)
+            for token in tokens:
+                notes = self.postings.get(token)
+                if notes is None:
+                    self.postings[token] = {name}
+                    if not bulk:
+                        bisect.insort(self.vocabulary, token)
+                else:
+                    notes.add(name)
+            self.dirty = True
+
+    def remove_document(self, name, bulk=False):
+        with self.lock:
+            document = self.documents.pop(name, None)
+            if document is None:
+                return
+            for token in document[1]:
+                notes = self.postings.get(token)
+                if notes is None:
+                    continue
+                notes.discard(name)
+                if not notes:
+                    del self.postings[token]
+                    if not bulk:
+                        del self.vocabulary[bisect.bisect_left(self.vocabulary, token)]
+            self.dirty = True
+
+    def is_current(self, name, mtime):
+        document = self.documents.get(name)
+        return document is not None and document[0] == mtime
+
+    def sync(self, backend, entries):
+        """
+        Brings the index up to date with the notes storage. Only notes whose mtime differs from the indexed one are
+        read. Safe to run on a background thread.
+        :param backend: Storage the entries belong to
+        :param entries: Dictionary of note name -> (size, mtime) as kept by NoteIndex
+        """
+        notes_dir = backend.location
+        if notes_dir != self.notes_dir:
+            self.load(notes_dir)
+
+        with self.lock:
+            removed = [name for name in self.documents if name not in entries]
+        stale = [name for name, (_, mtime) in entries.items() if not self.is_current(name, mtime)]
+        if not removed and not stale:
+            return
+
+        for name in removed:
+            self.remove_document(name, bulk=True)
+
+        for name in stale:
+            if notes_dir != self.notes_dir:
+                return
+            text = ""
+            if entries[name][0] < MAX_FILE_SIZE:
+                # Large notes are only searchable by name
+                try:
+                    text = backend.read_text(name)
+                except (OSError, sqlite3.Error):
+                    continue
+            self.add_document(name, entries[name][1], text, bulk=True)
+
+        with self.lock:
+            self.vocabulary = sorted(self.postings)
+
+        try:
+            self.save()
+        except OSError as e:
+            print(f"ERROR: Could not save search index. {e}")
+
+    def sync_in_background(self, backend, entries):
+        """
+        Runs sync() on a background thread. A request made while a sync is running is queued and runs afterwards.
+        """
+        with self.lock:
+            if self.sync_thread is not None:
+                self.sync_pending = (backend, dict(entries))
+                return
+            self.sync_thread = threading.Thread(target=self._sync_worker, args=(backend, dict(entries)),
+                                                name="SearchIndexSync", daemon=True)
+            self.sync_thread.start()
+
+    def _sync_worker(self, backend, entries):
+        while True:
+            try:
+                self.sync(backend, entries)
+            except Exception as e:
+                print(f"ERROR: Search index sync failed. {e}")
+            with self.lock:
+                if self.sync_pending is None:
+                    self.sync_thread = None
+                    return
+                backend, entries = self.sync_pending
+                self.sync_pending = None
+
+    def _prefix_matches(self, prefix):
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        notes = set()
+        for token in self.vocabulary[start:]:
+            if not token.startswith(prefix):
+                break
+            notes |= self.postings[token]
+        return notes
+
+    def search(self, query):
+        """
+        Finds notes containing all words of the query. The last word is treated as a prefix so results can be
+        shown while typing.
+        :param query: Words to look for
+        :return: Sorted list of matching note names
+        """
+        words = self.TOKEN_PATTERN.findall(query.lower())
+        if not words:
+            return []
+
+        with self.lock:
+            candidates = [self.postings.get(word, set()) for word in words[:-1]]
+            last = words[-1]
+            if len(last) >= self.MIN_PREFIX and not query[-1:].isspace():
+                candidates.append(self._prefix_matches(last))
+            else:
+                candidates.append(self.postings.get(last, set()))
+
+            candidates.sort(key=len)
+            result = set(candidates[0])
+            for notes in candidates[1:]:
+                if not result:
+                    break
+                result &= notes
+
+        return sorted(result)
+
+
+def read_note_file(path):
+    """
+    Reads a note for display. Runs on an IOExecutor worker.
+    :param path: Full path of the note
+    :return: Tuple of (mtime of the content read, LargeNote for notes of MAX_FILE_SIZE or more, otherwise the text)
+    """
+    with tracer.span("read"):
+        if os.path.getsize(path) >= MAX_FILE_SIZE:
+            try:
+                large_note = LargeNote(path)
+                return os.fstat(large_note.file.fileno()).st_mtime, large_note
+            except ValueError:
+                # Emptied since the size check. Read it as a small note.
+                pass
+
+        with open(path, 'r') as note:
+            return os.fstat(note.fileno()).st_mtime, note.read()
+
+
+def discard_note(result):
+    """
+    Releases the result of a read_note_file() call that is no longer needed
+    """
+    if result is not None and isinstance(result[1], LargeNote):
+        result[1].close()
+
+
+class FolderBackend(object):
+    """
+    Keeps every note as a plain text file in a folder. The default storage, easy to back up with any cloud client.
+    Notes can be organised in subfolders; a note in a subfolder is named by its path relative to the notes folder,
+    like "project/todo". Subfolders are listed in parallel by SCAN_WORKERS threads. Hidden folders are skipped.
+    """
+    watchable = True
+
+    def __init__(self, location):
+        """
+        :param location: Notes folder
+        """
+        self.location = location
+        self.folders = [""]
+
+    def path(self, name):
+        """
+        :param name: Note file name
+        :return: Full path of the note
+        """
+        return os.path.join(self.location, name)
+
+    def version(self):
+        """
+        :return: Value that changes whenever a note is added, removed or renamed (the mtimes of the notes folder and
+        of the subfolders found by the last list()), or None if the folder does not exist
+        """
+        try:
+            mtimes = [os.stat(self.location).st_mtime_ns]
+        except OSError:
+            return None
+
+        for folder in self.folders[1:]:
+            try:
+                mtimes.append(os.stat(os.path.join(self.location, folder)).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        return tuple(mtimes)
+
+    def list(self):
+        """
+        Lists the notes of the notes folder and all its subfolders
+        :return: Tuple of (storage version, dictionary of note name -> (size, mtime))
+        """
+        # Each folder's mtime is taken before the folder is read, so a change made while listing shows up as a new
+        # version on the next scan
+        folders = {"": os.stat(self.location).st_mtime_ns}
+        entries, subfolders = self._list_folder("")
+        if subfolders:
+            with ThreadPoolExecutor(SCAN_WORKERS, thread_name_prefix="scandir") as pool:
+                pending = set()
+                while True:
+                    for folder, mtime in subfolders:
+                        folders[folder] = mtime
+                        pending.add(pool.submit(self._list_folder, folder))
+                    if not pending:
+                        break
+
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    subfolders = []
+                    for future in done:
+                        try:
+                            folder_entries, folder_subfolders = future.result()
+                        except OSError:
+                            # Removed while listing. Its parent's mtime changed, so the next scan catches up.
+                            continue
+                        entries.update(folder_entries)
+                        subfolders.extend(folder_subfolders)
+
+        self.folders = sorted(folders)
+        return tuple(folders[folder] for folder in self.folders), entries
+
+    def _list_folder(self, folder):
+        """
+        :param folder: Folder relative to the notes folder, "" for the notes folder itself
+        :return: Tuple of (dictionary of note name -> (size, mtime), list of (subfolder, mtime) to list next)
+        """
+        entries = {}
+        subfolders = []
+        prefix = folder + "/" if folder else ""
+        with os.scandir(os.path.join(self.location, folder)) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not entry.name.startswith("."):
+                            subfolders.append((prefix + entry.name, entry.stat().st_mtime_ns))
+                    elif entry.is_file() and not is_temp_file(entry.name):
+                        file_stats = entry.stat()
+                        entries[prefix + entry.name] = (file_stats.st_size, file_stats.st_mtime)
+                except OSError:
+                    pass
+        return entries, subfolders
+
+    def stat(self, name):
+        """
+        :param name: Note file name
+        :return: Tuple of (size, mtime), or None if there is no such note
+        """
+        try:
+            note_stats = os.stat(self.path(name))
+        except OSError:
+            return None
+        if not stat.S_ISREG(note_stats.st_mode):
+            return None
+        return note_stats.st_size, note_stats.st_mtime
+
+    def exists(self, name):
+        return os.path.isfile(self.path(name))
+
+    def read(self, name):
+        """
+        Reads a note for display
+        :param name: Note file name
+        :return: Value of read_note_file()
+        """
+        return read_note_file(self.path(name))
+
+    def read_text(self, name):
+        """
+        :param name: Note file name
+        :return: Whole text of the note, also for large notes
+        """
+        with open(self.path(name), 'r', errors="replace") as note:
+            return note.read()
+
+    def write(self, name, text, fsync=False, mtime=None):
+        """
+        Saves a note atomically
+        :param name: Note file name
+        :param text: New content
+        :param fsync: Flush the note to disk before returning
+        :param mtime: Modification time to give the note. Defaults to now.
+        """
+        full_path = self.path(name)
+        folder = os.path.dirname(full_path)
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        atomic_write(full_path, text, fsync)
+        if mtime is not None:
+            os.utime(full_path, (mtime, mtime))
+
+    def write_many(self, notes):
+        """
+        Saves many notes, e.g. when importing
+        :param notes: Iterable of (name, text, mtime)
+        """
+        for name, text, mtime in notes:
+            self.write(name, text, mtime=mtime)
+
+    def rename(self, old_name, new_name):
+        """
+        Renames a note without overwriting an existing one
+        :param old_name: Current note file name
+        :param new_name: New note file name
+        """
+        new_file_path = self.path(new_name)
+        if os.path.exists(new_file_path):
+            raise FileExistsError(new_file_path)
+        folder = os.path.dirname(new_file_path)
+        if not os.path.isdir(folder):
+            # Renaming to "project/note" moves the note into that folder
+            os.makedirs(folder)
+        os.rename(self.path(old_name), new_file_path)
+
+    def remove(self, name, trash=True):
+        """
+        :param name: Note file name
+        :param trash: Move the note to the trash instead of deleting it for good
+        :return: True if the note existed
+        """
+        full_path = self.path(name)
+        existed = os.path.exists(full_path)
+        if existed:
+            if trash:
+                send2trash(full_path)
+            else:
+                os.remove(full_path)
+        return existed
+
+    def close(self):
+        pass
+
+
+class SQLiteBackend(object):
+    """
+    Keeps all notes in a single SQLite database in WAL mode, for collections too big for a folder of small files.
+    Listing reads a covering index of names, sizes and mtimes instead of scanning a folder, and saving a note
+    rewrites only the pages of its row. Deleted notes are kept in a trash table. Notes are never opened in large
+    note mode. Every thread gets its own connection; WAL lets readers run while a note is being written.
+    """
+    watchable = False
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS notes (
+            name TEXT PRIMARY KEY,
+            text TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS notes_listing ON notes (name, size, mtime);
+        CREATE INDEX IF NOT EXISTS notes_mtime ON notes (mtime);
+        CREATE TABLE IF NOT EXISTS trash (
+            name TEXT NOT NULL,
+            text TEXT NOT NULL,
+            mtime REAL NOT NULL,
+            deleted REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO meta (key, value) VALUES ('generation', 0);
+        CREATE TRIGGER IF NOT EXISTS notes_inserted AFTER INSERT ON notes BEGIN
+            UPDATE meta SET value = value + 1 WHERE key = 'generation';
+        END;
+        CREATE TRIGGER IF NOT EXISTS notes_updated AFTER UPDATE ON notes BEGIN
+            UPDATE meta SET value = value + 1 WHERE key = 'generation';
+        END;
+        CREATE TRIGGER IF NOT EXISTS notes_deleted AFTER DELETE ON notes BEGIN
+            UPDATE meta SET value = value + 1 WHERE key = 'generation';
+        END;
+    """
+
+    def __init__(self, location):
+        """
+        :param location: Path of the database file. It is created if missing.
+        """
+        self.location = location
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.connections = []
+        self.initialized = False
+
+    def _connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is not None:
+            return connection
+
+        folder = os.path.dirname(self.location)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        connection = sqlite3.connect(self.location, timeout=10, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        with self.lock:
+            if not self.initialized:
+                connection.executescript(self.SCHEMA)
+                self.initialized = True
+            # Close the connections of threads that are gone, e.g. finished search index syncs
+            alive = []
+            for thread, old_connection in self.connections:
+                if thread.is_alive():
+                    alive.append((thread, old_connection))
+                else:
+                    old_connection.close()
+            alive.append((threading.current_thread(), connection))
+            self.connections = alive
+        self.local.connection = connection
+        return connection
+
+    def path(self, name):
+        """
+        :param name: Note name
+        :return: String identifying the note, e.g. to serialize I/O on it. Not a file system path.
+        """
+        return f"{self.location}:{name}"
+
+    def version(self):
+        """
+        :return: Counter that changes whenever a note is added, changed, removed or renamed, or None if the
+        database cannot be opened
+        """
+        try:
+            return self._connection().execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()[0]
+        except (OSError, sqlite3.Error) as e:
+            print(f"ERROR: Could not open {self.location}. {e}")
+            return None
+
+    def list(self):
+        """
+        :return: Tuple of (storage version, dictionary of note name -> (size, mtime))
+        """
+        version = self.version()
+        rows = self._connection().execute("SELECT name, size, mtime FROM notes")
+        return version, {name: (size, mtime) for name, size, mtime in rows}
+
+    def stat(self, name):
+        """
+        :param name: Note name
+        :return: Tuple of (size, mtime), or None if there is no such note
+        """
+        try:
+            row = self._connection().execute("SELECT size, mtime FROM notes WHERE name = ?", (name,)).fetchone()
+        except (OSError, sqlite3.Error):
+            return None
+        return None if row is None else tuple(row)
+
+    def exists(self, name):
+        return self.stat(name) is not None
+
+    def read(self, name):
+        """
+        Reads a note for display
+        :param name: Note name
+        :return: Tuple of (mtime, text)
+        """
+        row = self._connection().execute("SELECT mtime, text FROM notes WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            raise FileNotFoundError(self.path(name))
+        return tuple(row)
+
+    def read_text(self, name):
+        return self.read(name)[1]
+
+    def write(self, name, text, fsync=False, mtime=None):
+        """
+        Saves a note in a single transaction
+        :param name: Note name
+        :param text: New content
+        :param fsync: Wait until the transaction is flushed to disk
+        :param mtime: Modification time to give the note. Defaults to now.
+        """
+        self.write_many([(name, text, mtime)], fsync)
+
+    def write_many(self, notes, fsync=False):
+        """
+        Saves many notes in a single transaction, e.g. when importing
+        :param notes: Iterable of (name, text, mtime). A mtime of None means now.
+        :param fsync: Wait until the transaction is flushed to disk
+        """
+        connection = self._connection()
+        connection.execute("PRAGMA synchronous=FULL" if fsync else "PRAGMA synchronous=NORMAL")
+        with connection:
+            connection.executemany(
+                "INSERT INTO notes (name, text, size, mtime) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET text = excluded.text, size = excluded.size, mtime = excluded.mtime",
+                ((name, text, len(text.encode("utf-8")), time() if mtime is None else mtime)
+                 for name, text, mtime in notes))
+
+    def rename(self, old_name, new_name):
+        """
+        Renames a note without overwriting an existing one
+        :param old_name: Current note name
+        :param new_name: New note name
+        """
+        try:
+            with self._connection() as connection:
+                cursor = connection.execute("UPDATE notes SET name = ? WHERE name = ?", (new_name, old_name))
+        except sqlite3.IntegrityError:
+            raise FileExistsError(self.path(new_name))
+        if cursor.rowcount == 0:
+            raise FileNotFoundError(self.path(old_name))
+
+    def remove(self, name, trash=True):
+        """
+        :param name: Note name
+        :param trash: Keep the note in the trash table instead of deleting it for good
+        :return: True if the note existed
+        """
+        with self._connection() as connection:
+            if trash:
+                connection.execute("INSERT INTO trash (name, text, mtime, deleted) "
+                                   "SELECT name, text, mtime, ? FROM notes WHERE name = ?", (time(), name))
+            cursor = connection.execute("DELETE FROM notes WHERE name = ?", (name,))
+        return cursor.rowcount > 0
+
+    def close(self):
+        """
+        Closes the connections of all threads
+        """
+        with self.lock:
+            for _, connection in self.connections:
+                connection.close()
+            self.connections = []
+            self.local = threading.local()
+
+
+def make_backend(storage, notes_dir, notes_db):
+    """
+    Creates the notes storage selected in settings.cfg
+    :param storage: STORAGE_FOLDER or STORAGE_SQLITE
+    :param notes_dir: Notes folder, used by folder storage
+    :param notes_db: Database file, used by SQLite storage
+    :return: FolderBackend or SQLiteBackend
+    """
+    if storage == STORAGE_SQLITE:
+        return SQLiteBackend(notes_db)
+    if storage != STORAGE_FOLDER:
+        print(f"ERROR: Unknown storage {storage}. Using the notes folder.")
+    return FolderBackend(notes_dir)
+
+
+def copy_notes(source, target):
+    """
+    Copies every note from one storage to another, keeping names and mtimes. Notes already in the target with the
+    same name are overwritten. Used to import and export between a notes folder and a database.
+    :param source: Backend to copy from
+    :param target: Backend to copy to
+    :return: Number of notes copied
+    """
+    entries = source.list()[1]
+    target.write_many((name, source.read_text(name), entries[name][1]) for name in sorted(entries))
+    return len(entries)
+
+
+class NoteBackup(object):
+    """
+    Incremental backups of the notes storage, kept as a chain of numbered segments in a backup folder.
+    Every segment has a change manifest, "000001.json", listing the notes added or changed since the previous segment
+    with their size, mtime, SHA-256 and the segment holding their content, plus the notes removed since then. Folding
+    the manifests up to a segment gives the notes as they were when it was made. The content of new and changed
+    notes is streamed into a gzip compressed tar archive, "000001.tar.gz", with one member per distinct content named
+    by its hash. Notes whose size and mtime did not change are not even read, and content already backed up, e.g. a
+    renamed note, is only referenced. The manifest is written last, so an interrupted backup leaves no segment.
+    """
+    def __init__(self, path):
+        """
+        :param path: Backup folder
+        """
+        self.path = path
+        self.lock = threading.Lock()
+
+    def _manifest_path(self, segment):
+        return os.path.join(self.path, f"{segment:06d}.json")
+
+    def _archive_path(self, segment):
+        return os.path.join(self.path, f"{segment:06d}.tar.gz")
+
+    def segments(self):
+        """
+        :return: Sorted numbers of the complete segments
+        """
+        try:
+            file_names = os.listdir(self.path)
+        except FileNotFoundError:
+            return []
+        return sorted(int(file_name[:-5]) for file_name in file_names
+                      if file_name.endswith(".json") and file_name[:-5].isdigit())
+
+    def manifest(self, segment):
+        """
+        :param segment: Segment number
+        :return: Dictionary with the "segment" number, "time", notes "location", "changed" notes as a dictionary of
+        name -> [size, mtime, hash, segment holding the content] and "removed" note names
+        """
+        with open(self._manifest_path(segment), 'r') as manifest:
+            return json.loads(manifest.read())
+
+    def state(self, segment=None):
+        """
+        :param segment: Segment number, None for the latest one
+        :return: Dictionary of note name -> [size, mtime, hash, segment holding the content] of the notes backed up
+        by the segment
+        """
+        notes = {}
+        for number in self.segments():
+            if segment is not None and number > segment:
+                break
+            manifest = self.manifest(number)
+            for name in manifest["removed"]:
+                notes.pop(name, None)
+            notes.update(manifest["changed"])
+        return notes
+
+    @staticmethod
+    def _read_note(backend, name):
+        """
+        Reads and hashes a note. Runs on the hashing threads; hashlib releases the GIL on large inputs.
+        :return: Tuple of (name, UTF-8 encoded text, its SHA-256)
+        """
+        data = backend.read_text(name).encode("utf-8")
+        return name, data, hashlib.sha256(data).hexdigest()
+
+    def create(self, backend, workers=BACKUP_WORKERS):
+        """
+        Backs up the notes that changed since the last segment into a new one
+        :param backend: Notes storage to back up
+        :param workers: Threads reading and hashing notes in parallel
+        :return: Tuple of (new segment number or None if nothing changed, number of changed notes, number of removed
+        notes)
+        """
+        with self.lock:
+            previous = self.state()
+            entries = backend.list()[1]
+            removed = sorted(name for name in previous if name not in entries)
+            candidates = sorted(name for name, (size, mtime) in entries.items()
+                                if name not in previous or previous[name][:2] != [size, mtime])
+            if not candidates and not removed:
+                return None, 0, 0
+
+            known = {entry[2]: entry[3] for entry in previous.values()}
+            existing = self.segments()
+            segment = (existing[-1] if existing else 0) + 1
+            os.makedirs(self.path, exist_ok=True)
+            while os.path.exists(self._archive_path(segment)):
+                # Left over from an interrupted backup
+                segment += 1
+
+            changed = {}
+            archive_path = self._archive_path(segment)
+            try:
+                with tarfile.open(archive_path, "x:gz") as archive, \
+                        ThreadPoolExecutor(workers, thread_name_prefix="backup") as pool:
+                    # Only a few notes are read ahead of the archive, so memory use does not grow with the backup
+                    names = iter(candidates)
+                    pending = deque(pool.submit(self._read_note, backend, name)
+                                    for name in islice(names, workers * 2))
+                    while pending:
+                        future = pending.popleft()
+                        name = next(names, None)
+                        if name is not None:
+                            pending.append(pool.submit(self._read_note, backend, name))
+                        try:
+                            name, data, digest = future.result()
+                        except FileNotFoundError:
+                            # Deleted while backing up. The next backup records the removal.
+                            continue
+
+                        size, mtime = entries[name]
+                        if digest not in known:
+                            member = tarfile.TarInfo(digest)
+                            member.size = len(data)
+                            member.mtime = int(mtime)
+                            archive.addfile(member, BytesIO(data))
+                            known[digest] = segment
+                        changed[name] = [size, mtime, digest, known[digest]]
+
+                manifest = {
+                    "segment": segment,
+                    "time": time(),
+                    "location": backend.location,
+                    "changed": changed,
+                    "removed": removed
+                }
+                atomic_write(self._manifest_path(segment), json.dumps(manifest), fsync=True)
+            except BaseException:
+                try:
+                    os.remove(archive_path)
+                except OSError:
+                    pass
+                raise
+
+            return segment, len(changed), len(removed)
+
+    def restore(self, target, segment=None):
+        """
+        Writes the notes as they were at a segment into a notes storage, with their original mtimes
+        :param target: Backend to write the notes to, e.g. an empty folder
+        :param segment: Segment number, None for the latest one
+        :return: Number of notes restored
+        """
+        notes = self.state(segment)
+        by_segment = {}
+        for name, (_, mtime, digest, content_segment) in notes.items():
+            by_segment.setdefault(content_segment, {}).setdefault(digest, []).append((name, mtime))
+
+        for content_segment, wanted in sorted(by_segment.items()):
+            # Archives are read as a stream, member by member, in a single pass
+            with tarfile.open(self._archive_path(content_segment), "r|gz") as archive:
+                for member in archive:
+                    if member.name not in wanted:
+                        continue
+                    text = archive.extractfile(member).read().decode("utf-8")
+                    target.write_many((name, text, mtime) for name, mtime in wanted.pop(member.name))
+            if wanted:
+                raise FileNotFoundError(f"{len(wanted)} notes missing from {self._archive_path(content_segment)}")
+
+        return len(notes)
+
+
+class NoteHistory(object):
+    """
+    Version history of every note, kept under ~/.cloud_notes/history.
+    Versions are content-addressed: an object is named after the SHA-256 of the note text it holds, so saving
+    unchanged content adds nothing. An object holds a zlib-compressed line delta against the previous version of
+    the note. A full copy is only written once the deltas since the last full copy outgrow it, so the store grows
+    with the size of the edits rather than the number of saves, while every version stays a bounded number of
+    deltas away from a full copy. Each note has an append-only log of its versions.
+    Safe to use from several threads.
+    """
+    def __init__(self, path):
+        """
+        :param path: Folder holding the history
+        """
+        self.path = path
+        self.objects_dir = os.path.join(path, "objects")
+        self.logs_dir = os.path.join(path, "logs")
+        self.lock = threading.RLock()
+        self.latest = {}
+        self.texts = OrderedDict()
+
+    def _log_path(self, location, name):
+        key = hashlib.sha1(f"{location}\n{name}".encode("utf-8")).hexdigest()
+        return os.path.join(self.logs_dir, key)
+
+    def _object_path(self, object_id):
+        return os.path.join(self.objects_dir, object_id[:2], object_id[2:])
+
+    def has(self, location, name):
+        """
+        :param location: Notes folder or database the note is in
+        :param name: Note name
+        :return: True if at least one version of the note is kept
+        """
+        return os.path.isfile(self._log_path(location, name))
+
+    def versions(self, location, name):
+        """
+        :param location: Notes folder or database the note is in
+        :param name: Note name
+        :return: List of dictionaries with the "time", object "id" and "size" of every version, newest first
+        """
+        versions = []
+        try:
+            with open(self._log_path(location, name), 'r') as log:
+                for line in log:
+                    try:
+                        versions.append(json.loads(line))
+                    except ValueError:
+                        # Torn last line after a crash
+                        pass
+        except FileNotFoundError:
+            pass
+        versions.reverse()
+        return versions
+
+    def record(self, location, name, text):
+        """
+        Adds the text as the newest version of the note, unless it equals the newest version already kept
+        :param location: Notes folder or database the note is in
+        :param name: Note name
+        :param text: Note content
+        :return: True if a version was added
+        """
+        object_id = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        log_path = self._log_path(location, name)
+        with self.lock:
+            latest = self.latest.get(log_path)
+            if latest is None:
+                versions = self.versions(location, name)
+                latest = versions[0]["id"] if versions else ""
+            if latest == object_id:
+                return False
+
+            if not os.path.isfile(self._object_path(object_id)):
+                self._write_object(object_id, text, latest or None)
+
+            if not os.path.isdir(self.logs_dir):
+                os.makedirs(self.logs_dir)
+            with open(log_path, 'a') as log:
+                log.write(json.dumps({"time": time(), "id": object_id, "size": len(text)}) + "\n")
+            self.latest[log_path] = object_id
+            self._remember(object_id, text)
+        return True
+
+    def rename(self, location, old_name, new_name):
+        """
+        Moves the history of a renamed note to its new name
+        """
+        old_path = self._log_path(location, old_name)
+        new_path = self._log_path(location, new_name)
+        with self.lock:
+            try:
+                os.replace(old_path, new_path)
+            except FileNotFoundError:
+                pass
+            self.latest.pop(old_path, None)
+            self.latest.pop(new_path, None)
+
+    def load(self, object_id):
+        """
+        :param object_id: Id of a version, as listed by versions()
+        :return: Note text of the version
+        """
+        with self.lock:
+            text = self.texts.get(object_id)
+        if text is not None:
+            return text
+
+        deltas = []
+        current_id = object_id
+        while True:
+            with self.lock:
+                text = self.texts.get(current_id)
+            if text is not None:
+                break
+            item = self._read_object(current_id)
+            if "text" in item:
+                text = item["text"]
+                break
+            deltas.append(item["delta"])
+            current_id = item["base"]
+
+        for delta in reversed(deltas):
+            text = self._apply_delta(text, delta)
+        self._remember(object_id, text)
+        return text
+
+    def _remember(self, object_id, text):
+        with self.lock:
+            self.texts[object_id] = text
+            self.texts.move_to_end(object_id)
+            while len(self.texts) > HISTORY_TEXT_CACHE:
+                self.texts.popitem(last=False)
+
+    def _read_object(self, object_id):
+        with open(self._object_path(object_id), 'rb') as item:
+            return json.loads(zlib.decompress(item.read()).decode("utf-8"))
+
+    def _write_object(self, object_id, text, base_id):
+        full = zlib.compress(json.dumps({"text": text}).encode("utf-8"))
+        data = full
+        if base_id is not None:
+            try:
+                base = self._read_object(base_id)
+                base_text = self.load(base_id)
+            except (OSError, ValueError, zlib.error) as e:
+                print(f"ERROR: Could not read version {base_id}. Keeping a full copy. {e}")
+            else:
+                delta = self._make_delta(base_text, text)
+                depth = base.get("depth", 0) + 1
+                item = {"base": base_id, "delta": delta, "depth": depth}
+                compressed = zlib.compress(json.dumps(item).encode("utf-8"))
+                chain = base.get("chain", 0) + len(compressed)
+                if chain < len(full) and depth <= HISTORY_MAX_DEPTH:
+                    item["chain"] = chain
+                    data = zlib.compress(json.dumps(item).encode("utf-8"))
+
+        object_path = self._object_path(object_id)
+        object_dir = os.path.dirname(object_path)
+        if not os.path.isdir(object_dir):
+            os.makedirs(object_dir)
+        tmp_path = object_path + TMP_SUFFIX
+        with open(tmp_path, 'wb') as item:
+            item.write(data)
+        os.replace(tmp_path, object_path)
+
+    @staticmethod
+    def _make_delta(base_text, text):
+        """
+        :return: List of [start, end] line ranges copied from the base text and strings of inserted text
+        """
+        base_lines = base_text.splitlines(True)
+        lines = text.splitlines(True)
+        delta = []
+        matcher = difflib.SequenceMatcher(None, base_lines, lines)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                delta.append([i1, i2])
+            elif j2 > j1:
+                inserted = "".join(lines[j1:j2])
+                if delta and isinstance(delta[-1], str):
+                    delta[-1] += inserted
+                else:
+                    delta.append(inserted)
+        return delta
+
+    @staticmethod
+    def _apply_delta(base_text, delta):
+        base_lines = base_text.splitlines(True)
+        parts = []
+        for operation in delta:
+            if isinstance(operation, str):
+                parts.append(operation)
+            else:
+                parts.extend(base_lines[operation[0]:operation[1]])
+        return "".join(parts)
+
+
+class EditJournal(object):
+    """
+    Append-only journal of the edits made in the editor that are not saved yet, so a crash, a kill or a power loss
+    between saves does not lose them. The journal is a series of segments: each starts with a base line naming the
+    note and the hash of the text the edits apply to, followed by the edits as Text widget operations.
+    Edits are buffered in memory and appended to the file in groups, with one fsync per group (group commit).
+    Once a save lands, the edits it covers are dropped and the file is rewritten with the rest (compaction), so it
+    only ever holds unsaved edits. recover() replays what a session left behind.
+    Safe to use from several threads.
+    """
+    def __init__(self, path):
+        """
+        :param path: Journal file
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.file_lock = threading.Lock()
+        self.segments = []
+        self.current = None
+        self.pending = []
+        self.file = None
+
+    @staticmethod
+    def text_hash(text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def begin(self, location, name, text):
+        """
+        Starts journaling the edits of a note that was just put into the editor
+        :param location: Notes folder or database the note is in
+        :param name: Note name
+        :param text: Note text the edits will apply to
+        """
+        segment = {"location": location, "name": name, "base": self.text_hash(text), "records": [], "written": False}
+        with self.lock:
+            self.segments = [item for item in self.segments if item["records"]]
+            self.segments.append(segment)
+            self.current = segment
+
+    def end(self):
+        """
+        Stops journaling, before the app itself replaces the editor content
+        """
+        with self.lock:
+            self.current = None
+
+    def record(self, record):
+        """
+        Buffers an edit of the journaled note until the next commit()
+        :param record: Edit as reported by TracedText, like ["insert", "1.0", "text"]
+        :return: True if the edit was journaled
+        """
+        with self.lock:
+            segment = self.current
+            if segment is None:
+                return False
+            if not segment["written"]:
+                segment["written"] = True
+                self.pending.append(["base", segment["location"], segment["name"], segment["base"]])
+            segment["records"].append(record)
+            self.pending.append(record)
+        return True
+
+    def checkpoint(self, location, name):
+        """
+        :param location: Notes folder or database the note is in
+        :param name: Note name
+        :return: Token for saved(), marking the edits of the note journaled so far
+        """
+        with self.lock:
+            return [(segment, len(segment["records"])) for segment in self.segments
+                    if segment["location"] == location and segment["name"] == name]
+
+    def saved(self, checkpoint, text):
+        """
+        Worker method. Drops the edits covered by a save and compacts the journal.
+        :param checkpoint: Value of checkpoint() when the saved text was taken from the editor
+        :param text: Saved text. Edits journaled after the checkpoint apply to it.
+        """
+        if not any(count for _, count in checkpoint):
+            return
+
+        base = self.text_hash(text)
+        with self.lock:
+            for segment, count in checkpoint:
+                del segment["records"][:count]
+                segment["base"] = base
+        try:
+            self.compact()
+        except OSError as e:
+            print(f"ERROR: Could not compact the edit journal. {e}")
+
+    def rename(self, location, old_name, new_name):
+        """
+        Moves the journaled edits of a renamed note to its new name. Call compact() afterwards.
+        """
+        with self.lock:
+            for segment in self.segments:
+                if segment["location"] == location and segment["name"] == old_name:
+                    segment["name"] = new_name
+
+    def forget(self, location, name):
+        """
+        Drops the journaled edits of a deleted note. Call compact() afterwards.
+        """
+        with self.lock:
+            self.segments = [segment for segment in self.segments
+                             if segment["location"] != location or segment["name"] != name]
+            if self.current is not None and self.current not in self.segments:
+                self.current = None
+
+    def commit(self):
+        """
+        Worker method. Appends the buffered edits to the journal file and flushes them to disk with a single fsync.
+        """
+        with self.file_lock:
+            with self.lock:
+                lines, self.pending = self.pending, []
+            if not lines:
+                return
+
+            with tracer.span("journal.commit", records=len(lines)):
+                if self.file is None:
+                    self.file = open(self.path, 'a')
+                self.file.write("".join(json.dumps(line) + "\n" for line in lines))
+                self.file.flush()
+                os.fsync(self.file.fileno())
+
+    def compact(self):
+        """
+        Worker method. Rewrites the journal file with only the edits not saved yet, or removes it if there are none.
+        """
+        with self.file_lock:
+            with self.lock:
+                lines = []
+                for segment in self.segments:
+                    segment["written"] = bool(segment["records"])
+                    if segment["written"]:
+                        lines.append(["base", segment["location"], segment["name"], segment["base"]])
+                        lines.extend(segment["records"])
+                self.pending = []
+                data = "".join(json.dumps(line) + "\n" for line in lines)
+
+            with tracer.span("journal.compact", records=len(lines)):
+                self._close_file()
+                if lines:
+                    atomic_write(self.path, data, fsync=True)
+                elif os.path.isfile(self.path):
+                    os.remove(self.path)
+
+    def close(self):
+        with self.file_lock:
+            self._close_file()
+
+    def _close_file(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def read(self):
+        """
+        :return: List of segments in the journal file as tuples of (location, name, base hash, list of edits)
+        """
+        segments = []
+        try:
+            with open(self.path, 'r') as journal:
+                for line in journal:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Torn last line after a crash
+                        continue
+                    if record[0] == "base":
+                        segments.append((record[1], record[2], record[3], []))
+                    elif segments:
+                        segments[-1][3].append(record)
+        except FileNotFoundError:
+            pass
+        return segments
+
+    def recover(self, backend):
+        """
+        Replays the journal left by a session that ended before its edits were saved. Segments whose base no longer
+        matches the note, because the edits were saved after all or the note changed since, are skipped.
+        :param backend: Storage the notes are in
+        :return: Tuple of (dictionary of note name -> recovered text, True if edits of another storage were found)
+        """
+        originals = {}
+        texts = {}
+        other_storage = False
+        for location, name, base, records in self.read():
+            if location != backend.location:
+                other_storage = True
+                continue
+
+            if name not in texts:
+                try:
+                    originals[name] = backend.read_text(name)
+                except FileNotFoundError:
+                    originals[name] = ""
+                texts[name] = originals[name]
+            if self.text_hash(texts[name]) == base:
+                texts[name] = self.replay(texts[name], records)
+
+        recovered = {name: text for name, text in texts.items() if text != originals[name]}
+        return recovered, other_storage
+
+    def set_aside(self):
+        """
+        Moves the journal file out of the way, keeping edits that could not be recovered
+        :return: New path of the file
+        """
+        aside_path = self.path + ".unrecovered"
+        with self.file_lock:
+            self._close_file()
+            os.replace(self.path, aside_path)
+        return aside_path
+
+    @staticmethod
+    def replay(text, records):
+        """
+        Applies journaled Text widget edits to a note text, the way the widget applied them
+        :param text: Note text
+        :param records: Edits from the journal
+        :return: Edited text
+        """
+        lines = text.split("\n")
+
+        def position(index):
+            line, column = (int(part) for part in index.split("."))
+            if line > len(lines):
+                # Past the end. The widget keeps its final newline, so this is the end of the last line.
+                return len(lines) - 1, len(lines[-1])
+            line = max(line, 1) - 1
+            return line, min(column, len(lines[line]))
+
+        for record in records:
+            if record[0] == "insert":
+                line, column = position(record[1])
+                current = lines[line]
+                lines[line:line + 1] = (current[:column] + record[2] + current[column:]).split("\n")
+            elif record[0] == "delete":
+                start, end = position(record[1]), position(record[2])
+                if end > start:
+                    lines[start[0]:end[0] + 1] = [lines[start[0]][:start[1]] + lines[end[0]][end[1]:]]
+            elif record[0] == "text":
+                lines = record[1].split("\n")
+        return "\n".join(lines)
+
+
+class NoteCache(object):
+    """
+    Least recently used cache of note contents, bounded by the total size of the cached text.
+    Every entry remembers the mtime of the content, so a note changed on disk is never served from the cache.
+    """
+    def __init__(self, max_bytes=CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name, mtime):
+        """
+        :param name: Note file name
+        :param mtime: Current mtime of the note
+        :return: Cached text or None if not cached or out of date
+        """
+        entry = self.entries.get(name)
+        if entry is None or entry[0] != mtime:
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(name)
+        self.hits += 1
+        return entry[1]
+
+    def contains(self, name, mtime):
+        entry = self.entries.get(name)
+        return entry is not None and entry[0] == mtime
+
+    def put(self, name, mtime, text):
+        self.discard(name)
+        if len(text) > self.max_bytes // 4:
+            return
+
+        self.entries[name] = (mtime, text)
+        self.size += len(text)
+        while self.size > self.max_bytes:
+            _, (_, old_text) = self.entries.popitem(last=False)
+            self.size -= len(old_text)
+
+    def discard(self, name):
+        entry = self.entries.pop(name, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def stats(self):
+        """
+        :return: Dictionary of cache counters for diagnostics
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "notes": len(self.entries),
+            "bytes": self.size
+        }
+
+
+class NoteStore(object):
+    """
+    Headless core of the app: the notes storage, its cached listing and the cached note contents.
+    Every storage operation comes in two halves, so a GUI can run the slow half on an IOExecutor worker:
+    the worker methods (scan, read, write, write_large, rename_file, remove_file) only touch the storage,
+    and the matching methods that take their result update the in-memory state on the thread owning the store.
+    Worker methods take the backend they work on, so a result that arrives after a switch to another storage is
+    ignored instead of mixing up two listings.
+    The plain methods (list_notes, open, save, rename, delete) do both halves synchronously, for scripts and
+    benchmarks.
+    """
+    def __init__(self, backend, search_index=None, use_trash=True, history=None):
+        """
+        :param backend: FolderBackend or SQLiteBackend the notes are kept in
+        :param search_index: SearchIndex to keep up to date with saved and removed notes, or None
+        :param use_trash: Move deleted notes to the trash instead of removing them for good
+        :param history: NoteHistory recording every saved version, or None
+        """
+        self.index = NoteIndex(backend)
+        self.cache = NoteCache()
+        self.search_index = search_index
+        self.history = history
+        self.use_trash = use_trash
+        self.fsync = False
+
+    @property
+    def backend(self):
+        return self.index.backend
+
+    @property
+    def location(self):
+        """
+        Notes folder or database file
+        """
+        return self.index.backend.location
+
+    def set_backend(self, backend):
+        """
+        Switches to a different notes storage and drops everything cached for the old one
+        :param backend: New FolderBackend or SQLiteBackend
+        """
+        if backend is not self.backend:
+            self.backend.close()
+        self.index.set_backend(backend)
+        self.cache.clear()
+
+    def close(self):
+        self.backend.close()
+
+    def path(self, name):
+        """
+        :param name: Note file name
+        :return: Full path of the note, or for a database a string identifying it
+        """
+        return self.backend.path(name)
+
+    def scan(self):
+        """
+        Worker method. Lists the notes unless the storage is unchanged; see NoteIndex.scan().
+        """
+        return self.index.scan()
+
+    def apply_scan(self, result):
+        """
+        :param result: Value returned by scan()
+        :return: True if the list of notes changed
+        """
+        return self.index.apply_scan(result)
+
+    def list_notes(self):
+        """
+        Revalidates the listing against the notes storage
+        :return: Sorted list of note file names
+        """
+        self.apply_scan(self.scan())
+        return self.index.names
+
+    def neighbour(self, name, step):
+        """
+        :param name: Note file name
+        :param step: -1 for previous, 1 for next note
+        :return: Name of the neighbouring note, clamped to the ends of the list, or None if there are no notes
+        """
+        return self.index.neighbour(name, step)
+
+    def cached(self, name):
+        """
+        :param name: Note file name
+        :return: Tuple of (mtime, text) if the cached content is current with the listing, otherwise None
+        """
+        entry = self.index.entries.get(name)
+        if entry is None:
+            return None
+
+        text = self.cache.get(name, entry[1])
+        if text is None:
+            return None
+        return entry[1], text
+
+    def read(self, name, backend=None):
+        """
+        Worker method. Reads a note from the storage.
+        :param name: Note file name
+        :param backend: Storage the note is in. Defaults to the current one.
+        :return: Tuple of (mtime, LargeNote or text). Pass it to note_read() or discard_note().
+        """
+        return (backend or self.backend).read(name)
+
+    def note_read(self, name, result):
+        """
+        Caches the text of a note returned by read()
+        :param name: Note file name
+        :param result: Value returned by read()
+        """
+        mtime, content = result
+        if not isinstance(content, LargeNote):
+            self.cache.put(name, mtime, content)
+
+    def open(self, name):
+        """
+        Returns the content of a note, from the cache when it is current
+        :param name: Note file name
+        :return: Tuple of (mtime, LargeNote for notes of MAX_FILE_SIZE or more, otherwise the text)
+        """
+        result = self.cached(name)
+        if result is None:
+            result = self.read(name)
+            self.note_read(name, result)
+        return result
+
+    def write(self, name, text, backend=None):
+        """
+        Worker method. Saves a note atomically and refreshes its search index entry.
+        :param name: Note file name
+        :param text: New content
+        :param backend: Storage the note is in. Defaults to the current one.
+        :return: Stats of the note to pass to note_written()
+        """
+        if backend is None:
+            backend = self.backend
+        self.record_history(name, None, backend)
+        backend.write(name, text, self.fsync)
+        self.record_history(name, text, backend)
+
+        result = self.index.stat_notes([name], backend)
+        entry = result[2][name]
+        search_index = self.search_index
+        if entry is not None and search_index is not None and backend.location == search_index.notes_dir:
+            search_index.add_document(name, entry[1], text)
+        return result
+
+    def record_history(self, name, text, backend):
+        """
+        Worker method. Adds a version to the note history. A failing history never fails the save.
+        :param name: Note file name
+        :param text: Saved content, or None to keep the stored content as the first version of a note without one
+        :param backend: Storage the note is in
+        """
+        history = self.history
+        if history is None:
+            return
+        try:
+            if text is None:
+                if history.has(backend.location, name) or not backend.exists(name):
+                    return
+                text = backend.read_text(name)
+            history.record(backend.location, name, text)
+        except (OSError, ValueError, sqlite3.Error, zlib.error) as e:
+            print(f"ERROR: Could not add {name} to the history. {e}")
+
+    def write_large(self, large_note, name, backend=None):
+        """
+        Worker method. Saves the edited chunks of a large note.
+        :param large_note: LargeNote to save
+        :param name: Note file name
+        :param backend: Storage the note is in. Defaults to the current one.
+        :return: Stats of the note to pass to note_written()
+        """
+        with tracer.span("write.large", chunks=len(large_note.edits)):
+            large_note.save(self.fsync)
+        return self.index.stat_notes([name], backend)
+
+    def note_written(self, name, text, result):
+        """
+        Updates the listing and the cache after write() or write_large()
+        :param name: Note file name
+        :param text: Content written, or None for a large note
+        :param result: Value returned by write() or write_large()
+        :return: Listing changes, as returned by NoteIndex.apply_stats()
+        """
+        changes = self.index.apply_stats(result)
+        entry = self.index.entries.get(name)
+        if entry is not None and text is not None:
+            self.cache.put(name, entry[1], text)
+        return changes
+
+    def save(self, name, text):
+        """
+        Saves a note
+        :param name: Note file name
+        :param text: New content
+        :return: Listing changes, as returned by NoteIndex.apply_stats()
+        """
+        return self.note_written(name, text, self.write(name, text))
+
+    def rename_file(self, old_name, new_name, backend=None):
+        """
+        Worker method. Renames a note in the storage without overwriting an existing one.
+        :param old_name: Current note file name
+        :param new_name: New note file name
+        :param backend: Storage the note is in. Defaults to the current one.
+        :return: Stats of both names to pass to note_renamed()
+        """
+        if backend is None:
+            backend = self.backend
+        backend.rename(old_name, new_name)
+        if self.history is not None:
+            self.history.rename(backend.location, old_name, new_name)
+        return self.index.stat_notes([old_name, new_name], backend)
+
+    def begin_rename(self, old_name, new_name):
+        """
+        Moves a note to its new name in the listing ahead of rename_file(), so the list can update at once
+        :param old_name: Current note file name
+        :param new_name: New note file name
+        """
+        self.index.rename(old_name, new_name)
+        self.cache.discard(old_name)
+
+    def note_renamed(self, result):
+        """
+        :param result: Value returned by rename_file()
+        """
+        self.index.apply_stats(result)
+        if self.search_index is not None:
+            self.search_index.sync_in_background(self.backend, self.index.entries)
+
+    def rename_failed(self, old_name, new_name):
+        """
+        Undoes begin_rename() after rename_file() failed
+        :param old_name: Note file name before the rename
+        :param new_name: Note file name that was attempted
+        """
+        self.index.rename(new_name, old_name)
+
+    def rename(self, old_name, new_name):
+        """
+        Renames a note
+        :param old_name: Current note file name
+        :param new_name: New note file name
+        """
+        if new_name in self.index.entries:
+            raise FileExistsError(self.path(new_name))
+
+        self.begin_rename(old_name, new_name)
+        try:
+            result = self.rename_file(old_name, new_name)
+        except (OSError, sqlite3.Error):
+            self.rename_failed(old_name, new_name)
+            raise
+        self.note_renamed(result)
+
+    def remove_file(self, name, backend=None):
+        """
+        Worker method. Moves a note to the trash, or deletes it if use_trash is off.
+        :param name: Note file name
+        :param backend: Storage the note is in. Defaults to the current one.
+        :return: Result to pass to note_removed()
+        """
+        if backend is None:
+            backend = self.backend
+        existed = backend.remove(name, self.use_trash)
+        return existed, self.index.stat_notes([name], backend)
+
+    def forget(self, name):
+        """
+        Drops a note from the listing, the cache and the search index ahead of remove_file()
+        :param name: Note file name
+        """
+        self.index.remove(name)
+        self.cache.discard(name)
+        if self.search_index is not None:
+            self.search_index.remove_document(name)
+
+    def note_removed(self, result):
+        """
+        :param result: Value returned by remove_file()
+        :return: True if the note existed on disk
+        """
+        existed, file_stats = result
+        self.index.apply_stats(file_stats)
+        return existed
+
+    def delete(self, name):
+        """
+        Deletes a note
+        :param name: Note file name
+        :return: True if the note existed on disk
+        """
+        self.forget(name)
+        return self.note_removed(self.remove_file(name))
+
+    def remove_files(self, names, backend=None, progress=None):
+        """
+        Worker method. Moves many notes to the trash, or deletes them if use_trash is off, as one job. A note that
+        cannot be removed does not stop the others.
+        :param names: Note file names
+        :param backend: Storage the notes are in. Defaults to the current one.
+        :param progress: Function called with the number of notes done so far, from the worker thread
+        :return: Result to pass to notes_removed()
+        """
+        if backend is None:
+            backend = self.backend
+        removed = 0
+        failed = []
+        for done, name in enumerate(names, 1):
+            try:
+                if backend.remove(name, self.use_trash):
+                    removed += 1
+            except (OSError, sqlite3.Error) as e:
+                failed.append((name, e))
+            if progress is not None:
+                progress(done)
+        return removed, failed, self.index.stat_notes(names, backend)
+
+    def forget_many(self, names):
+        """
+        Drops many notes from the listing and the cache ahead of remove_files()
+        :param names: Note file names
+        """
+        self.index.remove_many(names)
+        for name in names:
+            self.cache.discard(name)
+
+    def notes_removed(self, result):
+        """
+        Updates the listing, in a single pass, and the search index after remove_files()
+        :param result: Value returned by remove_files()
+        :return: Tuple of (number of notes removed, list of (name, error) for the notes that could not be removed)
+        """
+        removed, failed, file_stats = result
+        self.index.apply_stats(file_stats)
+        if self.search_index is not None:
+            self.search_index.sync_in_background(self.backend, self.index.entries)
+        return removed, failed
+
+    def rename_files(self, renames, backend=None, progress=None):
+        """
+        Worker method. Renames many notes as one job, without overwriting existing ones. A note that cannot be
+        renamed does not stop the others.
+        :param renames: List of (old name, new name)
+        :param backend: Storage the notes are in. Defaults to the current one.
+        :param progress: Function called with the number of notes done so far, from the worker thread
+        :return: Result to pass to notes_renamed()
+        """
+        if backend is None:
+            backend = self.backend
+        failed = []
+        for done, (old_name, new_name) in enumerate(renames, 1):
+            try:
+                backend.rename(old_name, new_name)
+                if self.history is not None:
+                    self.history.rename(backend.location, old_name, new_name)
+            except (OSError, sqlite3.Error) as e:
+                failed.append((old_name, e))
+            if progress is not None:
+                progress(done)
+        names = [name for renamed in renames for name in renamed]
+        return len(renames) - len(failed), failed, self.index.stat_notes(names, backend)
+
+    def begin_renames(self, renames):
+        """
+        Moves many notes to their new names in the listing ahead of rename_files()
+        :param renames: List of (old name, new name)
+        """
+        self.index.rename_many(renames)
+        for old_name, _ in renames:
+            self.cache.discard(old_name)
+
+    def notes_renamed(self, result):
+        """
+        Updates the listing, in a single pass, and the search index after rename_files(). Notes that failed to
+        rename are back under their old names afterwards.
+        :param result: Value returned by rename_files()
+        :return: Tuple of (number of notes renamed, list of (old name, error) for the notes that were not renamed)
+        """
+        renamed, failed, file_stats = result
+        self.index.apply_stats(file_stats)
+        if self.search_index is not None:
+            self.search_index.sync_in_background(self.backend, self.index.entries)
+        return renamed, failed
+
+
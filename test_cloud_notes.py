@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Regression checks for Cloud Notes. Widget tests need a display and are skipped without one.
+    python3 -m unittest test_cloud_notes
+"""
+import unittest
+from tkinter import Tk, TclError
+
+from cloud_notes import TracedText
+
+
+class TracedTextTest(unittest.TestCase):
+    def setUp(self):
+        try:
+            self.root = Tk()
+        except TclError as e:
+            self.skipTest(f"No display. {e}")
+        self.root.withdraw()
+        self.text = TracedText(self.root, undo=True)
+        self.records = []
+        self.text.change_listeners.append(self.records.append)
+
+    def tearDown(self):
+        self.text.destroy()
+        self.root.destroy()
+
+    def run_event_loop(self):
+        """
+        Runs one pass of mainloop(), which raises errors that Tcl callbacks left behind
+        """
+        self.root.after(0, self.root.quit)
+        self.root.mainloop()
+
+    def test_failed_undo_is_not_raised_later(self):
+        # Like Ctrl+Z right after a note is opened: Tk's binding catches the error of an empty undo stack
+        self.text.tk.eval(f"catch {{{self.text._w} edit undo}}")
+        self.run_event_loop()
+        self.assertEqual(self.records, [])
+
+    def test_failed_delete_is_not_raised_later(self):
+        # Like <<Clear>> without a selection
+        self.text.insert("1.0", "note")
+        self.records.clear()
+        self.text.tk.eval(f"catch {{{self.text._w} delete sel.first sel.last}}")
+        self.run_event_loop()
+        self.assertEqual(self.records, [])
+        self.assertEqual(self.text.get("1.0", "end-1c"), "note")
+
+    def test_failed_calls_raise_in_the_caller(self):
+        with self.assertRaises(TclError):
+            self.text.index("sel.first")
+        with self.assertRaises(TclError):
+            self.text.edit_undo()
+        self.run_event_loop()
+        self.assertEqual(self.records, [])
+
+    def test_edits_are_reported(self):
+        self.text.insert("1.0", "note")
+        self.text.delete("1.0", "1.2")
+        self.assertEqual(self.records, [["insert", "1.0", "note"], ["delete", "1.0", "1.2"]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Checks of the note storage. They need no display.
+    python3 -m unittest test_notes_core
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from notes_core import NoteStore, NoteIndex, NameIndex, FolderBackend, SQLiteBackend, EditJournal, NoteHistory, \
+    NoteBackup, LargeNote, WAL_SUFFIX, SORT_NAME, SORT_MODIFIED, SORT_SIZE, SORT_CREATED
+
+
+class TempDirTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def path(self, *names):
+        return os.path.join(self.dir, *names)
+
+
+class NoteStoreTest(TempDirTest):
+    def check_store(self, backend):
+        store = NoteStore(backend, use_trash=False)
+        self.addCleanup(store.close)
+        self.assertEqual(store.list_notes(), [])
+
+        store.save("todo", "milk")
+        store.save("project/plan", "step one")
+        self.assertEqual(store.list_notes(), ["project/plan", "todo"])
+        self.assertEqual(store.open("todo")[1], "milk")
+
+        store.save("todo", "milk\nbread")
+        self.assertEqual(store.open("todo")[1], "milk\nbread")
+        self.assertEqual(backend.read_text("todo"), "milk\nbread")
+
+        store.rename("todo", "shopping")
+        self.assertEqual(store.list_notes(), ["project/plan", "shopping"])
+        self.assertEqual(store.open("shopping")[1], "milk\nbread")
+        self.assertFalse(backend.exists("todo"))
+        with self.assertRaises(FileExistsError):
+            store.rename("shopping", "project/plan")
+
+        self.assertTrue(store.delete("shopping"))
+        self.assertEqual(store.list_notes(), ["project/plan"])
+        self.assertFalse(backend.exists("shopping"))
+
+    def test_folder(self):
+        self.check_store(FolderBackend(self.path("notes")))
+
+    def test_sqlite(self):
+        self.check_store(SQLiteBackend(self.path("notes.db")))
+
+
+class EditJournalTest(TempDirTest):
+    def test_replay_after_crash(self):
+        backend = FolderBackend(self.dir)
+        backend.write("note", "hello")
+        journal = EditJournal(self.path("journal"))
+        journal.begin(self.dir, "note", "hello")
+        journal.record(["insert", "1.5", " world"])
+        journal.record(["delete", "1.0", "1.1"])
+        journal.record(["insert", "1.0", "H"])
+        journal.commit()
+        # Crash: the last line is torn and the journal is never closed
+        with open(self.path("journal"), 'a') as journal_file:
+            journal_file.write('["insert", "1.0"')
+
+        recovered, other_storage = EditJournal(self.path("journal")).recover(backend)
+        self.assertEqual(recovered, {"note": "Hello world"})
+        self.assertFalse(other_storage)
+        journal.close()
+
+    def test_saved_edits_are_not_replayed(self):
+        backend = FolderBackend(self.dir)
+        backend.write("note", "a")
+        journal = EditJournal(self.path("journal"))
+        journal.begin(self.dir, "note", "a")
+        journal.record(["insert", "1.1", "b"])
+        journal.commit()
+        checkpoint = journal.checkpoint(self.dir, "note")
+        backend.write("note", "ab")
+        journal.saved(checkpoint, "ab")
+        journal.record(["insert", "1.2", "c"])
+        journal.commit()
+        journal.close()
+
+        self.assertEqual(EditJournal(self.path("journal")).recover(backend), ({"note": "abc"}, False))
+
+    def test_replay(self):
+        self.assertEqual(EditJournal.replay("one\ntwo", [["delete", "1.2", "2.1"]]), "onwo")
+        self.assertEqual(EditJournal.replay("x", [["insert", "9.0", "\ny"], ["text", "z"]]), "z")
+
+
+class NoteHistoryTest(TempDirTest):
+    def test_versions_are_rebuilt_from_deltas(self):
+        history = NoteHistory(self.path("history"))
+        texts = ["\n".join(f"line {line}" for line in range(100))]
+        for version in range(1, 6):
+            lines = texts[-1].split("\n")
+            lines[version * 10] = f"changed in version {version}"
+            texts.append("\n".join(lines))
+        for text in texts:
+            self.assertTrue(history.record(self.dir, "note", text))
+        self.assertFalse(history.record(self.dir, "note", texts[-1]))
+
+        # A new instance has nothing cached, so every version is rebuilt from the objects on disk
+        history = NoteHistory(self.path("history"))
+        versions = history.versions(self.dir, "note")
+        self.assertEqual([version["size"] for version in versions], [len(text) for text in reversed(texts)])
+        self.assertEqual([history.load(version["id"]) for version in versions], list(reversed(texts)))
+
+    def test_rename(self):
+        history = NoteHistory(self.path("history"))
+        history.record(self.dir, "old", "text")
+        history.rename(self.dir, "old", "new")
+        self.assertFalse(history.has(self.dir, "old"))
+        self.assertEqual(history.load(history.versions(self.dir, "new")[0]["id"]), "text")
+
+
+class NoteBackupTest(TempDirTest):
+    def test_restore_segments(self):
+        notes = FolderBackend(self.path("notes"))
+        backup = NoteBackup(self.path("backups"))
+        notes.write("a", "first", mtime=1000)
+        notes.write("b", "second", mtime=1000)
+        first = backup.create(notes, workers=2)[0]
+
+        notes.write("a", "changed", mtime=2000)
+        notes.remove("b", trash=False)
+        notes.write("c", "second", mtime=2000)
+        second = backup.create(notes, workers=2)[0]
+        self.assertEqual(backup.segments(), [first, second])
+        self.assertIsNone(backup.create(notes)[0])
+
+        restored = FolderBackend(self.path("first"))
+        self.assertEqual(backup.restore(restored, first), 2)
+        self.assertEqual(restored.list()[1].keys(), {"a", "b"})
+        self.assertEqual(restored.read_text("a"), "first")
+        self.assertEqual(restored.stat("a")[1], 1000)
+
+        restored = SQLiteBackend(self.path("latest.db"))
+        self.addCleanup(restored.close)
+        self.assertEqual(backup.restore(restored), 2)
+        self.assertEqual(restored.list()[1].keys(), {"a", "c"})
+        self.assertEqual(restored.read_text("a"), "changed")
+        self.assertEqual(restored.read_text("c"), "second")
+
+
+class LargeNoteTest(TempDirTest):
+    def setUp(self):
+        TempDirTest.setUp(self)
+        self.note_path = self.path("large")
+        self.lines = [f"{index:05d} some note text\n" for index in range(2000)]
+        with open(self.note_path, 'w') as note:
+            note.write("".join(self.lines))
+
+    def open(self):
+        large_note = LargeNote(self.note_path, chunk_size=4096)
+        self.addCleanup(large_note.close)
+        return large_note
+
+    def read(self):
+        with open(self.note_path, 'r') as note:
+            return note.read()
+
+    def test_split_on_lines(self):
+        large_note = self.open()
+        self.assertGreater(large_note.chunk_count, 1)
+        chunks = [large_note.chunk_text(index) for index in range(large_note.chunk_count)]
+        self.assertEqual("".join(chunks), "".join(self.lines))
+        self.assertTrue(all(chunk.endswith("\n") for chunk in chunks))
+
+    def test_save_in_place(self):
+        large_note = self.open()
+        inode = os.stat(self.note_path).st_ino
+        text = large_note.chunk_text(1)
+        self.assertTrue(large_note.set_chunk_text(1, text.replace("some", "SOME")))
+        large_note.save()
+        self.assertFalse(large_note.modified)
+        self.assertEqual(os.stat(self.note_path).st_ino, inode)
+        self.assertFalse(os.path.exists(large_note.wal_path))
+        self.assertEqual(self.read(), "".join(self.lines).replace(text, text.replace("some", "SOME")))
+
+    def test_save_with_new_size(self):
+        large_note = self.open()
+        large_note.set_chunk_text(0, "new start\n")
+        large_note.set_chunk_text(2, large_note.chunk_text(2) + "added\n")
+        large_note.save()
+        self.assertEqual(large_note.chunk_text(0), "new start\n")
+        self.assertEqual(self.read(), "".join([large_note.chunk_text(index)
+                                               for index in range(large_note.chunk_count)]))
+        self.assertIn("added\n", self.read())
+
+    def crash_during_save(self):
+        """
+        Saves an edit in place but leaves the write-ahead log behind and the note as it was, like a crash before
+        the note was written
+        :return: Expected note text once the log is applied
+        """
+        large_note = self.open()
+        text = large_note.chunk_text(1)
+        large_note.set_chunk_text(1, text.replace("some", "SOME"))
+        with mock.patch.object(os, "remove"):
+            large_note.save()
+        large_note.close()
+        original = "".join(self.lines)
+        with open(self.note_path, 'w') as note:
+            note.write(original)
+        return original.replace(text, text.replace("some", "SOME"))
+
+    def test_interrupted_save_is_finished_on_open(self):
+        expected = self.crash_during_save()
+        large_note = self.open()
+        self.assertFalse(os.path.exists(large_note.wal_path))
+        self.assertEqual(self.read(), expected)
+
+    def test_torn_log_is_dropped(self):
+        self.crash_during_save()
+        wal_path = self.note_path + WAL_SUFFIX
+        os.truncate(wal_path, os.path.getsize(wal_path) - 10)
+        self.open()
+        self.assertFalse(os.path.exists(wal_path))
+        self.assertEqual(self.read(), "".join(self.lines))
+
+    def test_invalid_utf8_chunk_is_not_editable(self):
+        with open(self.note_path, 'ab') as note:
+            note.write(b"\xff\xfe broken\n" * 1000)
+        large_note = self.open()
+        last = large_note.chunk_count - 1
+        self.assertFalse(large_note.editable(last))
+        self.assertFalse(large_note.set_chunk_text(last, "replaced"))
+        self.assertFalse(large_note.modified)
+
+
+class NoteIndexTest(TempDirTest):
+    def test_sort_modes(self):
+        backend = FolderBackend(self.dir)
+        for name, size, mtime in (("b", 3, 300), ("a", 1, 100), ("c", 2, 200)):
+            backend.write(name, "x" * size, mtime=mtime)
+        index = NoteIndex(backend)
+        index.apply_scan(index.scan())
+        self.assertEqual(index.order, ["a", "b", "c"])
+
+        backend.write("a", "x" * 5, mtime=400)
+        index.apply_stats(index.stat_notes(["a"]))
+        index.set_sort_mode(SORT_MODIFIED)
+        self.assertEqual(index.order, ["a", "b", "c"])
+        index.set_sort_mode(SORT_SIZE)
+        self.assertEqual(index.order, ["a", "b", "c"])
+        index.set_sort_mode(SORT_CREATED)
+        self.assertEqual(index.order, ["b", "c", "a"])
+        self.assertEqual(index.position("a"), 2)
+        self.assertEqual(index.neighbour("a", 1), "a")
+        self.assertEqual(index.neighbour("b", 1), "c")
+
+        index.set_sort_mode(SORT_MODIFIED)
+        backend.write("c", "x", mtime=500)
+        index.apply_stats(index.stat_notes(["c"]))
+        self.assertEqual(index.order, ["c", "a", "b"])
+        self.assertEqual([index.position(name) for name in "abc"], [1, 2, 0])
+        index.set_sort_mode(SORT_NAME)
+        self.assertEqual(index.order, ["a", "b", "c"])
+
+
+class NameIndexTest(unittest.TestCase):
+    def test_ranking(self):
+        index = NameIndex()
+        index.sync({"meeting notes": (1, 300), "notes/meeting": (1, 200), "team meetings": (1, 100),
+                    "mountain trip": (1, 400)})
+        self.assertEqual(index.search("meeting"), ["meeting notes", "notes/meeting", "team meetings"])
+        self.assertEqual(index.search("mtrip"), ["mountain trip"])
+        self.assertEqual(index.search(""), ["mountain trip", "meeting notes", "notes/meeting", "team meetings"])
+
+        index.sync({"meeting notes": (1, 300), "team meetings": (1, 500)})
+        self.assertEqual(index.search("meet"), ["meeting notes", "team meetings"])
+        self.assertEqual(index.search("", limit=1), ["team meetings"])
+
+
+if __name__ == '__main__':
+    unittest.main()